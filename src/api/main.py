@@ -0,0 +1,258 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Small async http service that serves the page outputs (e.g.
+# pages/eoc-dashboard-correlation-matrix-30day.csv) to the react and dash front
+# ends as csv or json. Keeps an in-memory copy of each file that is invalidated
+# when the underlying blob generation changes, supports etag / if-none-match,
+# gzip, and column / date range slicing so the front end only fetches what it
+# renders.
+#
+# Example: GET /pages/eoc-dashboard-stablecoins-price-time-history.csv?columns=tether-price&start=2022-01-01&format=json
+#          GET /performance?assets=bitcoin,ethereum&start=2022-01-01&end=2022-06-30
+###############################################################################
+import io
+import os
+import sys
+import gzip
+import time
+import hashlib
+import asyncio
+import collections
+import numpy as np
+import pandas as pd
+
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))    # enable imports from src directory
+from utils.storage import get_storage, decode_bytes
+from utils.performance import rebase, default_base
+
+
+# CONFIG
+cloud_file_path = 'pages'
+date_column = 'date'
+performance_file_name = 'eoc-dashboard-time-history-comparison-log-returns.csv'    # written by compare_time_history
+revalidate_seconds = 5    # how long a cached file is trusted before its generation is checked again
+max_cached_responses = 512    # rendered (sliced / formatted) responses kept per process
+min_gzip_bytes = 1024    # don't bother compressing tiny responses
+host = '0.0.0.0'
+port = int(os.environ.get('PORT', 8080))
+
+
+# CACHE
+class PageCache:
+    """ In-memory copy of the page files. Each file is parsed once per blob generation,
+    and every distinct slice / format requested from it is rendered once and reused
+    until the generation changes. """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.files = {}    # path -> {'generation', 'checked', 'df'}
+        self.responses = collections.OrderedDict()    # (path, generation, query) -> rendered response
+        self.locks = collections.defaultdict(asyncio.Lock)
+
+    async def get_file(self, path):
+        """ Returns the cache entry for the input path, (re)loading it if the blob has
+        changed. Raises FileNotFoundError if the blob does not exist. """
+
+        entry = self.files.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry['checked'] < revalidate_seconds:    # fast path, no storage round trip
+            return entry
+
+        async with self.locks[path]:    # only one request per file goes to storage
+            entry = self.files.get(path)
+            if entry is not None and time.monotonic() - entry['checked'] < revalidate_seconds:
+                return entry
+
+            generation = await asyncio.to_thread(self.storage.generation, path)
+            if generation is None:
+                self.files.pop(path, None)
+                raise FileNotFoundError(path)
+
+            if entry is None or entry['generation'] != generation:
+                raw = await asyncio.to_thread(self.storage.read_bytes, path)
+                df = pd.read_csv(io.BytesIO(decode_bytes(raw, path)))    # outputs may be stored gzip encoded
+                if date_column in df.columns:
+                    df[date_column] = df[date_column].astype(str)    # iso strings sort and compare like dates
+                entry = {'generation': generation, 'df': df}
+                self.files[path] = entry
+
+            entry['checked'] = time.monotonic()
+            return entry
+
+    def get_response(self, key):
+        response = self.responses.get(key)
+        if response is not None:
+            self.responses.move_to_end(key)
+        return response
+
+    def put_response(self, key, response):
+        self.responses[key] = response
+        if len(self.responses) > max_cached_responses:
+            self.responses.popitem(last=False)    # evict least recently used
+
+
+# FUNCTIONS
+def _slice_frame(df, columns, start, end):
+    """ Returns the subset of the input frame for the requested columns and
+    date range (inclusive). """
+
+    if start is not None or end is not None:
+        if date_column not in df.columns:
+            raise web.HTTPBadRequest(text='start / end requires a ' + date_column + ' column')
+        dates = df[date_column].values
+        if df[date_column].is_monotonic_increasing:    # page outputs are written in date order
+            lo = 0 if start is None else np.searchsorted(dates, start, side='left')
+            hi = len(dates) if end is None else np.searchsorted(dates, end, side='right')
+            df = df.iloc[lo:hi]
+        else:
+            mask = np.ones(len(df), dtype=bool)
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+            df = df[mask]
+
+    if columns is not None:
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise web.HTTPBadRequest(text='unknown columns: ' + ','.join(missing))
+        if date_column in df.columns and date_column not in columns:
+            columns = [date_column] + columns    # always keep the x axis
+        df = df[columns]
+
+    return df
+
+
+def _render(df, fmt):
+    """ Serializes the input frame as csv or compact (split orient) json. """
+
+    if fmt == 'json':
+        return df.to_json(orient='split', index=False).encode('utf-8'), 'application/json'
+    return df.to_csv(index=False).encode('utf-8'), 'text/csv'
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip().replace('W/', '') for tag in if_none_match.split(',')]
+    return etag in candidates
+
+
+def _requested_format(request):
+    fmt = request.query.get('format')
+    if fmt is None:
+        fmt = 'json' if 'application/json' in request.headers.get('Accept', '') else 'csv'
+    if fmt not in ('csv', 'json'):
+        raise web.HTTPBadRequest(text='format must be csv or json')
+    return fmt
+
+
+def _respond(request, cache, key, generation, render):
+    """ Returns the response for the cache key, rendering it with render() (which returns
+    body, content_type) only the first time it is requested for the current generation. """
+
+    response = cache.get_response(key)
+    if response is None:
+        body, content_type = render()
+        etag = '"{}-{}"'.format(generation, hashlib.md5(repr(key[2:]).encode('utf-8')).hexdigest()[:12])
+        response = {'body': body, 'gzip_body': None, 'content_type': content_type, 'etag': etag}
+        cache.put_response(key, response)
+
+    headers = {
+        'ETag': response['etag'],
+        'Cache-Control': 'public, max-age={}'.format(revalidate_seconds),
+        'Vary': 'Accept-Encoding',
+    }
+    if _etag_matches(request.headers.get('If-None-Match'), response['etag']):
+        return web.Response(status=304, headers=headers)
+
+    body = response['body']
+    if len(body) >= min_gzip_bytes and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        if response['gzip_body'] is None:
+            response['gzip_body'] = gzip.compress(body, compresslevel=6)    # compressed once, served many times
+        body = response['gzip_body']
+        headers['Content-Encoding'] = 'gzip'
+
+    return web.Response(body=body, headers=headers, content_type=response['content_type'])
+
+
+async def handle_page(request):
+    """ GET /pages/{name}. Query params: format (csv / json), columns (comma separated),
+    start and end (YYYY-MM-DD, inclusive). """
+
+    cache = request.app['cache']
+    name = request.match_info['name']
+    if not name.endswith('.csv'):
+        name = name + '.csv'
+    path = cloud_file_path + '/' + name
+
+    query = request.query
+    fmt = _requested_format(request)
+    columns = query['columns'].split(',') if query.get('columns') else None
+    start = query.get('start')
+    end = query.get('end')
+
+    try:
+        entry = await cache.get_file(path)
+    except FileNotFoundError:
+        raise web.HTTPNotFound(text='no such page output: ' + name)
+
+    key = (path, entry['generation'], fmt, tuple(columns) if columns else None, start, end)
+    return _respond(request, cache, key, entry['generation'], lambda: _render(_slice_frame(entry['df'], columns, start, end), fmt))
+
+
+async def handle_performance(request):
+    """ GET /performance. Rebased performance comparison answered from the cumulative log
+    return panel written by compare_time_history. Query params: assets (comma separated),
+    start (YYYY-MM-DD, the rebase date), end (inclusive, optional), base (default 100),
+    format (csv / json). """
+
+    cache = request.app['cache']
+    query = request.query
+    fmt = _requested_format(request)
+    if not query.get('assets') or not query.get('start'):
+        raise web.HTTPBadRequest(text='assets and start are required')
+    assets = query['assets'].split(',')
+    start = query['start']
+    end = query.get('end')
+    try:
+        base = float(query.get('base', default_base))
+    except ValueError:
+        raise web.HTTPBadRequest(text='base must be a number')
+
+    path = cloud_file_path + '/' + performance_file_name
+    try:
+        entry = await cache.get_file(path)
+    except FileNotFoundError:
+        raise web.HTTPNotFound(text='no such page output: ' + performance_file_name)
+    if 'by_date' not in entry:
+        entry['by_date'] = entry['df'].set_index(date_column)    # once per generation
+    missing = [asset for asset in assets if asset not in entry['by_date'].columns]
+    if missing:
+        raise web.HTTPBadRequest(text='unknown assets: ' + ','.join(missing))
+
+    key = (path, entry['generation'], 'performance', fmt, tuple(assets), start, end, base)
+    return _respond(request, cache, key, entry['generation'], lambda: _render(rebase(entry['by_date'], assets, start, end, base).reset_index(), fmt))
+
+
+def create_app(storage=None):
+    """ Builds the aiohttp application. Uses the storage backend selected by the
+    environment (see utils/storage.py) unless one is passed in. """
+
+    app = web.Application()
+    app['cache'] = PageCache(storage if storage is not None else get_storage())
+    app.router.add_get('/pages/{name}', handle_page)
+    app.router.add_get('/performance', handle_performance)
+    return app
+
+
+# ENTRY POINT
+if __name__ == '__main__':
+    web.run_app(create_app(), host=host, port=port)
@@ -0,0 +1,155 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Benchmarks for the engine. Currently reports cold-start import
+# cost: every entry module is imported in a fresh interpreter with
+# `python -X importtime`, and the total time, the most expensive modules, and
+# whether any of the heavy google drive / secret manager stacks were loaded at
+# import time are logged (and optionally saved and compared to a baseline) so
+# cold-start regressions are visible.
+#
+# Usage: python src/benchmarks/main.py [--output report.json] [--baseline report.json]
+###############################################################################
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))    # enable imports from src directory
+from utils.instrumentation import log_event
+
+
+# CONFIG
+src_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+entry_module_list = [
+    'data/coingecko/main.py',
+    'data/financialmodelingprep/main.py',
+    'data/quality/main.py',
+    'pages/anomalies/main.py',
+    'pages/ath/main.py',
+    'pages/compare_time_history/main.py',
+    'pages/correlation/main.py',
+    'pages/risk/main.py',
+    'pages/stablecoins/main.py',
+    'pages/baskets/main.py',
+    'pages/refresh/main.py',
+    'api/main.py',
+]
+deferred_module_list = [    # should only ever be imported on the code paths that use them
+    'pydrive',
+    'oauth2client',
+    'google.cloud.secretmanager',
+    'google.cloud.storage',
+    'xlsxwriter',
+]
+top_n = 10    # most expensive modules kept per entry module
+regression_ratio = 1.2    # flag entry modules that got this much slower than the baseline...
+regression_min_ms = 50    # ...and by at least this much (import times are noisy)
+repeats = 3    # cold imports per module, the fastest is reported
+
+
+# FUNCTIONS
+def _parse_importtime(stderr):
+    """ Parses `-X importtime` output into a list of (module, self_us, cumulative_us, depth). """
+
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def import_time_report(module_path):
+    """ Imports the entry module (path relative to src) in a fresh interpreter and returns a
+    dict with its total import time, the most expensive modules (self and cumulative), and
+    which deferred modules got imported. """
+
+    full_path = os.path.abspath(os.path.join(src_directory, module_path))
+    code = (
+        'import sys, time, importlib.util\n'
+        'sys.path.insert(0, {directory!r})\n'
+        'start = time.perf_counter()\n'
+        'spec = importlib.util.spec_from_file_location("bench_entry", {path!r})\n'
+        'spec.loader.exec_module(importlib.util.module_from_spec(spec))\n'
+        'print(round((time.perf_counter() - start) * 1000, 3))\n'
+    ).format(directory=os.path.dirname(full_path), path=full_path)
+
+    env = dict(os.environ, EOC_STORAGE_BACKEND=os.environ.get('EOC_STORAGE_BACKEND', 'memory'))    # never talk to gcs from a benchmark
+    best = None
+    for attempt in range(repeats):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env, cwd=os.path.dirname(full_path))
+        if result.returncode != 0:
+            return {'module': module_path, 'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'exit code {}'.format(result.returncode)}
+        wall_ms = float(result.stdout.strip().splitlines()[-1])
+        if best is None or wall_ms < best[0]:
+            best = (wall_ms, _parse_importtime(result.stderr))
+
+    wall_ms, modules = best
+    by_self = sorted(modules, key=lambda m: m[1], reverse=True)[:top_n]
+    top_level = sorted([m for m in modules if m[3] == 0], key=lambda m: m[2], reverse=True)[:top_n]
+    imported = set(m[0] for m in modules)
+    return {
+        'module': module_path,
+        'wall_ms': wall_ms,
+        'import_ms': round(sum(m[2] for m in modules if m[3] == 0) / 1000, 3),
+        'modules_imported': len(modules),
+        'top_self_ms': [[m[0], round(m[1] / 1000, 3)] for m in by_self],
+        'top_cumulative_ms': [[m[0], round(m[2] / 1000, 3)] for m in top_level],
+        'deferred_loaded': [name for name in deferred_module_list if name in imported],
+    }
+
+
+def compare_to_baseline(report_list, baseline_list):
+    """ Adds baseline_ms / change to each report and returns the modules that regressed. """
+
+    baseline = {report['module']: report for report in baseline_list if 'wall_ms' in report}
+    regressions = []
+    for report in report_list:
+        if 'wall_ms' not in report or report['module'] not in baseline:
+            continue
+        report['baseline_ms'] = baseline[report['module']]['wall_ms']
+        report['change'] = round(report['wall_ms'] / max(report['baseline_ms'], 1e-3), 3)
+        slower = report['change'] > regression_ratio and report['wall_ms'] - report['baseline_ms'] > regression_min_ms
+        if slower or len(report['deferred_loaded']) > len(baseline[report['module']]['deferred_loaded']):
+            regressions.append(report['module'])
+    return regressions
+
+
+def run_benchmarks(output=None, baseline=None):
+    """ Runs the import time report for every entry module, logs it, and optionally saves it
+    and compares it to a previously saved report. Returns the list of reports. """
+
+    report_list = []
+    for module_path in entry_module_list:
+        report = import_time_report(module_path)
+        report_list.append(report)
+        if 'error' in report:
+            log_event('import time benchmark failed', severity='WARNING', benchmark='import_time', **report)
+        else:
+            log_event('import time', benchmark='import_time', **report)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare_to_baseline(report_list, json.load(f))
+        log_event('import time regressions' if regressions else 'no import time regressions', severity='WARNING' if regressions else 'INFO', benchmark='import_time', regressions=regressions)
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(report_list, f, indent=2)
+
+    return report_list
+
+
+# ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='EOC dashboard engine benchmarks')
+    parser.add_argument('--output', help='save the report as json')
+    parser.add_argument('--baseline', help='previously saved report to compare against')
+    args = parser.parse_args()
+    run_benchmarks(output=args.output, baseline=args.baseline)
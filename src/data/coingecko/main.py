@@ -4,21 +4,23 @@
 # AUTHOR: Matt Hartigan
 # DATE CREATED: 7-Jun-2022
 # DESCRIPTION: Pull API data from coingecko.com. Designed to be used as a google
-# cloud function.
+# cloud function. coingecko_coin_history_daily pulls the full daily history of
+# each coin, coingecko_markets_snapshot pulls the current values of all coins
+# at once for the latest value outputs (see utils/snapshot.py).
 # COPYRIGHT: Powered by CoinGecko API (https://www.coingecko.com/)
 # TERMS OF USE: https://www.coingecko.com/en/api_terms#:~:text=and%2For%20products.-,Pursuant%20to%20the%20provisions%20of%20this%20API%20Terms%2C%20CoinGecko%20hereby,as%20well%20as%20to%20integrate
 ###############################################################################
 import os
 import sys
-import json
-import time
 import datetime
-import requests
 import pandas as pd 
-sys.path.append('../')    # enable imports from parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
 
-from google.cloud import storage
-from google.cloud import secretmanager
+from utils import http_cache
+from utils.instrumentation import entry_point, span, log_event, summarize_frame
+from utils.streaming_json import decode_pair_arrays, join_pair_arrays
+from utils.storage import get_storage, encode_csv, content_encoding_header
+from utils.run_manifest import RunManifest, content_hash
 
 
 # CREDENTIALS
@@ -32,6 +34,23 @@ base_file_name = 'coingecko_coin_history_24h_'
 vs_currency = 'usd'
 days = 'max'
 interval = 'daily'
+chunk_size = 64 * 1024    # bytes decoded at a time when streaming responses
+series_columns = {
+    'prices': 'price(usd)',
+    'market_caps': 'market_cap(usd)',
+    'total_volumes': 'volume(usd)',
+}
+snapshot_cloud_path = 'data/coin_snapshots/coingecko_markets_snapshot.csv'
+markets_per_page = 250    # most coins coingecko returns per /coins/markets page
+snapshot_columns = {
+    'current_price': 'price(usd)',
+    'market_cap': 'market_cap(usd)',
+    'total_volume': 'volume(usd)',
+    'circulating_supply': 'supply',
+    'ath': 'ath(usd)',
+    'ath_date': 'ath_utc',
+    'last_updated': 'utc',
+}
 coin_list = [
     'bitcoin',
     'ethereum',
@@ -66,47 +85,112 @@ coin_list = [
 
 
 # FUNCTIONS
+class _CountedChunks:
+    """ Wraps a chunk iterator and counts the bytes that pass through it. """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.bytes += len(chunk)
+            yield chunk
+
+
+def _expected_points():
+    """ Estimates the number of points per series so the decode arrays are allocated once. """
+
+    if days == 'max':
+        return (datetime.date.today() - datetime.date(2013, 4, 28)).days + 2    # coingecko history starts 28-Apr-2013
+    return int(days) * (1 if interval == 'daily' else 24) + 2
+
+
+@entry_point('coingecko_coin_history_daily')
 def coingecko_coin_history_daily(event, context):
 # def coingecko_coin_history_daily():    # FIXME: dev only
     """ Pulls daily OHLC data for the input list of coins. """
 
-    # Run through each coin in list
-    for coin in coin_list:
+    storage = get_storage()
+    manifest = RunManifest(storage, 'coingecko_coin_history_daily', coin_list)    # resumes today's run if one was interrupted
 
-        # Pull data
-        print('Pulling data for ' + coin + '...')
-        try:
-            url = 'https://api.coingecko.com/api/v3/coins/' + coin + '/market_chart?vs_currency=' + vs_currency + '&days=' + days + '&interval=' + interval
-            res = requests.get(url).json()
-        except Exception as e:
-            print('Error during coingecko api pull for ' + coin)
-            print(e)
+    # Run through each coin in the list that still needs doing
+    for coin in manifest.claimed_assets():
 
-        # Parse data
         try:
-            print('Parsing data for ' + coin + '...')
-            print(res)
-            price_df = pd.DataFrame.from_records(res['prices'], columns=['unix', 'price(usd)'])
-            mc_df = pd.DataFrame.from_records(res['market_caps'], columns=['unix', 'market_cap(usd)'])
-            vol_df = pd.DataFrame.from_records(res['total_volumes'], columns=['unix', 'volume(usd)'])
-            merged_df = pd.concat([price_df.set_index('unix'), mc_df.set_index('unix'), vol_df.set_index('unix')], axis=1, join='inner').reset_index()
-            merged_df['utc'] = merged_df['unix'].apply(lambda x: datetime.datetime.utcfromtimestamp(x/1000).strftime('%Y-%m-%d %H:%M:%S'))    # utc time
+            # Pull data (decoded as it streams in, straight into numpy arrays)
+            with span('fetch', asset=coin) as s:
+                url = 'https://api.coingecko.com/api/v3/coins/' + coin + '/market_chart?vs_currency=' + vs_currency + '&days=' + days + '&interval=' + interval
+                response = http_cache.get(url, stream=True)    # goes through the on-disk cache when EOC_HTTP_CACHE is set
+                response.raise_for_status()
+                chunks = _CountedChunks(response.iter_content(chunk_size=chunk_size))
+                arrays = decode_pair_arrays(chunks, keys=list(series_columns.keys()), capacity=_expected_points())
+                s.record(bytes=chunks.bytes, http_status=response.status_code, points=len(arrays['prices'][0]))
+
+            # Parse data
+            with span('transform', asset=coin) as s:
+                merged_df = join_pair_arrays(arrays, series_columns)    # joined by position when timestamps line up
+                merged_df['utc'] = pd.to_datetime(merged_df['unix'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S')    # utc time
+                s.record(rows=len(merged_df))
+                if len(merged_df) == 0:
+                    raise ValueError('No data returned for ' + coin)
 
             # Save data to cloud
-            print('Saving data for ' + coin + '...')
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            file_name = base_file_name + coin + '.csv'
-            temp_file = '/tmp/' + file_name
-            merged_df.to_csv(temp_file, index=False)
-            blob = bucket.blob(os.path.join(output_cloud_directory, file_name))
-            blob.upload_from_filename(temp_file)
-
-            print(merged_df)
-
-        except Exception as e:
-            print('Error during coingecko parsing of: ' + coin)
-            print(e)
+            with span('upload', asset=coin) as s:
+                data = encode_csv(merged_df, index=False)    # compressed while it is serialized
+                storage.write_bytes(output_cloud_directory + '/' + base_file_name + coin + '.csv', data, content_type='text/csv', content_encoding=content_encoding_header())
+                s.record(rows=len(merged_df), bytes=len(data), summary=summarize_frame(merged_df))
+
+            manifest.complete(coin, last_timestamp=int(merged_df['unix'].iloc[-1]), content_hash=content_hash(data), rows=len(merged_df))
+
+        except Exception as e:    # a failed coin never falls through to the next step with stale data
+            log_event('Error during coingecko pull / parsing of: ' + coin, severity='ERROR', asset=coin, error=repr(e))
+            manifest.fail(coin, repr(e))
+
+
+@entry_point('coingecko_markets_snapshot')
+def coingecko_markets_snapshot(event, context):
+# def coingecko_markets_snapshot():    # FIXME: dev only
+    """ Pulls the current price, market cap, volume and ath of every coin in the list through
+    the bulk markets endpoint (one page per markets_per_page coins) and stores them as a single
+    snapshot file. """
+
+    storage = get_storage()
+
+    # Pull data, a page at a time until a short page
+    record_list = []
+    page = 1
+    while True:
+        with span('fetch', page=page) as s:
+            url = 'https://api.coingecko.com/api/v3/coins/markets'
+            response = http_cache.get(url, params={'vs_currency': vs_currency, 'ids': ','.join(coin_list), 'per_page': markets_per_page, 'page': page})
+            response.raise_for_status()
+            records = response.json()
+            s.record(bytes=len(response.content), http_status=response.status_code, coins=len(records))
+        record_list.extend(records)
+        if len(records) < markets_per_page:
+            break
+        page = page + 1
+
+    # Parse data
+    with span('transform', coins=len(record_list)) as s:
+        df = pd.DataFrame(record_list)
+        if len(df) == 0:
+            raise ValueError('No market data returned by coingecko')
+        df = df[['id'] + list(snapshot_columns.keys())].rename(columns=dict(snapshot_columns, id='coin'))
+        for column in ['utc', 'ath_utc']:
+            df[column] = pd.to_datetime(df[column], utc=True).dt.strftime('%Y-%m-%d %H:%M:%S')    # utc time, same format as the histories
+        df = df.set_index('coin').reindex([coin for coin in coin_list if coin in set(df['coin'])]).reset_index()    # config order
+        missing_list = [coin for coin in coin_list if coin not in set(df['coin'])]
+        if missing_list:
+            log_event('Coins missing from the coingecko markets snapshot', severity='WARNING', assets=missing_list)
+        s.record(rows=len(df))
+
+    # Save data to cloud
+    with span('upload') as s:
+        data = encode_csv(df, index=False)
+        storage.write_bytes(snapshot_cloud_path, data, content_type='text/csv', content_encoding=content_encoding_header())
+        s.record(rows=len(df), bytes=len(data), summary=summarize_frame(df))
 
 
 # Local testing entry point
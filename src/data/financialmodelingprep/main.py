@@ -10,31 +10,31 @@
 ###############################################################################
 import os
 import sys
-import json
-import time
 import datetime
-import requests
+import collections
 import pandas as pd 
-sys.path.append('../')    # enable imports from parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
 
-from google.cloud import storage
-from google.cloud import secretmanager
+from utils import http_cache
+from utils.instrumentation import entry_point, span, log_event, summarize_frame, summarize_payload
+from utils.storage import get_storage, read_csv, encode_csv, content_encoding_header
+from utils.run_manifest import RunManifest, content_hash
+from utils.credentials import get_secret
 
 
 # CREDENTIALS
 # os.environ["GOOGLE_APPLICATION_CREDENTIALS"]="credentials.json"    # FIXME: dev only
-client = secretmanager.SecretManagerServiceClient()    # get authentication info
-project_id = "eoc-dashboard-352623"
-FINANCIAL_MODELING_PREP_API_KEY = 'FINANCIAL_MODELING_PREP_API_KEY'
-fmp_api_key = client.access_secret_version({"name": f"projects/{project_id}/secrets/{FINANCIAL_MODELING_PREP_API_KEY}/versions/latest"}).payload.data.decode('UTF-8')
+FINANCIAL_MODELING_PREP_API_KEY = 'FINANCIAL_MODELING_PREP_API_KEY'    # secret name, fetched from secret manager on first request
 
 
 # CONFIG
 bucket_name = 'eoc-dashboard-bucket'
 output_cloud_directory = 'data/stock_histories'
 base_file_name = 'fmp_stock_history_24h_'
-date_from = '2012-01-01'
-date_to = datetime.date.today().strftime("%Y-%m-%d")
+date_from = '2012-01-01'    # start of the window for stocks with no stored history yet
+date_to = None    # None = today (evaluated per run so warm instances don't go stale)
+batch_size = 5    # fmp accepts up to 5 comma separated symbols per historical-price-full request
+incremental = True    # only fetch dates after the last stored date for each stock
 stock_list = [
     'AAPL',
     'AMZN',
@@ -50,51 +50,106 @@ stock_list = [
     'DX-Y.NYB',
     'ZGUSD',
     'CLUSD',
-    'NGUSD'
+    'NGUSD',
+    'EURUSD',    # quote currency references (see utils/quote_currency.py)
+    'GBPUSD',
 ]
 
 
 # FUNCTIONS
-def fmp_stock_history_daily(event, context):
-# def fmp_stock_history_daily():    # FIXME: dev only
-    """ Pulls daily OHLC data for the input list of stocks. """
-
-    # Run through each coin in list
-    for stock in stock_list:
-
-        # Pull data
-        print('Pulling data for ' + stock + '...')
-        try:
-            url = 'https://financialmodelingprep.com/api/v3/historical-price-full/' + stock + '?apikey=' + fmp_api_key
-            res = requests.get(url).json()
-            
-        except Exception as e:
-            print('Error during financial modeling prep api pull for ' + stock)
-            print(e)
-
-        try:
-            # Parse data
-            print('Parsing data for ' + stock + '...')
-            df = pd.DataFrame(res['historical'])
-            df = df.sort_values(by=['date'], ascending=True)
-            df = df.reset_index(drop=True)
-            print(df)
-
-            # Save data to cloud
-            print('Saving data for ' + stock + '...')
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            file_name = base_file_name + stock + '.csv'
-            temp_file = '/tmp/' + file_name
-            df.to_csv(temp_file, index=False)
-            blob = bucket.blob(os.path.join(output_cloud_directory, file_name))
-            blob.upload_from_filename(temp_file)
-
-        except Exception as e:
-            print('Error during financial modeling prep parsing of:  ' + stock)
-            print(e)
+def _load_stored_history(storage, stock):
+    """ Returns the previously stored history for the input stock as a data frame, or
+    None if there isn't one yet. """
+
+    try:
+        return read_csv(output_cloud_directory + '/' + base_file_name + stock + '.csv', storage=storage)
+    except FileNotFoundError:
+        return None
+
+
+def _fetch_histories(symbols, start, end):
+    """ Pulls the daily history between the input dates (inclusive) for up to batch_size
+    symbols in a single request. Returns a dict of symbol -> list of daily records. """
 
+    url = 'https://financialmodelingprep.com/api/v3/historical-price-full/' + ','.join(symbols)
+    with span('fetch', assets=symbols, date_from=start, date_to=end) as s:
+        response = http_cache.get(url, params={'from': start, 'to': end, 'apikey': get_secret(FINANCIAL_MODELING_PREP_API_KEY)})    # params handles escaping of ^ and , in symbols (apikey is stripped from cache keys)
+        response.raise_for_status()
+        s.record(bytes=len(response.content), http_status=response.status_code)
 
+    with span('parse', assets=symbols) as s:
+        res = response.json()
+        s.record(payload=summarize_payload(res))
+        if 'historicalStockList' in res:    # multi symbol form
+            histories = {item['symbol']: item.get('historical', []) for item in res['historicalStockList']}
+        elif 'symbol' in res:    # single symbol form
+            histories = {res['symbol']: res.get('historical', [])}
+        else:    # fmp returns {} when there is no data in the window
+            histories = {}
+
+    return histories
+
+
+@entry_point('fmp_stock_history_daily')
+def fmp_stock_history_daily(event, context):
+# def fmp_stock_history_daily():    # FIXME: dev only
+    """ Pulls daily OHLC data for the input list of stocks. Stocks are requested in batches
+    of batch_size, and only for the dates after their last stored date when incremental. """
+
+    storage = get_storage()
+    end = date_to if date_to is not None else datetime.date.today().strftime("%Y-%m-%d")
+    manifest = RunManifest(storage, 'fmp_stock_history_daily', stock_list)    # resumes today's run if one was interrupted
+
+    # Claim stocks that still need doing, batch_size at a time
+    for claimed in manifest.claimed_assets(batch_size=batch_size):
+
+        # Work out the window needed for each stock
+        stored_dict = {}
+        start_dict = collections.defaultdict(list)    # start date -> stocks that need data from that date
+        for stock in claimed:
+            stored_df = _load_stored_history(storage, stock) if incremental else None
+            if stored_df is not None and len(stored_df) > 0:
+                stored_dict[stock] = stored_df
+                start_dict[str(stored_df['date'].max())].append(stock)    # refetch the last stored day in case it was partial
+            else:
+                start_dict[date_from].append(stock)
+
+        # Pull data for stocks that share a window in one request
+        for start, batch in start_dict.items():
+
+            try:
+                histories = _fetch_histories(batch, start, end)
+            except Exception as e:
+                log_event('Error during financial modeling prep api pull for ' + ','.join(batch), severity='ERROR', assets=batch, error=repr(e))
+                for stock in batch:
+                    manifest.fail(stock, repr(e))
+                continue
+
+            for stock in batch:
+                try:
+                    # Parse data
+                    with span('transform', asset=stock) as s:
+                        df = pd.DataFrame(histories.get(stock, []))
+                        if stock in stored_dict:
+                            df = pd.concat([stored_dict[stock], df], ignore_index=True)
+                        if len(df) == 0:
+                            raise ValueError('No data returned for ' + stock)
+                        df = df.drop_duplicates(subset=['date'], keep='last')    # newly fetched rows win
+                        df = df.sort_values(by=['date'], ascending=True)
+                        df = df.reset_index(drop=True)
+                        s.record(rows=len(df), new_rows=len(histories.get(stock, [])))
+
+                    # Save data to cloud
+                    with span('upload', asset=stock) as s:
+                        data = encode_csv(df, index=False)    # compressed while it is serialized
+                        storage.write_bytes(output_cloud_directory + '/' + base_file_name + stock + '.csv', data, content_type='text/csv', content_encoding=content_encoding_header())
+                        s.record(rows=len(df), bytes=len(data), summary=summarize_frame(df))
+
+                    manifest.complete(stock, last_timestamp=str(df['date'].iloc[-1]), content_hash=content_hash(data), rows=len(df))
+
+                except Exception as e:
+                    log_event('Error during financial modeling prep parsing of: ' + stock, severity='ERROR', asset=stock, error=repr(e))
+                    manifest.fail(stock, repr(e))
 
 
 # Local testing entry point
@@ -0,0 +1,35 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Validation stage between the collectors and the pages. Checks
+# every coin and stock history written since it was last checked in one
+# vectorized pass (see utils/quality.py) and writes the quality report that
+# the pages use to leave out failing assets. The pages also check anything
+# new themselves, so this stage only moves that work off the page runs.
+###############################################################################
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span
+from utils.storage import get_storage
+from utils.quality import validate_histories, failed_checks
+
+
+@entry_point('validate_histories_daily')
+def validate_histories_daily(event, context):
+# def validate_histories_daily():    # FIXME: dev only
+    """ Checks the quality of every new coin and stock history and updates the report. Pass
+    {'attributes': {'force': '1'}} as the event to recheck every history. """
+
+    force = str(((event or {}).get('attributes') or {}).get('force', '')) == '1'
+    with span('compute', force=force) as s:
+        report = validate_histories(storage=get_storage(), force=force)
+        s.record(sources=len(report['sources']), failing=sum(1 for entry in report['sources'].values() if failed_checks(entry)))
+
+
+# Local testing entry point
+if __name__ == '__main__':
+    validate_histories_daily()
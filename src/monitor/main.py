@@ -0,0 +1,260 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Intraday peg monitor for the stablecoins. The stablecoin page
+# only sees daily closes, so a de-peg that recovers within the day never shows
+# up. This long-running asyncio process polls the current price of every
+# stablecoin every few seconds, keeps a sliding window per coin (bounded ring
+# buffers with O(1) running deviation, min / max, and time outside the band,
+# see utils/sliding_window.py), and raises anomaly events when a coin leaves
+# or returns to its band or spends too long outside it. The per coin status
+# is served as json on GET /peg and written to cloud for the front end.
+#
+# Usage: python src/monitor/main.py [--mock] [--interval 30] [--duration 3600] [--port 8082]
+# (--mock runs against a local simulated feed with injected de-pegs, advancing
+# its own clock by --interval per poll, so --interval 0 replays hours quickly)
+###############################################################################
+import os
+import sys
+import time
+import asyncio
+import argparse
+import datetime
+import collections
+import numpy as np
+import pandas as pd
+
+from aiohttp import web, ClientSession, ClientTimeout
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))    # enable imports from src directory
+from utils.instrumentation import log_event
+from utils.storage import write_csv
+from utils.sliding_window import SlidingWindow
+
+
+# CONFIG
+host = '0.0.0.0'
+port = int(os.environ.get('EOC_MONITOR_PORT', 8082))
+price_url = os.environ.get('EOC_PEG_FEED_URL', 'https://api.coingecko.com/api/v3/simple/price')    # point at a local mock server if needed
+poll_interval_seconds = 30
+request_timeout = 10
+peg = 1.0
+band = 0.005    # allowed deviation from the peg (50 bp)
+recovery_band = 0.004    # a coin outside the band only counts as recovered back inside this, so a price on the edge doesn't flap
+window_seconds = 60 * 60
+max_outside_fraction = 0.25    # share of the window outside the band that raises a sustained de-peg event
+max_step_seconds = 5 * 60    # feed outages only count this long towards the window times
+capacity_headroom = 2    # ring buffer holds this many times the samples one window needs at the poll interval
+output_interval_seconds = 5 * 60
+cloud_file = 'pages/eoc-dashboard-stablecoins-peg-monitor.csv'
+max_recent_events = 200
+stablecoin_list = [
+    'binance-usd',
+    'tether',
+    'usd-coin',
+    'dai',
+    'frax',
+    'true-usd',
+    'paxos-standard',
+]
+
+
+# FEEDS
+class CoingeckoPriceFeed:
+    """ Current usd prices of every coin in one /simple/price request per poll. """
+
+    def __init__(self, coins, url=price_url):
+        self.coins = list(coins)
+        self.url = url
+        self.session = None
+
+    async def fetch(self):
+        """ Returns (time, {coin: price}), coins without a price are left out. """
+
+        if self.session is None:
+            self.session = ClientSession(timeout=ClientTimeout(total=request_timeout))
+        async with self.session.get(self.url, params={'ids': ','.join(self.coins), 'vs_currencies': 'usd'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+        return time.time(), {coin: float(data[coin]['usd']) for coin in self.coins if coin in data and 'usd' in data[coin]}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class MockPriceFeed:
+    """ Local simulated feed for dev and testing: every coin follows a noisy mean reverting
+    walk around the peg, and now and then one coin de-pegs by a few percent and recovers over
+    the following polls. Its clock starts at the current time and advances step_seconds per
+    fetch, so runs are reproducible (given the seed) and can go faster than real time. """
+
+    def __init__(self, coins, step_seconds=poll_interval_seconds, seed=0, noise=0.0005, reversion=0.2, depeg_probability=0.0005, depeg_size=(0.01, 0.05), recovery=0.05):
+        self.coins = list(coins)
+        self.step_seconds = step_seconds
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.reversion = reversion
+        self.depeg_probability = depeg_probability
+        self.depeg_size = depeg_size
+        self.recovery = recovery
+        self.clock = time.time()
+        self.deviation = np.zeros(len(self.coins))    # noise around the peg
+        self.shock = np.zeros(len(self.coins))    # de-peg still recovering
+
+    async def fetch(self):
+        self.clock = self.clock + self.step_seconds
+        self.deviation = (1 - self.reversion) * self.deviation + self.rng.normal(0, self.noise, len(self.coins))
+        self.shock = (1 - self.recovery) * self.shock
+        if self.rng.random() < self.depeg_probability * len(self.coins):
+            self.shock[self.rng.integers(len(self.coins))] = -self.rng.uniform(*self.depeg_size)
+        prices = peg * (1 + self.deviation + self.shock)
+        return self.clock, dict(zip(self.coins, prices.tolist()))
+
+    async def close(self):
+        pass
+
+
+# MONITOR
+class PegMonitor:
+    """ Sliding window and band state of every coin. push() takes one poll of prices and
+    returns the anomaly events it raised. """
+
+    def __init__(self, coins, interval=poll_interval_seconds):
+        capacity = int(np.ceil(window_seconds / max(interval, 1))) * capacity_headroom + 1
+        self.windows = {coin: SlidingWindow(window_seconds, capacity, band_low=peg - band, band_high=peg + band, max_step_seconds=max_step_seconds) for coin in coins}
+        self.state = {coin: {'outside': False, 'sustained': False, 'since': None} for coin in coins}
+        self.events = collections.deque(maxlen=max_recent_events)
+        self.polls = 0
+
+    def _event(self, kind, coin, moment, window, severity='WARNING'):
+        event = {
+            'event': kind,
+            'coin': coin,
+            'utc': datetime.datetime.utcfromtimestamp(moment).isoformat(),
+            'price': round(float(window.last), 6),
+            'deviation': round(float(window.last - peg), 6),
+            'window_min': round(float(window.minimum), 6),
+            'window_max': round(float(window.maximum), 6),
+            'outside_fraction': round(float(window.outside_fraction), 4),
+        }
+        self.events.append(event)
+        log_event('peg ' + kind + ': ' + coin, severity=severity, **{k: v for k, v in event.items() if k != 'event'})
+        return event
+
+    def push(self, moment, prices):
+        """ Adds one poll of prices (coin -> price at the time moment) to the windows. """
+
+        events = []
+        self.polls = self.polls + 1
+        for coin, price in prices.items():
+            window = self.windows.get(coin)
+            if window is None or not np.isfinite(price):
+                continue
+            window.push(moment, price)
+            state = self.state[coin]
+
+            outside = window.outside(price) or (state['outside'] and abs(price - peg) > recovery_band)
+            if outside and not state['outside']:    # left the band
+                state['since'] = moment
+                events.append(self._event('breach', coin, moment, window))
+            elif not outside and state['outside']:    # back inside the band
+                events.append(self._event('recovered', coin, moment, window, severity='INFO'))
+                state['since'] = None
+            state['outside'] = outside
+
+            sustained = window.outside_fraction > max_outside_fraction
+            if sustained and not state['sustained']:
+                events.append(self._event('sustained', coin, moment, window, severity='ERROR'))
+            state['sustained'] = sustained
+
+        return events
+
+    def status(self):
+        """ Returns the current window aggregates and band state of every coin. """
+
+        rows = []
+        for coin, window in self.windows.items():
+            state = self.state[coin]
+            rows.append({
+                'coin': coin,
+                'price': float(window.last),
+                'deviation': float(window.last - peg),
+                'window_mean_deviation': float(window.mean - peg),
+                'window_min': float(window.minimum),
+                'window_max': float(window.maximum),
+                'window_max_abs_deviation': float(max(window.maximum - peg, peg - window.minimum)) if window.size else np.nan,
+                'window_outside_seconds': float(window.outside_seconds_total),
+                'window_outside_fraction': float(window.outside_fraction),
+                'outside_band': state['outside'],
+                'outside_since': datetime.datetime.utcfromtimestamp(state['since']).isoformat() if state['since'] else None,
+                'samples': window.size,
+                'last_utc': datetime.datetime.utcfromtimestamp(window.last_time).isoformat() if window.size else None,
+            })
+        return rows
+
+
+async def handle_peg(request):
+    """ GET /peg -> window status of every coin and the most recent events. """
+
+    monitor = request.app['monitor']
+    status = [{k: (None if isinstance(v, float) and not np.isfinite(v) else v) for k, v in row.items()} for row in monitor.status()]
+    return web.json_response({'band': band, 'window_seconds': window_seconds, 'polls': monitor.polls, 'coins': status, 'events': list(monitor.events)})
+
+
+async def run(feed, monitor, interval=poll_interval_seconds, duration=None, output=True):
+    """ Polls the feed every interval seconds (a failed poll is logged and skipped) until
+    duration seconds of feed time have passed, if given. Writes the status to cloud every
+    output_interval_seconds of feed time. """
+
+    first_moment = None
+    last_output = None
+    while True:
+        started = time.perf_counter()
+        try:
+            moment, prices = await feed.fetch()
+        except Exception as e:
+            log_event('Peg monitor poll failed', severity='ERROR', error=repr(e))
+        else:
+            first_moment = moment if first_moment is None else first_moment
+            monitor.push(moment, prices)
+            if output and (last_output is None or moment - last_output >= output_interval_seconds):
+                last_output = moment
+                df = pd.DataFrame(monitor.status())
+                n_bytes = await asyncio.to_thread(write_csv, df, cloud_file, header=True, index=False)
+                log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+            if duration is not None and moment - first_moment >= duration:
+                return
+        await asyncio.sleep(max(interval - (time.perf_counter() - started), 0))
+
+
+async def main(mock=False, interval=poll_interval_seconds, duration=None, status_port=port):
+    """ Starts the status endpoint and runs the monitor until interrupted (or for duration). """
+
+    feed = MockPriceFeed(stablecoin_list, step_seconds=interval or poll_interval_seconds) if mock else CoingeckoPriceFeed(stablecoin_list)
+    monitor = PegMonitor(stablecoin_list, interval=interval or poll_interval_seconds)
+    app = web.Application()
+    app['monitor'] = monitor
+    app.router.add_get('/peg', handle_peg)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, status_port).start()
+    log_event('Peg monitor started', coins=stablecoin_list, band=band, window_seconds=window_seconds, feed='mock' if mock else feed.url)
+    try:
+        await run(feed, monitor, interval=interval, duration=duration)
+    finally:
+        await feed.close()
+        await runner.cleanup()
+
+
+# ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='EOC dashboard stablecoin peg monitor')
+    parser.add_argument('--mock', action='store_true', help='use the local simulated price feed')
+    parser.add_argument('--interval', type=float, default=poll_interval_seconds, help='seconds between polls (with --mock, 0 runs as fast as possible)')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds of feed time')
+    parser.add_argument('--port', type=int, default=port, help='port for the GET /peg status endpoint')
+    args = parser.parse_args()
+    asyncio.run(main(mock=args.mock, interval=args.interval, duration=args.duration, status_port=args.port))
@@ -24,7 +24,7 @@ config_params = {
         'is_column': False,
         'is_standard_threshold': False,
         'threshold': 0.8,
-        'index': 0,
+        'asset': 'bitcoin',    # row of the transposed input (None for the last row)
         'description': 'triggers when btc > 50% drawdown'
     },
     'ath_drawdown (eth)': {
@@ -33,8 +33,34 @@ config_params = {
         'is_column': False,
         'is_standard_threshold': False,
         'threshold': 0.8,
-        'index': 1,
+        'asset': 'ethereum',
         'description': 'triggers when eth > 50% drawdown'
     },
 }
 
+
+backtest_rules = {    # grid of rules and thresholds evaluated over the full history (see backtest.py)
+    'static': {'thresholds': [0.5, 0.6, 0.7, 0.8, 0.9], 'direction': 'above'},
+    'n_sigma': {'thresholds': [1.5, 2.0, 2.5, 3.0]},
+    'rolling_zscore': {'windows': [30, 90, 365], 'thresholds': [2.0, 2.5, 3.0]},
+}
+
+
+backtest_config = {
+    'ath_drawdown (btc)': {
+        'input_time_history_file_path': 'gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_bitcoin.csv',
+        'date_label': 'utc',
+        'series_label': 'price(usd)',
+        'transform': 'drawdown',
+        'rules': backtest_rules,
+        'description': 'how often btc ath drawdown rules would have fired'
+    },
+    'ath_drawdown (eth)': {
+        'input_time_history_file_path': 'gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_ethereum.csv',
+        'date_label': 'utc',
+        'series_label': 'price(usd)',
+        'transform': 'drawdown',
+        'rules': backtest_rules,
+        'description': 'how often eth ath drawdown rules would have fired'
+    },
+}
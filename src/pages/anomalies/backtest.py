@@ -0,0 +1,150 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: backtest.py
+# DESCRIPTION: Backtests anomaly rules over the full history of a series. Each
+# rule (static threshold, n-sigma, rolling z-score) is compiled into a
+# (days x windows) statistic matrix that is compared against every threshold
+# at once with broadcasting, giving the fire dates, fire rate and time in alert
+# of the whole rule grid without looping over days.
+###############################################################################
+import numpy as np
+import pandas as pd
+
+
+# CONFIG
+days_per_year = 365.25
+
+
+# FUNCTIONS
+def transform_series(series, transform=None):
+    """ Applies the optional config transform to the raw series: 'drawdown' (fraction below
+    the running all time high), 'pct_change' (day over day change), or None. """
+
+    if transform is None:
+        return series
+    if transform == 'drawdown':
+        return 1 - series / series.cummax()
+    if transform == 'pct_change':
+        previous = series.shift(periods=1)
+        return (series - previous) / previous
+    raise ValueError('Unknown transform: ' + transform)
+
+
+def _rolling_mean_std(values, window):
+    """ Returns the trailing mean and (population) standard deviation of the input array for the
+    input window using cumulative sums, O(T) regardless of the window. Null until a full window
+    of values is available. """
+
+    centered = values - np.nanmean(values)    # keeps the running sums of squares well conditioned
+    valid = ~np.isnan(centered)
+    filled = np.where(valid, centered, 0.0)
+    csum = np.concatenate([[0.0], np.cumsum(filled)])
+    csq = np.concatenate([[0.0], np.cumsum(filled ** 2)])
+    count = np.concatenate([[0], np.cumsum(valid)])
+
+    mean = np.full(len(values), np.nan)
+    std = np.full(len(values), np.nan)
+    n = count[window:] - count[:-window]
+    full = n == window
+    window_mean = (csum[window:] - csum[:-window]) / window
+    window_var = np.maximum((csq[window:] - csq[:-window]) / window - window_mean ** 2, 0.0)
+    mean[window - 1:] = np.where(full, window_mean, np.nan)
+    std[window - 1:] = np.where(full, np.sqrt(window_var), np.nan)
+    return mean + np.nanmean(values), std
+
+
+def _expanding_mean_std(values):
+    """ Returns the mean and (population) standard deviation of all values up to and including
+    each day, so the n-sigma rule never looks ahead. """
+
+    centered = values - np.nanmean(values)
+    valid = ~np.isnan(centered)
+    filled = np.where(valid, centered, 0.0)
+    count = np.cumsum(valid)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.cumsum(filled) / count
+        var = np.maximum(np.cumsum(filled ** 2) / count - mean ** 2, 0.0)
+    return mean + np.nanmean(values), np.sqrt(var)
+
+
+def rule_statistic(values, rule, params):
+    """ Compiles a rule into a (days x windows) statistic matrix and the list of windows its
+    columns correspond to. The rule fires on a day when the statistic is above a threshold. """
+
+    if rule == 'static':
+        sign = -1.0 if params.get('direction', 'above') == 'below' else 1.0    # 'below' rules fire under the threshold
+        return sign * values[:, None], [None]
+
+    if rule == 'n_sigma':
+        mean, std = _expanding_mean_std(values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.abs(values - mean) / std)[:, None], [None]
+
+    if rule == 'rolling_zscore':
+        windows = params['windows']
+        stat = np.full((len(values), len(windows)), np.nan)
+        for column, window in enumerate(windows):    # one O(T) pass per window
+            mean, std = _rolling_mean_std(values, window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stat[:, column] = np.abs(values - mean) / std
+        return stat, list(windows)
+
+    raise ValueError('Unknown rule: ' + rule)
+
+
+def backtest_rule(dates, values, rule, params):
+    """ Evaluates every (window, threshold) combination of a rule over the full history.
+    Returns (summary_df, fire_dates_df) where the summary has one row per combination with
+    its fire count (alert onsets), fires per year, and fraction of days in alert, and the fire
+    dates frame lists every onset. """
+
+    stat, windows = rule_statistic(values, rule, params)
+    thresholds = np.asarray(params['thresholds'], dtype=np.float64)
+    sign = -1.0 if rule == 'static' and params.get('direction', 'above') == 'below' else 1.0
+
+    with np.errstate(invalid='ignore'):
+        in_alert = stat[:, :, None] > (sign * thresholds)[None, None, :]    # (days x windows x thresholds), null stats never fire
+    evaluated = (~np.isnan(stat)).sum(axis=0)    # days each window could be evaluated on
+    onsets = in_alert & ~np.concatenate([np.zeros((1,) + in_alert.shape[1:], dtype=bool), in_alert[:-1]])
+
+    fire_count = onsets.sum(axis=0)
+    alert_days = in_alert.sum(axis=0)
+    last_onset = len(values) - 1 - onsets[::-1].argmax(axis=0)    # only meaningful where fire_count > 0
+    years = np.maximum(evaluated, 1)[:, None] / days_per_year
+    window_index, threshold_index = np.meshgrid(np.arange(len(windows)), np.arange(len(thresholds)), indexing='ij')
+
+    summary_df = pd.DataFrame({
+        'rule': rule,
+        'window': [windows[w] for w in window_index.ravel()],
+        'threshold': thresholds[threshold_index.ravel()],
+        'fire_count': fire_count.ravel(),
+        'fires_per_year': (fire_count / years).ravel(),
+        'time_in_alert': (alert_days / np.maximum(evaluated, 1)[:, None]).ravel(),
+        'currently_in_alert': in_alert[-1].ravel(),
+        'last_fire_date': np.where(fire_count > 0, dates[last_onset], None).ravel(),
+    })
+
+    day, window, threshold = np.nonzero(onsets)
+    fire_dates_df = pd.DataFrame({
+        'rule': rule,
+        'window': [windows[w] for w in window],
+        'threshold': thresholds[threshold],
+        'date': dates[day],
+    })
+
+    return summary_df, fire_dates_df
+
+
+def backtest_series(dates, values, rules):
+    """ Runs the backtest for every rule configured for a series (see backtest_config in
+    anomaly_config.py). Returns (summary_df, fire_dates_df) for all of them. """
+
+    summary_list = []
+    fire_dates_list = []
+    for rule, params in rules.items():
+        summary_df, fire_dates_df = backtest_rule(dates, values, rule, params)
+        summary_list.append(summary_df)
+        fire_dates_list.append(fire_dates_df)
+    return pd.concat(summary_list, ignore_index=True), pd.concat(fire_dates_list, ignore_index=True)
@@ -7,34 +7,18 @@
 # automatic emails when certain levels are reached.
 ###############################################################################
 import os
-import shutil
-import itertools
+import sys
 import datetime
 import pandas as pd 
-import numpy as np
-import json
 
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
-from google.cloud import storage
-from google.cloud import secretmanager
-from oauth2client.service_account import ServiceAccountCredentials
-import google.auth
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, read_csv, write_csv
+from utils.lineage import SourceTracker
+from utils.sheets import publish_workbook
 
-from anomaly_config import email_config, config_params
-
-
-# AUTHENTICATE
-SCOPES = ['https://www.googleapis.com/auth/drive']
-gauth = GoogleAuth()    # pydrive library helper class for authenticating
-client = secretmanager.SecretManagerServiceClient()
-secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
-project_id = "eoc-dashboard-352623"
-request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
-response = client.access_secret_version(request)
-credentials_json = json.loads(response.payload.data.decode("UTF-8"))
-gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)   
-drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+from anomaly_config import email_config, config_params, backtest_config
+from backtest import transform_series, backtest_series
 
 
 # CONFIG
@@ -47,44 +31,34 @@ REFERENCE_FILENAME = 'anomaly-sheet'
 
 
 # FUNCTIONS
+@timed('upload')
 def _output_to_cloud(input_dict):
     """ Outputs the input data frame to google cloud. """
 
-    storage_client = storage.Client()    # initialize storage client
-    bucket = storage_client.bucket(bucket_name)
-
     for sheet in input_dict.keys():
 
         # Output to google cloud storage
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
         file_name = 'eoc-dashboard-' + str(sheet) + '.csv'
-        local_file = '/tmp/' + file_name
         cloud_file = cloud_file_path + '/' + file_name
-        input_dict[sheet].to_csv(local_file, header=True, index=False)
-        blob = bucket.blob(cloud_file)
-        blob.upload_from_filename(local_file) 
-        print('updated google cloud file!')
+        n_bytes = write_csv(input_dict[sheet], cloud_file, header=True, index=False)
+        log_event('updated google cloud file!', file=cloud_file, rows=len(input_dict[sheet]), bytes=n_bytes)
 
 
+@timed('upload')
 def _output_to_drive(input_dict):
     """ Outputs the input data frame to google sheets on google drive. """
 
     file_name = 'eoc-dashboard-stablecoin-24h-history.xlsx'    # prep local file
     local_file = '/tmp/' + file_name
-    writer = pd.ExcelWriter(local_file, engine='xlsxwriter')
-    for sheet in list(input_dict.keys()):
-        input_dict[sheet].to_excel(writer, sheet_name=sheet)
+    sheet_dict = dict(input_dict)
+    sheet_dict['last_updated'] = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})    # add last updated sheet
 
-    last_updated_df = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})
-    last_updated_df.to_excel(writer, sheet_name='last_updated')    # add last updated sheet
+    publish_workbook(sheet_dict, local_file, REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)    # only changed ranges unless the layout changed
 
-    writer.save()
 
-    csv = drive.CreateFile({'id': REFERENCE_FILE_ID, 'parents': [{'id': DRIVE_FOLDER_ID}], 'title': REFERENCE_FILENAME, 'mimeType': 'application/vnd.ms-excel'})
-    csv.SetContentFile(local_file)
-    csv.Upload({'convert': True})
-    print('updated google drive file!')
+def _storage_path(file_path):
+    """ Converts a gs://bucket/... config path into a path within the storage backend. """
+    return file_path.replace('gs://' + bucket_name + '/', '')
 
 
 def _send_email_alert(input_dict):
@@ -92,11 +66,19 @@ def _send_email_alert(input_dict):
 
 
 # def generate_anomaly_page(event, context):    # FIXME: for cloud deployment only
+@entry_point('generate_anomaly_page')
 def generate_anomaly_page():
     """
     FIXME: description goes here
     """
 
+    # Skip the run entirely if none of the input files changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'anomalies')
+    source_list = sorted(set(_storage_path(config_params[metric]['input_time_history_file_path']) for metric in config_params.keys()))
+    if not tracker.changed(source_list):
+        log_event('No anomaly inputs changed since the last run, anomaly outputs are up to date.')
+        return
+
     anomaly_cols = ['Metric', 'Threshold', 'Current Level', 'Description']
     anomaly_df = pd.DataFrame(columns=anomaly_cols)    # holds the calculated anomaly status data frame to be output to dash
     counter = 0
@@ -104,21 +86,24 @@ def generate_anomaly_page():
     # Compute anomaly stats for each metric
     for metric in config_params.keys():
 
-        print('Evaluating anomaly status for: ', metric)
-
         # Get raw data
-        if not config_params[metric]['is_column']: 
-            df = pd.read_csv(config_params[metric]['input_time_history_file_path']).transpose(copy=False)    # transpose if necessary
-            header = df.iloc[0]
-            df = df[1:]
-            df.columns = header
-        else:
-            df = pd.read_csv(config_params[metric]['input_time_history_file_path'])   
+        with span('fetch', metric=metric) as s:
+            if not config_params[metric]['is_column']: 
+                df = read_csv(_storage_path(config_params[metric]['input_time_history_file_path'])).transpose(copy=False)    # transpose if necessary
+                header = df.iloc[0]
+                df = df[1:]
+                df.columns = header
+            else:
+                df = read_csv(_storage_path(config_params[metric]['input_time_history_file_path']))   
+            s.record(rows=len(df))
 
         # Get current level
         if not config_params[metric]['is_standard_threshold']:
-            if config_params[metric]['index'] is not None:
-                current_level = df[config_params[metric]['series_label']].iloc[config_params[metric]['index']]
+            if config_params[metric]['asset'] is not None:
+                if config_params[metric]['asset'] not in df.index:    # e.g. left out of the input by the quality gate
+                    log_event('Anomaly input has no row for ' + config_params[metric]['asset'] + ', skipped metric.', severity='WARNING', metric=metric)
+                    continue
+                current_level = df[config_params[metric]['series_label']].loc[config_params[metric]['asset']]
             else:
                 current_level = df[config_params[metric]['series_label']].iloc[len(df)-1]
             threshold = config_params[metric]['threshold']
@@ -132,14 +117,13 @@ def generate_anomaly_page():
         anomaly_df.loc[counter] = row
 
         # Take action(s) based on current level
-        print('Threshold: {} Current: {}'.format(threshold, current_level))
         if config_params[metric]['is_standard_threshold'] and (abs(current_level) > abs(threshold)):
-            print('FIXME: send email, this is an anomaly')
+            log_event('FIXME: send email, this is an anomaly', severity='WARNING', metric=metric, threshold=threshold, current_level=current_level)
         # Output status to dashboard
         elif current_level > threshold:
-            print('FIXME: send email, this is an anomaly')
+            log_event('FIXME: send email, this is an anomaly', severity='WARNING', metric=metric, threshold=threshold, current_level=current_level)
         else:
-            print('Not above threshold, take no action.')
+            log_event('Not above threshold, take no action.', metric=metric, threshold=threshold, current_level=current_level)
 
         # Save result and increment
         counter = counter + 1
@@ -147,11 +131,58 @@ def generate_anomaly_page():
     # Output results
     _output_to_cloud({'anomaly-sheet': anomaly_df})
     _output_to_drive({'anomaly_df': anomaly_df})
+    tracker.commit()
+
+
+@entry_point('generate_anomaly_backtest')
+def generate_anomaly_backtest():
+    """ Backtest mode. Evaluates the grid of rules and thresholds in backtest_config over the
+    full history of each series and outputs how often each one would have fired (fire count,
+    fires per year, time in alert, last fire date) plus every fire date to the cloud. """
+
+    # Skip the run entirely if none of the input files changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'anomalies-backtest')
+    source_list = sorted(set(_storage_path(backtest_config[metric]['input_time_history_file_path']) for metric in backtest_config.keys()))
+    if not tracker.changed(source_list):
+        log_event('No backtest inputs changed since the last run, backtest outputs are up to date.')
+        return
+
+    summary_list = []
+    fire_dates_list = []
+    for metric, params in backtest_config.items():
+
+        # Get raw data
+        with span('fetch', metric=metric) as s:
+            df = read_csv(_storage_path(params['input_time_history_file_path']), usecols=[params['date_label'], params['series_label']])
+            df['date'] = pd.to_datetime(df[params['date_label']]).dt.strftime('%Y-%m-%d')
+            df = df.drop_duplicates(subset=['date'], keep='first')
+            s.record(rows=len(df))
+
+        # Evaluate every rule / threshold over the full history at once
+        with span('compute', metric=metric) as s:
+            series = transform_series(df[params['series_label']].astype(float), params.get('transform'))
+            summary_df, fire_dates_df = backtest_series(df['date'].values, series.values, params['rules'])
+            summary_df.insert(0, 'metric', metric)
+            fire_dates_df.insert(0, 'metric', metric)
+            s.record(rules=len(summary_df), fires=len(fire_dates_df))
+
+        summary_list.append(summary_df)
+        fire_dates_list.append(fire_dates_df)
+
+    # Output results
+    _output_to_cloud({
+        'anomaly-backtest': pd.concat(summary_list, ignore_index=True),
+        'anomaly-backtest-fire-dates': pd.concat(fire_dates_list, ignore_index=True),
+    })
+    tracker.commit()
 
 
 # DEV ENTRY POINT
 if __name__ == '__main__':
-    generate_anomaly_page()
+    if '--backtest' in sys.argv:
+        generate_anomaly_backtest()
+    else:
+        generate_anomaly_page()
 
 
 # TODO:
@@ -4,35 +4,24 @@
 # AUTHOR: Matt Hartigan
 # DATE CREATED: 13-July-2022
 # DESCRIPTION: Pull in data from cloud and generate a list of the percentage 
-# down from all time highs that each coin is (on daily time scale).
+# down from all time highs that each coin is (on daily time scale). The usd
+# current prices come from the intraday market snapshot when it is newer than
+# the daily histories, so the page refreshes without rereading them.
 ###############################################################################
 import os
-import shutil
-import itertools
+import sys
 import datetime
 import pandas as pd 
-import numpy as np
-import json
-
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
-from google.cloud import storage
-from google.cloud import secretmanager
-from oauth2client.service_account import ServiceAccountCredentials
-import google.auth
-
-
-# AUTHENTICATE
-SCOPES = ['https://www.googleapis.com/auth/drive']
-gauth = GoogleAuth()    # pydrive library helper class for authenticating
-client = secretmanager.SecretManagerServiceClient()
-secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
-project_id = "eoc-dashboard-352623"
-request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
-response = client.access_secret_version(request)
-credentials_json = json.loads(response.payload.data.decode("UTF-8"))
-gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)    # FIXME: get this from the json or from the keyfile
-drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, write_csv
+from utils.panel_cache import read_history_columns
+from utils.quote_currency import requested_currencies, reference_paths, load_reference_panel, convert_panel
+from utils.lineage import SourceTracker
+from utils.quality import quality_gate
+from utils.snapshot import snapshot_path, read_snapshot, latest_after
+from utils.sheets import publish_workbook
 
 
 # CONFIG
@@ -44,7 +33,8 @@ file_name_excel = 'eoc-dashboard-crypto-ath-percent-drawdown.xlsx'
 DRIVE_FOLDER_ID = '1w8d5rb2khorGtsUOvQDQmDTx-p-NtGPp'   
 REFERENCE_FILE_ID = '1a19zS8RWsURrXv81MdanRmNg21KS1aiKyux3VSrPVcQ'   
 REFERENCE_FILENAME = 'eoc-dashboard-crypto-ath-percent-drawdown-reference'    
-crypto_path = 'data/coin_histories/coingecko_dailiy_coin_history_'
+quote_currency_list = ['usd', 'eur', 'btc']    # non-usd variants are derived from the usd histories (see utils/quote_currency.py)
+crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
 crypto_list = [
     'bitcoin',
     'ethereum',
@@ -67,6 +57,7 @@ crypto_list = [
 
 
 # FUNCTIONS
+@timed('upload')
 def output_results(df):
     """ Outputs the list of percentage ath drawdowns to 
     google drive sheets file and google cloud csv file. """
@@ -76,72 +67,117 @@ def output_results(df):
     #     os.mkdir(os.path.join(os.getcwd(), 'tmp'))
 
     # Output to google cloud storage
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    local_file = '/tmp/' + file_name
     cloud_file = cloud_file_path + '/' + file_name
-    df.to_csv(local_file, header=True, index=True)
-    blob = bucket.blob(cloud_file)
-    blob.upload_from_filename(local_file) 
-    print('updated google cloud file!')
+    n_bytes = write_csv(df, cloud_file, header=True, index=True)
+    log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
 
     # Output to google sheets
     local_file_excel = '/tmp/' + file_name_excel    # name file path
-    writer = pd.ExcelWriter(local_file_excel, engine='xlsxwriter')
-    df.to_excel(writer, sheet_name='ath_drawdown')
-
-    last_updated_df = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})
-    last_updated_df.to_excel(writer, sheet_name='last_updated')    # add last updated sheet
+    sheet_dict = {'ath_drawdown': df}
+    sheet_dict['last_updated'] = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})    # add last updated sheet
 
-    writer.save()
-
-    csv = drive.CreateFile({'id': REFERENCE_FILE_ID, 'parents': [{'id': DRIVE_FOLDER_ID}], 'title': REFERENCE_FILENAME, 'mimeType': 'application/vnd.ms-excel'})
-    csv.SetContentFile(local_file_excel)
-    csv.Upload({'convert': True})
-    print('updated google drive file!')
+    publish_workbook(sheet_dict, local_file_excel, REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)    # only changed ranges unless the layout changed
 
     # # Tear down temp directory
     # shutil.rmtree(os.path.join(os.getcwd(), 'tmp'))      FIXME: production only
 
 
-def _calculate_percentage_drawdown(df, price_column_label, coin):
+@timed('upload')
+def output_quote_currency_results(df_dict):
+    """ Outputs the ath drawdowns denominated in each non-usd quote currency to google
+    cloud (eoc-dashboard-crypto-ath-percent-drawdown-<currency>.csv). """
+
+    for currency, df in df_dict.items():
+        cloud_file = cloud_file_path + '/' + file_name.replace('.csv', '-' + currency + '.csv')
+        n_bytes = write_csv(df, cloud_file, header=True, index=True)
+        log_event('updated google cloud file!', file=cloud_file, currency=currency, rows=len(df), bytes=n_bytes)
+
+
+def _calculate_percentage_drawdown(df, price_column_label, coin, currency='usd'):
     """ Calculates how far down (in terms of percentage) a coin is down given the
     input time history. """
 
+    prices = df[price_column_label].dropna()
     results_dict = {}
-    results_dict['current_price (usd)'] = df[price_column_label].iloc[-1]
-    results_dict['ath_price (usd)'] = df[price_column_label].max()
-    results_dict['percent_drawdown'] = round(1 - (results_dict['current_price (usd)']/ results_dict['ath_price (usd)']), 3)
+    results_dict['current_price (' + currency + ')'] = prices.iloc[-1]
+    results_dict['ath_price (' + currency + ')'] = prices.max()
+    results_dict['percent_drawdown'] = round(1 - (results_dict['current_price (' + currency + ')']/ results_dict['ath_price (' + currency + ')']), 3)
 
     return results_dict
 
 
+def _apply_snapshot(results_dict, snapshot_row):
+    """ Returns the usd drawdown with the current price taken from the market snapshot. The
+    ath stays the highest daily close (or the snapshot price if higher), not coingecko's
+    intraday ath, so it matches the other quote currencies. """
+
+    current_price = float(snapshot_row['price(usd)'])
+    ath_price = max(results_dict['ath_price (usd)'], current_price)
+    return dict(results_dict, **{'current_price (usd)': current_price, 'ath_price (usd)': ath_price, 'percent_drawdown': round(1 - current_price / ath_price, 3)})
+
+
+def _result_key(crypto, currency):
+    """ Lineage key of a coin's stored result (usd results keep the plain coin name). """
+    return crypto if currency == 'usd' else crypto + '-' + currency
+
+
+@entry_point('generate_ath_page')
 def generate_ath_page(event, context):    # FIXME: for google cloud function deployment
 # def generate_ath_page():
     """ Main run function that is called to calculate and output ath drawdown for each
     coind of interest to a google sheet. """
 
-    # Get coin data
-    coin_dict = {}
-    for crypto in crypto_list:
-        
-        crypto_df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_' + crypto + '.csv')    # download file FIXME: filename
-        
-        crypto_df = crypto_df[['utc', 'price(usd)']]    # only need price and time
-        crypto_df['date'] = pd.to_datetime(crypto_df['utc']).dt.date
-        crypto_df = crypto_df.drop_duplicates(subset=['date'], keep="first")
-
-        crypto_df.drop('utc', axis=1, inplace=True)   # eliminate duplicate columns
-
-        coin_dict[crypto] = crypto_df
-
-    # Calculate aths
-    ath_dict = {}
-    for coin, history in coin_dict.items():
-        ath_dict[coin] = _calculate_percentage_drawdown(history, 'price(usd)', coin)
+    # Skip the run entirely if no coin history (or quote currency reference) changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'ath')
+    source_dict = {crypto: crypto_path + crypto + '.csv' for crypto in crypto_list}
+    passing_list = quality_gate(list(source_dict.values()))
+    source_dict = {crypto: path for crypto, path in source_dict.items() if path in passing_list}    # leave out histories that failed the quality checks
+    currency_list = requested_currencies(event, quote_currency_list)
+    if not tracker.changed(list(source_dict.values()) + reference_paths(currency_list) + [snapshot_path]):
+        log_event('No coin histories or market snapshot changed since the last run, ath outputs are up to date.')
+        return
+
+    # Calculate aths, only for coins (and quote currencies) whose history changed
+    ath_dict = {currency: {} for currency in currency_list}
+    reference_panel = None
+    for crypto in source_dict:
+
+        result_paths = {currency: [source_dict[crypto]] + reference_paths([currency]) for currency in currency_list}
+        for currency in currency_list:
+            ath_dict[currency][crypto] = tracker.asset_result(_result_key(crypto, currency), result_paths[currency])
+        missing_list = [currency for currency in currency_list if ath_dict[currency][crypto] is None]
+        if not missing_list:
+            continue
+
+        with span('fetch', asset=crypto) as s:
+            crypto_df = read_history_columns(source_dict[crypto], {'price(usd)': 'usd'})    # only need price and time (one row per day)
+            s.record(rows=len(crypto_df))
+
+        with span('transform', asset=crypto, currencies=len(missing_list)) as s:
+            if reference_panel is None and missing_list != ['usd']:
+                reference_panel = load_reference_panel(currency_list, tracker.generations(reference_paths(currency_list)))
+            converted_dict = convert_panel(crypto_df, reference_panel, missing_list)    # derived from the usd prices, no extra fetches
+            s.record(rows=len(crypto_df))
+
+        with span('compute', asset=crypto):
+            for currency in missing_list:
+                ath_dict[currency][crypto] = {k: float(v) for k, v in _calculate_percentage_drawdown(converted_dict[currency], 'usd', crypto, currency).items()}
+                if currency == 'usd':
+                    ath_dict[currency][crypto]['date'] = str(crypto_df['usd'].dropna().index[-1].date())    # day of the last close, to tell if the snapshot is newer
+                tracker.set_asset_result(_result_key(crypto, currency), result_paths[currency], ath_dict[currency][crypto])
+
+    # Update current usd prices from the market snapshot where it is newer than the histories (usually intraday)
+    snapshot_df = read_snapshot()
+    for crypto, results_dict in ath_dict['usd'].items():
+        snapshot_row = latest_after(snapshot_df, crypto, results_dict.get('date'))
+        if snapshot_row is not None:
+            ath_dict['usd'][crypto] = _apply_snapshot(results_dict, snapshot_row)
 
     # Output results
-    output_results(pd.DataFrame(ath_dict))
+    output_dict = {currency: pd.DataFrame({crypto: {k: v for k, v in results_dict.items() if k != 'date'} for crypto, results_dict in ath_dict[currency].items()}) for currency in currency_list}
+    output_results(output_dict['usd'])
+    output_quote_currency_results({currency: df for currency, df in output_dict.items() if currency != 'usd'})
+    tracker.commit()
 
 
 if __name__ == '__main__':
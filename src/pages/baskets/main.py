@@ -0,0 +1,138 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Pulls in the price and market cap histories of every coin used
+# by the baskets defined in utils/baskets.py (total stablecoin, defi, layer 1,
+# ...), computes all basket index levels and market caps in one pass, and
+# outputs them to cloud for the front end. Index levels are extended
+# incrementally from the state saved by the previous run, so a daily run only
+# computes the new days (set EOC_FORCE_RECOMPUTE=1 to rebuild from scratch).
+###############################################################################
+import os
+import sys
+import json
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, read_csv, write_csv
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+from utils.baskets import basket_dict, basket_members, basket_market_caps, compute_baskets, config_hash
+from utils.lineage import SourceTracker, lineage_directory, force_recompute
+from utils.quality import quality_gate
+
+
+# CONFIG
+cloud_file_path = 'pages'
+levels_file_name = 'eoc-dashboard-baskets-levels.csv'
+market_cap_file_name = 'eoc-dashboard-baskets-market-cap.csv'
+weights_file_name = 'eoc-dashboard-baskets-weights.csv'
+state_path = lineage_directory + '/baskets-state.json'    # last levels and units held, for incremental updates
+crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
+
+
+# FUNCTIONS
+@timed('upload')
+def output_results(levels_df, market_cap_df, weights_df):
+    """ Outputs the basket levels and market caps (date column first, one column per basket)
+    and the current basket weights (one row per basket) to google cloud csv files. """
+
+    output_dict = {levels_file_name: (levels_df, False), market_cap_file_name: (market_cap_df, False), weights_file_name: (weights_df, True)}
+    for file_name, (df, index) in output_dict.items():
+        cloud_file = cloud_file_path + '/' + file_name
+        n_bytes = write_csv(df, cloud_file, header=True, index=index)
+        log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+
+
+def _build_field_panel(source_dict):
+    """ Reads the price and market cap history of each coin and aligns them into a single
+    (dates x coin-fields) panel. Only called when the cached panel is out of date. """
+
+    frames = []
+    for crypto, path in source_dict.items():
+        try:
+            with span('fetch', asset=crypto) as s:
+                frames.append(read_history_columns(path, {'price(usd)': crypto + '-price', 'market_cap(usd)': crypto + '-mc'}))
+                s.record(rows=len(frames[-1]))
+
+        except Exception as e:
+            log_event('Error while loading history for basket member: ' + crypto, severity='ERROR', asset=crypto, error=repr(e))
+
+    return build_panel(frames)
+
+
+def _load_state(storage):
+    """ Returns the saved basket state and the previously published levels, or (None, None)
+    if there is nothing to continue from (first run, changed basket definitions, forced rebuild). """
+
+    if force_recompute:
+        return None, None
+    try:
+        state = json.loads(storage.read_bytes(state_path))
+        levels_df = read_csv(cloud_file_path + '/' + levels_file_name, storage=storage)
+    except FileNotFoundError:
+        return None, None
+    if state.get('config') != config_hash(basket_dict) or list(levels_df.columns[1:]) != list(basket_dict):
+        return None, None
+    return state, levels_df
+
+
+def _to_dated(df):
+    """ Moves the date index into a leading date column. """
+
+    df = df.rename_axis('date').reset_index()
+    df['date'] = df['date'].dt.date.astype(str)
+    return df
+
+
+@entry_point('generate_baskets_page')
+def generate_baskets_page(event, context):    # FIXME: for google cloud function deployment
+# def generate_baskets_page():
+    """ Main run function that is called to pull in basket member histories, update the basket
+    index levels and market caps, and output them to cloud for the front end. """
+
+    # Skip the run entirely if no member history changed since the outputs were built
+    storage = get_storage()
+    tracker = SourceTracker(storage, 'baskets')
+    source_dict = {crypto: crypto_path + crypto + '.csv' for crypto in basket_members(basket_dict)}
+    passing_list = quality_gate(list(source_dict.values()), storage=storage)
+    failing_list = [crypto for crypto, path in source_dict.items() if path not in passing_list]
+    if failing_list:    # a member left out would rebalance the saved basket units, so hold the whole update back
+        log_event('Basket member histories failed quality checks, basket outputs were not updated.', severity='WARNING', assets=failing_list)
+        return
+    if not tracker.changed(list(source_dict.values())):
+        log_event('No coin histories changed since the last run, basket outputs are up to date.')
+        return
+
+    # Get coin data (memory-mapped from the panel cache when a warm instance already built it)
+    with span('transform', assets=len(source_dict)) as s:
+        panel = load_panel('baskets-fields', tracker.generations(list(source_dict.values())), lambda: _build_field_panel(source_dict), [crypto + field for crypto in source_dict for field in ['-price', '-mc']])
+        assets = [crypto for crypto in source_dict if crypto + '-price' in panel.columns]
+        price_panel = panel[[crypto + '-price' for crypto in assets]].set_axis(assets, axis=1)
+        mc_panel = panel[[crypto + '-mc' for crypto in assets]].set_axis(assets, axis=1)
+        s.record(rows=len(panel), assets=len(assets))
+
+    # Compute basket levels, continuing from the saved state when possible
+    with span('compute', baskets=len(basket_dict)) as s:
+        state, previous_levels_df = _load_state(storage)
+        state_date = pd.Timestamp(state['date']) if state is not None else None
+        if state is not None and state_date in price_panel.index:
+            new_levels_df, weights_df, new_state = compute_baskets(price_panel.loc[state_date:], mc_panel.loc[state_date:], basket_dict, state=state)
+            levels_df = pd.concat([previous_levels_df, _to_dated(new_levels_df.iloc[1:])], ignore_index=True)    # first row is the state date itself
+            s.record(mode='incremental', new_rows=len(new_levels_df) - 1)
+        else:
+            new_levels_df, weights_df, new_state = compute_baskets(price_panel, mc_panel, basket_dict)
+            levels_df = _to_dated(new_levels_df)
+            s.record(mode='full', new_rows=len(new_levels_df))
+        market_cap_df = _to_dated(basket_market_caps(mc_panel, basket_dict))    # one matmul, always recomputed so revisions show up
+
+    # Output results
+    output_results(levels_df, market_cap_df, weights_df)
+    storage.write_bytes(state_path, json.dumps(new_state, indent=2).encode('utf-8'), content_type='application/json')
+    tracker.commit()
+
+
+if __name__ == '__main__':
+    generate_baskets_page()
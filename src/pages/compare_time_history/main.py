@@ -8,32 +8,19 @@
 # comparison plots, etc.
 ###############################################################################
 import os
-import shutil
-import itertools
-import datetime
+import sys
 import pandas as pd 
-import numpy as np
-import json
-
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
-from google.cloud import storage
-from google.cloud import secretmanager
-from oauth2client.service_account import ServiceAccountCredentials
-import google.auth
-
-
-# AUTHENTICATE
-SCOPES = ['https://www.googleapis.com/auth/drive']
-gauth = GoogleAuth()    # pydrive library helper class for authenticating
-client = secretmanager.SecretManagerServiceClient()
-secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
-project_id = "eoc-dashboard-352623"
-request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
-response = client.access_secret_version(request)
-credentials_json = json.loads(response.payload.data.decode("UTF-8"))
-gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)   
-drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, write_csv
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+from utils.performance import cumulative_log_returns, rebased_windows
+from utils.downsample import downsample_frame, downsampled_file_name
+from utils.quote_currency import requested_currencies, reference_paths, load_reference_panel, convert_panel
+from utils.lineage import SourceTracker
+from utils.quality import quality_gate
+from utils.sheets import publish_workbook
 
 
 # CONFIG
@@ -41,9 +28,15 @@ bucket_name = 'eoc-dashboard-bucket'
 cloud_file_path = 'pages'
 file_name = 'eoc-dashboard-time-history-comparison.csv'
 file_name_excel = 'eoc-dashboard-time-history-comparison.xlsx'
+log_returns_file_name = 'eoc-dashboard-time-history-comparison-log-returns.csv'    # served to on-demand rebase queries by the api
+rebased_file_prefix = 'eoc-dashboard-time-history-comparison-rebased-'
+rebased_window_list = ['ytd', '1y', '3y']
+downsample_point_list = [500, 2000]    # point budgets for the -<n>pt chart files
+quote_currency_list = ['usd', 'eur', 'btc']    # non-usd variants are derived from the usd histories (see utils/quote_currency.py)
 DRIVE_FOLDER_ID = '1fjVF41cZvQcIkArLcdzvJgLLKpC_PbCT'   
 REFERENCE_FILE_ID = '12ZO87d-zXi4t0rK3cz7HTLHP1cjiclpBdL0AtsKt6lQ'   
 REFERENCE_FILENAME = 'eoc-dashboard-time-history-comparison-reference'    
+crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
 crypto_list = [
     'bitcoin',
     'ethereum',
@@ -66,72 +59,125 @@ crypto_list = [
 
 
 # FUNCTIONS
+@timed('upload')
 def output_results(df):
     """ Outputs the list of percentage ath drawdowns to 
     google drive sheets file and google cloud csv file. """
 
     # Output to google cloud storage
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    local_file = '/tmp/' + file_name
     cloud_file = cloud_file_path + '/' + file_name
-    df.to_csv(local_file, header=True, index=True)
-    blob = bucket.blob(cloud_file)
-    blob.upload_from_filename(local_file) 
-    print('updated google cloud file!')
+    n_bytes = write_csv(df, cloud_file, header=True, index=True)
+    log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+
+    # Output chart-ready downsampled variants next to it
+    for n_points in downsample_point_list:
+        downsampled_df = downsample_frame(df, n_points)
+        downsampled_file = cloud_file_path + '/' + downsampled_file_name(file_name, n_points)
+        n_bytes = write_csv(downsampled_df, downsampled_file, header=True, index=True)
+        log_event('updated google cloud file!', file=downsampled_file, rows=len(downsampled_df), bytes=n_bytes)
 
     # Output to google sheets
     local_file_excel = '/tmp/' + file_name_excel    # name file path
-    writer = pd.ExcelWriter(local_file_excel, engine='xlsxwriter')
-    df.to_excel(writer, sheet_name='time_histories')
-    writer.save()
+    publish_workbook({'time_histories': df}, local_file_excel, REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)    # usually just the appended rows
+
+
+@timed('upload')
+def output_quote_currency_results(df_dict):
+    """ Outputs the time history comparison denominated in each non-usd quote currency
+    to google cloud (eoc-dashboard-time-history-comparison-<currency>.csv). """
+
+    for currency, df in df_dict.items():
+        cloud_file = cloud_file_path + '/' + file_name.replace('.csv', '-' + currency + '.csv')
+        n_bytes = write_csv(df, cloud_file, header=True, index=True)
+        log_event('updated google cloud file!', file=cloud_file, currency=currency, rows=len(df), bytes=n_bytes)
+
 
-    csv = drive.CreateFile({'id': REFERENCE_FILE_ID, 'parents': [{'id': DRIVE_FOLDER_ID}], 'title': REFERENCE_FILENAME, 'mimeType': 'application/vnd.ms-excel'})
-    csv.SetContentFile(local_file_excel)
-    csv.Upload({'convert': True})
-    print('updated google drive file!')
+@timed('upload')
+def output_rebased_results(cumulative_df, rebased_dict):
+    """ Outputs the cumulative log return panel and the precomputed rebased windows
+    to google cloud csv files (date column first, one column per coin). """
 
+    output_dict = {log_returns_file_name: cumulative_df}
+    for window, df in rebased_dict.items():
+        output_dict[rebased_file_prefix + window + '.csv'] = df
 
-def format_time_history(coin_time_history_dict):
-    """ Takes in dictionary of coin time histories. Uses bitcoin (aka the one with the longest
-    running time history) to create a data frame that holds all coin 1 day time histories where
-    a null value is used for all rows where no data exists. Returns that data frame. """
+    for output_file_name, df in output_dict.items():
+        df = df.rename_axis('date').reset_index()
+        df['date'] = df['date'].dt.date
+        cloud_file = cloud_file_path + '/' + output_file_name
+        n_bytes = write_csv(df, cloud_file, header=True, index=False)
+        log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
 
-    df = pd.DataFrame(coin_time_history_dict['bitcoin'])
-    df = df.rename(columns={'price(usd)': 'bitcoin', 'date': 'date'})
 
-    for coin, time_history in coin_time_history_dict.items():
+def _build_price_panel(source_dict):
+    """ Reads the price history of each coin and aligns them into a single (dates x coins)
+    panel. Only called when the cached panel is out of date. """
+
+    frames = []
+    for crypto, path in source_dict.items():
+        with span('fetch', asset=crypto) as s:
+            frames.append(read_history_columns(path, {'price(usd)': crypto}))    # download file (or reuse the local mirror)
+            s.record(rows=len(frames[-1]))
+    return build_panel(frames)
+
+
+def format_time_history(panel):
+    """ Takes in the aligned (dates x coins) price panel. Uses bitcoin (aka the one with the longest
+    running time history) dates to create a data frame that holds all coin 1 day time histories where
+    a null value is used for all rows where no data exists. Uses every date of the panel if bitcoin
+    was left out (e.g. by the quality gate). Returns that data frame. """
+
+    if 'bitcoin' in panel.columns:
+        panel = panel[panel['bitcoin'].notna()]
+        df = pd.DataFrame({'bitcoin': panel['bitcoin'].values, 'date': panel.index.date})
+    else:
+        df = pd.DataFrame({'date': panel.index.date})
+    for coin in panel.columns:
         if coin != 'bitcoin':
-            time_history_for_df = time_history.rename(columns={'price(usd)': coin, 'date': 'date'})
-            df = pd.merge(df, time_history_for_df, on='date', how='left')
+            df[coin] = panel[coin].values
    
     return df
 
 
+@entry_point('generate_time_history_comparison_files')
 def generate_time_history_comparison_files(event, context):    # FIXME: for google cloud function deployment
 # def generate_time_history_comparison_files():
     """ Main run function that is called to pull in asset time histories, format, and output them to 
     cloud and sheets for plotting, etc.. """
 
-    # Get coin data
-    coin_dict = {}
-    for crypto in crypto_list:
-        
-        crypto_df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_' + crypto + '.csv')    # download file FIXME: filename
-        
-        crypto_df = crypto_df[['utc', 'price(usd)']]    # only need price and time
-        crypto_df['date'] = pd.to_datetime(crypto_df['utc']).dt.date
-        crypto_df = crypto_df.drop_duplicates(subset=['date'], keep="first")
-
-        crypto_df.drop('utc', axis=1, inplace=True)   # eliminate duplicate columns
-
-        coin_dict[crypto] = crypto_df
+    # Skip the run entirely if no coin history (or quote currency reference) changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'compare_time_history')
+    source_dict = {crypto: crypto_path + crypto + '.csv' for crypto in crypto_list}
+    passing_list = quality_gate(list(source_dict.values()))
+    source_dict = {crypto: path for crypto, path in source_dict.items() if path in passing_list}    # leave out histories that failed the quality checks
+    currency_list = requested_currencies(event, quote_currency_list)
+    if not tracker.changed(list(source_dict.values()) + reference_paths(currency_list)):
+        log_event('No coin histories changed since the last run, comparison outputs are up to date.')
+        return
+
+    # Get coin data (memory-mapped from the panel cache when a warm instance already built it)
+    with span('transform', assets=len(source_dict)) as s:
+        panel = load_panel('compare_time_history-prices', tracker.generations(list(source_dict.values())), lambda: _build_price_panel(source_dict), list(source_dict))
+        s.record(rows=len(panel))
 
     # Format time histories
-    formatted_time_history_df = format_time_history(coin_dict)
+    with span('compute', assets=len(panel.columns)) as s:
+        formatted_time_history_df = format_time_history(panel)
+        cumulative_df = cumulative_log_returns(panel)
+        rebased_dict = rebased_windows(cumulative_df, rebased_window_list)
+        s.record(rows=len(formatted_time_history_df))
+
+    # Derive the other quote currencies from the usd prices (no extra fetches)
+    with span('compute', currencies=len(currency_list) - 1) as s:
+        reference_panel = load_reference_panel(currency_list, tracker.generations(reference_paths(currency_list)))
+        converted_dict = convert_panel(panel, reference_panel, currency_list)
+        quote_currency_dict = {currency: format_time_history(converted_dict[currency]) for currency in currency_list if currency != 'usd'}
 
     # Output results
     output_results(formatted_time_history_df)
+    output_rebased_results(cumulative_df, rebased_dict)
+    output_quote_currency_results(quote_currency_dict)
+    tracker.commit()
 
 
 if __name__ == '__main__':
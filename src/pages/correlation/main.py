@@ -9,32 +9,20 @@
 # Source: https://algotrading101.com/learn/python-correlation-guide/
 ###############################################################################
 import os
-import shutil
+import sys
 import itertools
 import datetime
 import pandas as pd 
 import numpy as np
-import json
 
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
-from google.cloud import storage
-from google.cloud import secretmanager
-from oauth2client.service_account import ServiceAccountCredentials
-import google.auth
-
-
-# AUTHENTICATE
-SCOPES = ['https://www.googleapis.com/auth/drive']
-gauth = GoogleAuth()    # pydrive library helper class for authenticating
-client = secretmanager.SecretManagerServiceClient()
-secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
-project_id = "eoc-dashboard-352623"
-request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
-response = client.access_secret_version(request)
-credentials_json = json.loads(response.payload.data.decode("UTF-8"))
-gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)    # FIXME: get this from the json or from the keyfile
-drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event, summarize_frame
+from utils.storage import get_storage, write_csv
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+from utils.returns import rate_of_return, resample_returns
+from utils.lineage import SourceTracker
+from utils.quality import quality_gate
+from utils.sheets import publish_workbook
 
 
 # CONFIG
@@ -44,7 +32,13 @@ cloud_file_path = 'pages'
 DRIVE_FOLDER_ID = '14LAPdLKJYVI1TS0pUL0D_UFShCoXLt4P'
 REFERENCE_FILE_ID = '1bPH7CLEOHmDQDHcnhSkSdQyekqrtUsxnvFCxvN_TtlM'
 REFERENCE_FILENAME = 'eoc-dashboard-correlation-matrix-references'
-lookback_period_list = [7, 30, 90, 365]
+lookback_period_list = [7, 30, 90, 365]    # shared rows per pair
+calendar_frequency_dict = {    # frequency name: (pandas offset, calendar day lookbacks)
+    'business-day': (pd.offsets.BDay(), [7, 30, 90, 365]),
+    'weekly': (pd.offsets.Week(weekday=4), [90, 365, 1095]),    # weeks ending friday
+    'monthly': (pd.offsets.MonthEnd(), [365, 1095, 1825]),
+}
+calendar_min_periods = 3    # fewest shared returns in a window for a pair to get a correlation value
 crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
 crypto_list = [
     'bitcoin',
@@ -84,6 +78,7 @@ def create_matrix(asset_list, permutation_dict):
     return df
 
 
+@timed('upload')
 def output_results(asset_list, correlation_matrix):
     """ Outputs the correlation matrices specified by the user in 
     the input 'correlation_matrix' variable to google cloud and
@@ -97,20 +92,14 @@ def output_results(asset_list, correlation_matrix):
     google_sheets_matrix = {}
     for lookback in correlation_matrix.keys():
 
-        print('Correlation matrix for: {} day lookback'.format(lookback))
         df = create_matrix(asset_list, correlation_matrix[lookback])
-        print(df)
+        log_event('Correlation matrix for: {} day lookback'.format(lookback), lookback=lookback, summary=summarize_frame(df))
 
         # Output to google cloud storage
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
         file_name = 'eoc-dashboard-correlation-matrix-' + str(lookback) + 'day.csv'
-        local_file = '/tmp/' + file_name
         cloud_file = cloud_file_path + '/' + file_name
-        df.to_csv(local_file, header=True, index=True)
-        blob = bucket.blob(cloud_file)
-        blob.upload_from_filename(local_file) 
-        print('updated google cloud file!')
+        n_bytes = write_csv(df, cloud_file, header=True, index=True)
+        log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
 
         # Prep for output to google sheets
         google_sheets_matrix[str(lookback)] = df
@@ -119,20 +108,9 @@ def output_results(asset_list, correlation_matrix):
     file_name_excel = 'eoc-dashboard-correlation-matrix.xlsx'
     local_file_excel = local_file_path + '/' + file_name_excel
 
-    writer = pd.ExcelWriter(local_file_excel, engine='xlsxwriter')
-    for sheet in list(google_sheets_matrix.keys()):
-        print(google_sheets_matrix[sheet])
-        google_sheets_matrix[sheet].to_excel(writer, sheet_name=sheet)
-
-    last_updated_df = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})
-    last_updated_df.to_excel(writer, sheet_name='last_updated')    # add last updated sheet
-    
-    writer.save()
+    google_sheets_matrix['last_updated'] = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})    # add last updated sheet
 
-    csv = drive.CreateFile({'id': REFERENCE_FILE_ID, 'parents': [{'id': DRIVE_FOLDER_ID}], 'title': REFERENCE_FILENAME, 'mimeType': 'application/vnd.ms-excel'})
-    csv.SetContentFile(local_file_excel)
-    csv.Upload({'convert': True})
-    print('updated google drive file!')
+    publish_workbook(google_sheets_matrix, local_file_excel, REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)    # only changed matrix cells unless the layout changed
 
     # Tear down temp directory
     # shutil.rmtree(os.path.join(os.getcwd(), 'tmp'))      FIXME: production only
@@ -164,85 +142,101 @@ def calculate_correlation(input_df, returns_header1, returns_header2, lookback):
     return correlation_coeff
 
 
+def _build_price_panel(source_list):
+    """ Reads the crypto and stock histories in the source list and aligns their daily closes into a single
+    (dates x assets) panel. Only called when the cached panel is out of date. """
+
+    frames = []
+    for asset_path, asset_list, columns in [(crypto_path, crypto_list, ('utc', 'price(usd)')), (stock_path, stock_list, ('date', 'close'))]:
+        for asset in asset_list:
+            if asset_path + asset + '.csv' not in source_list:
+                continue
+
+            try:
+                with span('fetch', asset=asset) as s:
+                    frames.append(read_history_columns(asset_path + asset + '.csv', {columns[1]: asset}, date_column=columns[0]))    # only need price and time
+                    s.record(rows=len(frames[-1]))
+
+            except Exception as e:
+                log_event('Error during correlation function pulling of data for:  ' + asset, severity='ERROR', asset=asset, error=repr(e))
+
+    return build_panel(frames)
+
+
+def calendar_correlation_matrix(returns, lookback):
+    """ Calculates the Pearson correlation matrix of all assets over the last lookback calendar
+    days of the input returns panel, using the dates each pair has in common (pairwise complete). """
+
+    window = returns[returns.index > returns.index[-1] - pd.Timedelta(days=lookback)]
+    return window.corr(method='pearson', min_periods=calendar_min_periods)
+
+
+@timed('upload')
+def output_calendar_results(calendar_matrix):
+    """ Outputs the calendar window correlation matrices for each frequency to google cloud. """
+
+    for frequency in calendar_matrix.keys():
+        for lookback, df in calendar_matrix[frequency].items():
+
+            file_name = 'eoc-dashboard-correlation-matrix-' + frequency + '-' + str(lookback) + 'day.csv'
+            cloud_file = cloud_file_path + '/' + file_name
+            n_bytes = write_csv(df, cloud_file, header=True, index=True)
+            log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+
+
+@entry_point('generate_correlation_page')
 def generate_correlation_page(event, context):    # FIXME: for google cloud function deployment
 # def generate_correlation_page():
     """ Main run function that is called to compute correlations between all possible combinations of the specified stocks and cryptos
     for the input list of lookback periods. It then outputs the resulting correlation matrix to google cloud and google sheets. """
 
-    # GET DATA
-    history_dict = {}
-    big_correlation_matrix = {}
+    # Skip the run entirely if no history changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'correlation')
+    source_list = [crypto_path + crypto + '.csv' for crypto in crypto_list] + [stock_path + stock + '.csv' for stock in stock_list]
+    source_list = quality_gate(source_list)    # leave out histories that failed the quality checks
+    if not tracker.changed(source_list):
+        log_event('No histories changed since the last run, correlation outputs are up to date.')
+        return
 
-    # Load cryptos
-    for crypto in crypto_list:
-        
-        try:
-            # crypto_df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_daily_coin_history_' + crypto + '.csv')    # original file name
-            crypto_df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_' + crypto + '.csv')    
-            
-            crypto_df = crypto_df[['utc', 'price(usd)']]    # only need price and time
-            crypto_df['date'] = pd.to_datetime(crypto_df['utc']).dt.date
-            crypto_df = crypto_df.drop_duplicates(subset=['date'], keep="first")
-            crypto_df['previous_close'] = crypto_df['price(usd)'].shift(periods=1)
-            crypto_df[crypto + '_rate_of_return'] = (crypto_df['price(usd)'] - crypto_df['previous_close']) / crypto_df['previous_close']    # calc rate of return
-
-            crypto_df.drop('price(usd)', axis=1, inplace=True)    # eliminate unnecessary columns
-            crypto_df.drop('previous_close', axis=1, inplace=True)    
-            crypto_df.drop('utc', axis=1, inplace=True)   
-
-            history_dict[crypto] = crypto_df            
-
-        except Exception as e:
-            print('Error during correlation function pulling of data for:  ' + stock)
-            print(e)
-
-    # Load stocks
-    for stock in stock_list:
-
-        try:
-            # stock_df = pd.read_csv('gs://eoc-dashboard-bucket/data/stock_histories/fmp_daily_stock_history_' + stock + '.csv')    # original file name
-            stock_df = pd.read_csv('gs://eoc-dashboard-bucket/data/stock_histories/fmp_stock_history_24h_' + stock + '.csv')   
-
-            stock_df = stock_df[['date', 'close']]    # eliminate unnecessary columns
-            stock_df['date'] = pd.to_datetime(stock_df['date']).dt.date
-            stock_df = stock_df.drop_duplicates(subset=['date'], keep="first")
-            stock_df['previous_close'] = stock_df['close'].shift(periods=1)
-            stock_df[stock + '_rate_of_return'] = (stock_df['close'] - stock_df['previous_close']) / stock_df['previous_close']    # calc rate of return
-
-            stock_df.drop('close', axis=1, inplace=True)    # eliminate unnecessary columns
-            stock_df.drop('previous_close', axis=1, inplace=True)    
-
-            history_dict[stock] = stock_df
-        
-        except Exception as e:
-            print('Error during correlation function pulling of data for:  ' + stock)
-            print(e)
+    # GET DATA (memory-mapped from the panel cache when a warm instance already built it)
+    big_correlation_matrix = {}
+    with span('transform', assets=len(source_list)) as s:
+        column_list = [crypto for crypto in crypto_list if crypto_path + crypto + '.csv' in source_list] + [stock for stock in stock_list if stock_path + stock + '.csv' in source_list]
+        price_panel = load_panel('correlation-prices', tracker.generations(source_list), lambda: _build_price_panel(source_list), column_list)
+        returns_panel = rate_of_return(price_panel)
+        s.record(rows=len(price_panel), columns=len(price_panel.columns))
 
     # Define permutations to be run
-    permutation_list = list(itertools.permutations(history_dict.keys(), r=2))    # generate all possible market pairs
+    asset_list = list(price_panel.columns)
+    permutation_list = list(itertools.permutations(asset_list, r=2))    # generate all possible market pairs
 
     # Run all permutations for all lookbacks
     for lookback_period in lookback_period_list:
 
         small_correlation_matrix = {}    # only covers correlations for the current lookback period being run
 
-        for permutation in permutation_list:
-
-            print('Computing correlation between {} and {} for {} lookback period...'.format(permutation[0], permutation[1], lookback_period))
+        with span('compute', lookback=lookback_period, pairs=len(permutation_list)):
+            for permutation in permutation_list:
 
-            df0 = history_dict[permutation[0]]
-            df1 = history_dict[permutation[1]]
-            merged_df = df0.merge(df1, on=['date'])    # ensure that only dates that occur in both histories are used for crypto / stock pairs
-            merged_df = merged_df.dropna()
+                pair_df = returns_panel[list(permutation)].dropna()    # ensure that only dates that occur in both histories are used for crypto / stock pairs
+                correlation_coeff = calculate_correlation(pair_df, permutation[0], permutation[1], lookback_period)
 
-            correlation_coeff = calculate_correlation(merged_df, permutation[0] + '_rate_of_return', permutation[1] + '_rate_of_return', lookback_period)
-
-            small_correlation_matrix[permutation] = correlation_coeff
+                small_correlation_matrix[permutation] = correlation_coeff
 
         big_correlation_matrix[lookback_period] = small_correlation_matrix
+
+    # Run calendar window matrices for each resampled frequency (all pairs at once, same panel)
+    calendar_matrix = {}
+    for frequency, (rule, lookback_list) in calendar_frequency_dict.items():
+        with span('compute', frequency=frequency, lookbacks=len(lookback_list)) as s:
+            frequency_returns = resample_returns(price_panel, rule)
+            calendar_matrix[frequency] = {lookback: calendar_correlation_matrix(frequency_returns, lookback) for lookback in lookback_list}
+            s.record(rows=len(frequency_returns))
     
     # Output results
-    output_results(list(history_dict.keys()), big_correlation_matrix)
+    output_results(asset_list, big_correlation_matrix)
+    output_calendar_results(calendar_matrix)
+    tracker.commit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,257 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Dependency-aware page refresh. Maps changed source blobs to the
+# pages built from them and reruns only those pages (each page then uses its
+# lineage record to skip or reuse unchanged assets, see utils/lineage.py).
+# Can be driven by google cloud storage notifications (handle_storage_event),
+# or locally by polling a directory laid out like the bucket (watch_local).
+# Only changes to the registry's input sources count (not page outputs, which
+# the refresh itself cascades, or lineage / manifest / quality records), and a
+# burst of them (e.g. one collector run uploading every coin history) is
+# collected into a single refresh once it has been quiet for a while.
+###############################################################################
+import os
+import sys
+import json
+import time
+import inspect
+import importlib.util
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, log_event
+from utils.storage import get_storage, GenerationMismatch
+from utils.snapshot import snapshot_path
+
+
+# CONFIG
+pages_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+poll_seconds = 5    # how often watch_local checks for changed files
+debounce_seconds = float(os.environ.get('EOC_REFRESH_DEBOUNCE_SECONDS', 30))    # storage events are refreshed once no new one arrived for this long...
+max_delay_seconds = 5 * 60    # ...or once the oldest waiting event is this old
+pending_path = 'data/refresh/pending.json'    # changed paths waiting for a refresh, shared by the event handler invocations
+max_write_retries = 20    # conditional write attempts before giving up on a pending update
+snapshot_page_list = ['ath', 'stablecoins']    # pages that read the intraday market snapshot (utils/snapshot.py)
+page_registry = [    # in dependency order (pages that produce files come before the pages that read them)
+    {
+        'page': 'ath',
+        'entry_point': 'generate_ath_page',
+        'sources': ['data/coin_histories/', 'data/coin_snapshots/'],    # latest values come from the intraday market snapshot
+        'outputs': ['pages/eoc-dashboard-crypto-ath'],
+    },
+    {
+        'page': 'compare_time_history',
+        'entry_point': 'generate_time_history_comparison_files',
+        'sources': ['data/coin_histories/'],
+        'outputs': ['pages/eoc-dashboard-time-history-comparison'],
+    },
+    {
+        'page': 'correlation',
+        'entry_point': 'generate_correlation_page',
+        'sources': ['data/coin_histories/', 'data/stock_histories/'],
+        'outputs': ['pages/eoc-dashboard-correlation-matrix'],
+    },
+    {
+        'page': 'risk',
+        'entry_point': 'generate_risk_page',
+        'sources': ['data/coin_histories/', 'data/stock_histories/'],
+        'outputs': ['pages/eoc-dashboard-risk-'],
+    },
+    {
+        'page': 'stablecoins',
+        'entry_point': 'generate_stablecoin_page',
+        'sources': ['data/coin_histories/', 'data/coin_snapshots/'],    # latest values come from the intraday market snapshot
+        'outputs': ['pages/eoc-dashboard-stablecoins-'],
+    },
+    {
+        'page': 'baskets',
+        'entry_point': 'generate_baskets_page',
+        'sources': ['data/coin_histories/'],
+        'outputs': ['pages/eoc-dashboard-baskets-'],
+    },
+    {
+        'page': 'anomalies',
+        'entry_point': 'generate_anomaly_page',
+        'sources': ['pages/eoc-dashboard-crypto-ath'],
+        'outputs': ['pages/eoc-dashboard-anomaly'],
+    },
+]
+
+_loaded_pages = {}    # page -> entry point function, kept between runs on a warm instance
+
+
+# FUNCTIONS
+def affected_pages(changed_paths):
+    """ Returns the registry entries for every page that reads any of the changed paths,
+    directly or through the outputs of another affected page, in dependency order. """
+
+    changed_prefixes = list(changed_paths)
+    affected = []
+    for entry in page_registry:
+        if any(path.startswith(source) for path in changed_prefixes for source in entry['sources']):
+            affected.append(entry)
+            changed_prefixes = changed_prefixes + entry['outputs']    # its outputs may feed later pages
+    return affected
+
+
+def source_prefixes():
+    """ Returns the prefixes of the files the pages read that are not themselves page outputs.
+    Outputs are left out because refresh_pages already reruns the pages that read them. """
+
+    output_list = [output for entry in page_registry for output in entry['outputs']]
+    return sorted(set(source for entry in page_registry for source in entry['sources'] if not any(source.startswith(output) for output in output_list)))
+
+
+def check_registry():
+    """ Raises ValueError if a write to the market snapshot would not be picked up as a page
+    source, or would not refresh every page that reads it. Run when the module is loaded, so a
+    registry that drops the intraday refresh fails at deploy time instead of silently. """
+
+    if not any(snapshot_path.startswith(prefix) for prefix in source_prefixes()):
+        raise ValueError('Market snapshot is not a page source: ' + snapshot_path)
+    refreshed = [entry['page'] for entry in affected_pages([snapshot_path])]
+    missing = [page for page in snapshot_page_list if page not in refreshed]
+    if missing:
+        raise ValueError('Market snapshot writes do not refresh: ' + ', '.join(missing))
+
+
+def _update_pending(storage, func):
+    """ Read-modify-write of the pending refresh file with a generation precondition (retried).
+    func mutates the pending dict in place and returns a result. Nothing is written if it made
+    no change. """
+
+    for attempt in range(max_write_retries):
+        try:
+            data, generation = storage.read_with_generation(pending_path)
+            pending = json.loads(data) if data is not None else {'paths': [], 'first_event': None, 'last_event': None}
+            before = json.dumps(pending, sort_keys=True)
+            result = func(pending)
+            if json.dumps(pending, sort_keys=True) != before:
+                storage.write_bytes(pending_path, json.dumps(pending, indent=2).encode('utf-8'), content_type='application/json', if_generation_match=generation or '0')
+            return result
+        except GenerationMismatch:
+            time.sleep(0.05 * (attempt + 1))    # another event wrote first, reload and retry
+    raise RuntimeError('Could not update pending refresh ' + pending_path)
+
+
+def _add_pending(storage, path, now):
+    """ Adds the changed path to the pending refresh. """
+
+    def _add(pending):
+        if path not in pending['paths']:
+            pending['paths'].append(path)
+        pending['first_event'] = pending['first_event'] or now
+        pending['last_event'] = max(pending['last_event'] or now, now)
+    _update_pending(storage, _add)
+
+
+def _take_pending(storage, now):
+    """ Returns (and clears) the pending paths if no event arrived for debounce_seconds or the
+    oldest has waited max_delay_seconds, otherwise None (a later event's invocation takes them). """
+
+    def _take(pending):
+        if not pending['paths']:
+            return None
+        if now - pending['last_event'] < debounce_seconds and now - pending['first_event'] < max_delay_seconds:
+            return None
+        paths = pending['paths']
+        pending.update({'paths': [], 'first_event': None, 'last_event': None})
+        return paths
+    return _update_pending(storage, _take)
+
+
+def _load_page(entry):
+    """ Imports the page module from its directory and returns its entry point function. """
+
+    if entry['page'] not in _loaded_pages:
+        page_directory = os.path.join(pages_directory, entry['page'])
+        sys.path.insert(0, page_directory)    # pages import their own config modules
+        spec = importlib.util.spec_from_file_location('eoc_page_' + entry['page'], os.path.join(page_directory, 'main.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_pages[entry['page']] = getattr(module, entry['entry_point'])
+    return _loaded_pages[entry['page']]
+
+
+def refresh_pages(changed_paths=None, event=None, context=None):
+    """ Reruns the pages affected by the changed paths (every page if None). Returns the
+    names of the pages that were run. """
+
+    entries = page_registry if changed_paths is None else affected_pages(changed_paths)
+    for entry in entries:
+        try:
+            with span('refresh', page=entry['page']):
+                func = _load_page(entry)
+                n_params = len(inspect.signature(func).parameters)
+                func(*[event, context][:n_params])    # some dev entry points take no arguments
+        except Exception as e:
+            log_event('Error while refreshing page: ' + entry['page'], severity='ERROR', page=entry['page'], error=repr(e))
+
+    return [entry['page'] for entry in entries]
+
+
+@entry_point('handle_storage_event')
+def handle_storage_event(event, context):
+    """ Cloud function entry point for google.storage.object.finalize notifications on the
+    bucket. Also usable as a local stand-in: handle_storage_event({'name': path}, None).
+    Adds the changed source to the pending refresh and waits debounce_seconds. If no newer
+    event arrived by then, refreshes the pages of every pending path at once, otherwise
+    leaves them to the invocation of the newer event. """
+
+    changed_path = event['name']
+    if not any(changed_path.startswith(prefix) for prefix in source_prefixes()):
+        log_event('Ignored storage event outside the page sources', path=changed_path)
+        return
+
+    storage = get_storage()
+    _add_pending(storage, changed_path, time.time())
+    time.sleep(debounce_seconds)
+    changed_paths = _take_pending(storage, time.time())
+    if not changed_paths:
+        log_event('Storage event left to a newer event', path=changed_path)
+        return
+
+    pages = refresh_pages(changed_paths, event, context)
+    log_event('Handled storage events', paths=changed_paths[:20], count=len(changed_paths), pages=pages)
+
+
+def watch_local(prefixes=None, interval=poll_seconds, max_polls=None):
+    """ Polls the storage backend (use EOC_STORAGE_BACKEND=local for a local directory) for
+    changed files under the source prefixes and refreshes the affected pages, once a poll finds
+    no further changes (so a burst of uploads is refreshed once). Runs until interrupted, or
+    for max_polls polls. """
+
+    storage = get_storage()
+    prefixes = prefixes or source_prefixes()
+
+    def _snapshot():
+        generations = {}
+        for prefix in prefixes:
+            generations.update(storage.list_generations(prefix))
+        return generations
+
+    previous = _snapshot()
+    pending_list = []
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        time.sleep(interval)
+        current = _snapshot()
+        changed_paths = [path for path, generation in current.items() if previous.get(path) != generation]
+        if changed_paths:
+            log_event('Detected changed files', paths=changed_paths[:20], count=len(changed_paths))
+            pending_list = pending_list + [path for path in changed_paths if path not in pending_list]
+        elif pending_list:    # quiet since the last changes
+            refresh_pages(pending_list)
+            pending_list = []
+        previous = current
+        polls = polls + 1
+
+
+check_registry()
+
+
+# DEV ENTRY POINT
+if __name__ == '__main__':
+    watch_local()
@@ -0,0 +1,193 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Pull in crypto and stock histories from cloud and compute the
+# rolling realized volatility, downside deviation, and beta against bitcoin
+# and the S&P 500 of every asset for each lookback. All assets and windows are
+# computed over the whole daily returns matrix at once with O(T) cumulative
+# sum window statistics (see utils/rolling.py). Outputs the time histories and
+# a summary of the latest values to cloud and google sheet on google drive.
+###############################################################################
+import os
+import sys
+import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, write_csv
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+from utils.returns import rate_of_return, resample_returns
+from utils.rolling import rolling_std, rolling_downside_deviation, rolling_beta
+from utils.lineage import SourceTracker
+from utils.quality import quality_gate
+from utils.sheets import publish_workbook
+
+
+# CONFIG
+bucket_name = 'eoc-dashboard-bucket'
+local_file_path = '/tmp'
+cloud_file_path = 'pages'
+file_prefix = 'eoc-dashboard-risk-'
+DRIVE_FOLDER_ID = '14LAPdLKJYVI1TS0pUL0D_UFShCoXLt4P'
+REFERENCE_FILE_ID = None    # sheet is created in the drive folder on the first run and found by its title after that (see utils/sheets.py)
+REFERENCE_FILENAME = 'eoc-dashboard-risk-references'
+lookback_period_list = [30, 90, 365]    # calendar days
+min_coverage = 0.5    # fewest returns in a window (as a fraction of its days) for a value, stocks only trade ~5/7 days
+downside_target = 0.0    # daily return below which downside deviation accumulates
+days_per_year = 365    # volatilities are annualized by the observed number of returns per year of each asset
+benchmark_dict = {    # output name: benchmark asset, return frequency (None for calendar days)
+    'btc': ('bitcoin', None),
+    'spx': ('^GSPC', pd.offsets.BDay()),    # business day returns, so monday pairs friday -> monday moves (weekend crypto moves roll in)
+}
+crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
+crypto_list = [
+    'bitcoin',
+    'ethereum',
+    'binancecoin',
+    'ripple',
+    'cardano',
+    'solana',
+    'dogecoin',
+    'polkadot',
+    'avalanche-2',
+    'matic-network',
+    'litecoin',
+]
+stock_path = 'data/stock_histories/fmp_stock_history_24h_'
+stock_list = [
+    '^GSPC',
+    '^IXIC',
+    '^DJI',
+    'AAPL',
+    'AMZN',
+    'GOOG',
+    'META',
+    'ZGUSD',
+    'CLUSD',
+    'NGUSD'
+]
+
+
+# FUNCTIONS
+@timed('upload')
+def output_results(history_dict, summary_df):
+    """ Outputs the risk metric time histories (date column first, one column per asset) and
+    the summary of latest values to google cloud, and the summary to google sheets. """
+
+    # Output to google cloud storage
+    output_dict = {file_prefix + name + '.csv': df.rename_axis('date').reset_index() for name, df in history_dict.items()}
+    output_dict[file_prefix + 'summary.csv'] = summary_df
+    for file_name, df in output_dict.items():
+        cloud_file = cloud_file_path + '/' + file_name
+        n_bytes = write_csv(df, cloud_file, header=True, index=file_name.endswith('summary.csv'))
+        log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+
+    # Output to google sheets
+    file_name_excel = 'eoc-dashboard-risk.xlsx'
+    local_file_excel = local_file_path + '/' + file_name_excel
+    sheet_dict = {'summary': summary_df}
+    sheet_dict['last_updated'] = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})    # add last updated sheet
+
+    publish_workbook(sheet_dict, local_file_excel, REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)    # only changed ranges unless the layout changed
+
+
+def _build_price_panel(source_list):
+    """ Reads the crypto and stock histories in the source list and aligns their daily closes into a single
+    (dates x assets) panel. Only called when the cached panel is out of date. """
+
+    frames = []
+    for asset_path, asset_list, columns in [(crypto_path, crypto_list, ('utc', 'price(usd)')), (stock_path, stock_list, ('date', 'close'))]:
+        for asset in asset_list:
+            if asset_path + asset + '.csv' not in source_list:
+                continue
+
+            try:
+                with span('fetch', asset=asset) as s:
+                    frames.append(read_history_columns(asset_path + asset + '.csv', {columns[1]: asset}, date_column=columns[0]))    # only need price and time
+                    s.record(rows=len(frames[-1]))
+
+            except Exception as e:
+                log_event('Error during risk function pulling of data for:  ' + asset, severity='ERROR', asset=asset, error=repr(e))
+
+    return build_panel(frames)
+
+
+def calculate_risk_metrics(price_panel):
+    """ Takes the calendar day price panel and returns a dict of metric name -> (dates x assets)
+    time history for every lookback: annualized volatility, annualized downside deviation, and
+    beta against each benchmark. Betas against a stock benchmark use business day returns (placed
+    back on the calendar days) so both legs of every pair cover the same period. Each metric is
+    one pass over the whole matrix. """
+
+    returns = rate_of_return(price_panel)
+    values = returns.to_numpy(dtype=np.float64)
+    benchmark_values = {}
+    for name, (benchmark, rule) in benchmark_dict.items():
+        if benchmark in price_panel.columns:
+            benchmark_returns = returns if rule is None else resample_returns(price_panel, rule).reindex(price_panel.index)
+            benchmark_values[name] = benchmark_returns.to_numpy(dtype=np.float64)
+
+    history_dict = {}
+    for lookback in lookback_period_list:
+        min_count = int(np.ceil(lookback * min_coverage))
+
+        std, count = rolling_std(values, lookback, min_count=min_count)
+        with np.errstate(invalid='ignore'):
+            annualize = np.sqrt(count * days_per_year / lookback)    # observed returns per year of each asset
+        history_dict['volatility-' + str(lookback) + 'day'] = std * annualize
+
+        downside, count = rolling_downside_deviation(values, lookback, target=downside_target, min_count=min_count)
+        history_dict['downside-deviation-' + str(lookback) + 'day'] = downside * annualize
+
+        for name, frequency_values in benchmark_values.items():
+            benchmark = benchmark_dict[name][0]
+            beta, count = rolling_beta(frequency_values, frequency_values[:, returns.columns.get_loc(benchmark)], lookback, min_count=min_count)
+            history_dict['beta-' + name + '-' + str(lookback) + 'day'] = beta
+
+    return {name: pd.DataFrame(metric, index=returns.index, columns=returns.columns) for name, metric in history_dict.items()}
+
+
+def summarize_risk_metrics(history_dict):
+    """ Returns a (assets x metrics) table of each asset's latest value of every metric. """
+
+    return pd.DataFrame({name: df.ffill().iloc[-1] for name, df in history_dict.items()})
+
+
+@entry_point('generate_risk_page')
+def generate_risk_page(event, context):    # FIXME: for google cloud function deployment
+# def generate_risk_page():
+    """ Main run function that is called to compute rolling volatility, downside deviation, and beta
+    of the specified stocks and cryptos for every lookback, then output them to google cloud and google sheets. """
+
+    # Skip the run entirely if no history changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'risk')
+    source_list = [crypto_path + crypto + '.csv' for crypto in crypto_list] + [stock_path + stock + '.csv' for stock in stock_list]
+    source_list = quality_gate(source_list)    # leave out histories that failed the quality checks
+    if not tracker.changed(source_list):
+        log_event('No histories changed since the last run, risk outputs are up to date.')
+        return
+
+    # GET DATA (memory-mapped from the panel cache when a warm instance already built it)
+    with span('transform', assets=len(source_list)) as s:
+        column_list = [crypto for crypto in crypto_list if crypto_path + crypto + '.csv' in source_list] + [stock for stock in stock_list if stock_path + stock + '.csv' in source_list]
+        price_panel = load_panel('risk-prices', tracker.generations(source_list), lambda: _build_price_panel(source_list), column_list)
+        price_panel = price_panel.reindex(pd.date_range(price_panel.index[0], price_panel.index[-1], freq='D', name='date'))    # one row per calendar day, so windows are calendar lookbacks
+        s.record(rows=len(price_panel), columns=len(price_panel.columns))
+
+    # Compute every metric for every asset and lookback
+    with span('compute', assets=len(price_panel.columns), lookbacks=len(lookback_period_list)) as s:
+        history_dict = calculate_risk_metrics(price_panel)
+        summary_df = summarize_risk_metrics(history_dict)
+        s.record(metrics=len(history_dict))
+
+    # Output results
+    output_results(history_dict, summary_df)
+    tracker.commit()
+
+
+if __name__ == '__main__':
+    generate_risk_page()
@@ -5,35 +5,30 @@
 # DATE CREATED: 26-July-2022
 # DESCRIPTION: Pull in data for stable coins from cloud and output a table of
 # metrics, as well as formatted time histories for easy plotting on a front
-# end.
+# end. The time histories are computed one date block at a time (block_rows
+# days) and each block is sent to every output (cloud csvs, downsampled
+# variants, google sheet) as it comes, so memory stays bounded as the
+# histories grow and no block is computed twice. The
+# summary takes each coin's latest values from the intraday market snapshot
+# when it is newer, and is refreshed on its own (without the histories) when
+# only the snapshot changed.
 ###############################################################################
 import os
-import shutil
-import itertools
+import sys
 import datetime
-import pandas as pd 
 import numpy as np
-import json
-
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
-from google.cloud import storage
-from google.cloud import secretmanager
-from oauth2client.service_account import ServiceAccountCredentials
-import google.auth
-
+import pandas as pd 
 
-# AUTHENTICATE
-SCOPES = ['https://www.googleapis.com/auth/drive']
-gauth = GoogleAuth()    # pydrive library helper class for authenticating
-client = secretmanager.SecretManagerServiceClient()
-secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
-project_id = "eoc-dashboard-352623"
-request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
-response = client.access_secret_version(request)
-credentials_json = json.loads(response.payload.data.decode("UTF-8"))
-gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)   
-drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))    # enable imports from src directory
+from utils.instrumentation import entry_point, span, timed, log_event
+from utils.storage import get_storage, write_csv, ChunkedCsvWriter, BlockSpool
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+from utils.downsample import ChunkedDownsampler, downsampled_file_name
+from utils.baskets import basket_dict, basket_market_caps
+from utils.lineage import SourceTracker
+from utils.quality import quality_gate
+from utils.snapshot import snapshot_path, read_snapshot
+from utils.sheets import WorkbookPublisher
 
 
 # CONFIG
@@ -43,6 +38,18 @@ cloud_file_path = 'pages'
 DRIVE_FOLDER_ID = '1eKN2U172WEghWQWeWGfx7LKNiQk3eEBr'   
 REFERENCE_FILE_ID = '1MCtIa4w9FrTJ9p2FAkUFmygAXZh3YCt95RnFcjIlWg4'   
 REFERENCE_FILENAME = 'eoc-dashboard-stablecoin-24h-history' 
+block_rows = 366    # panel rows (days) processed at a time, bounds memory regardless of history length
+downsample_point_list = [500, 2000]    # point budgets for the -<n>pt chart files
+downsampled_sheet_list = ['full-time-history', 'mc-time-history', 'price-time-history', 'vol-time-history', 'supply-time-history', 'ssr-time-history']
+field_list = ['price', 'mc', 'vol']    # fields read from each coin history
+metric_list = ['price', 'mc', 'vol', 'supply', 'supply-24h-change', 'vol-24h-change']    # columns of each coin in the time histories
+sub_sheet_dict = {    # sheet: metrics it holds for every coin
+    'mc-time-history': ['mc'],
+    'price-time-history': ['price'],
+    'vol-time-history': ['vol', 'vol-24h-change'],
+    'supply-time-history': ['supply', 'supply-24h-change'],
+}
+last_row_col_list = ['date', 'price', 'mc', 'vol', 'supply', 'supply-24h-change', 'vol-24h-change', 'previous-supply', 'previous-vol']    # kept per coin for summary only refreshes
 summary_col_list = ['coin', 'price', 'mc', 'vol', 'date', 'supply', 'supply-24-change', 'vol-24h-change']
 crypto_path = 'data/coin_histories/coingecko_coin_history_24h_'
 crypto_list = [
@@ -63,169 +70,305 @@ crypto_list = [
 
 
 # FUNCTIONS
-def _output_to_cloud(input_dict):
-    """ Outputs the input data frame to google cloud. """
-
-    storage_client = storage.Client()    # initialize storage client
-    bucket = storage_client.bucket(bucket_name)
-
-    for sheet in input_dict.keys():
-
-        # Output to google cloud storage
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        file_name = 'eoc-dashboard-stablecoins-' + sheet + '.csv'
-        local_file = '/tmp/' + file_name
-        cloud_file = cloud_file_path + '/' + file_name
-        input_dict[sheet].to_csv(local_file, header=True, index=True)
-        blob = bucket.blob(cloud_file)
-        blob.upload_from_filename(local_file) 
-        print('updated google cloud file!')
-
-
-def _output_to_drive(input_dict):
-    """ Outputs the input data frame to google sheets on google drive. """
-
-    file_name = 'eoc-dashboard-stablecoin-24h-history.xlsx'    # prep local file
-    local_file = '/tmp/' + file_name
-    writer = pd.ExcelWriter(local_file, engine='xlsxwriter')
-    for sheet in list(input_dict.keys()):
-        input_dict[sheet].to_excel(writer, sheet_name=sheet)
-
-    last_updated_df = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})
-    last_updated_df.to_excel(writer, sheet_name='last_updated')    # add last updated sheet
-
-    writer.save()
-
-    csv = drive.CreateFile({'id': REFERENCE_FILE_ID, 'parents': [{'id': DRIVE_FOLDER_ID}], 'title': REFERENCE_FILENAME, 'mimeType': 'application/vnd.ms-excel'})
-    csv.SetContentFile(local_file)
-    csv.Upload({'convert': True})
-    print('updated google drive file!')
-
-
-def _calculate_ssr(df):
-    """ Takes full coin time history df in. Calculates the stablecoin supply ratio (SSR)
-    based on BTC MC / Total Stablecoin MC, then returns the original df with this time history
-    added as a new column. """
-
-    basket = [
-        'tether',
-        'usd-coin',
-        'dai',
-        'true-usd',    
-        'paxos-standard',    
-        'gemini-dollar',
-        'nusd'
-    ]
-
-    result_df = df.copy()
-    result_df['total-stablecoin-mc'] = 0
-
-    for stablecoin in basket:
-        df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_' + stablecoin + '.csv')
-        print(stablecoin)
-        print(df)
-
-    # for header in result_df.columns:    # sum up stablecoin market caps
-    #     if ("mc" in header) and ("bitcoin" not in header):
-    #         print('added: ', header)
-    #         result_df['total-stablecoin-mc'] = result_df['total-stablecoin-mc'] + result_df[header]
-    
-    # result_df['ssr'] = result_df['bitcoin-mc'] / result_df['total-stablecoin-mc']
-
-    return result_df
-
-
-def _format_time_history(coin_time_history_dict):
-    """ Takes in dictionary of coin time histories. Uses bitcoin (aka the one with the longest
-    running time history) to create a data frame that holds all coin 1 day time histories where
-    a null value is used for all rows where no data exists. Returns that data frame. """
-
-    df = pd.DataFrame(coin_time_history_dict['bitcoin'])
-    # df = df.rename(columns={'price(usd)': 'bitcoin', 'date': 'date'})
-
-    for coin, time_history in coin_time_history_dict.items():
-        if coin != 'bitcoin':
-            # time_history_for_df = time_history.rename(columns={'price(usd)': coin, 'date': 'date'})
-            df = pd.merge(df, time_history, on='date', how='left')
-   
+def _cloud_file(sheet):
+    return cloud_file_path + '/eoc-dashboard-stablecoins-' + sheet + '.csv'
+
+
+@timed('upload')
+def _output_summary_to_cloud(summary_df):
+    """ Outputs the summary of most recent values to google cloud. """
+
+    n_bytes = write_csv(summary_df, _cloud_file('summary'), header=True, index=True)
+    log_event('updated google cloud file!', file=_cloud_file('summary'), rows=len(summary_df), bytes=n_bytes)
+
+
+@timed('upload')
+def _output_results(sheet_blocks, make_summary):
+    """ Outputs the summary and the time history sheets to google cloud and google sheets in one
+    pass over the date blocks (a dict of sheet -> block per date block). Each block is computed
+    once and sent to every output as it comes: its sheet's cloud csv, the downsamplers, the google
+    sheet, and a local spool that the second downsample pass (and a full sheet upload, if one is
+    needed) reads back, so no sheet is ever held in memory whole. make_summary() is called after
+    the last block, once every coin's last row is known. """
+
+    publisher = WorkbookPublisher('/tmp/eoc-dashboard-stablecoin-24h-history.xlsx', REFERENCE_FILE_ID, DRIVE_FOLDER_ID, REFERENCE_FILENAME)
+    writers = {}
+    downsamplers = {}
+    with BlockSpool() as spool:
+        # Output the time histories block by block, collecting what the downsampled variants need
+        for blocks in sheet_blocks:
+            for sheet, block in blocks.items():
+                if sheet not in writers:
+                    writers[sheet] = ChunkedCsvWriter(_cloud_file(sheet), header=True, index=True)
+                    downsamplers[sheet] = [ChunkedDownsampler(n_points) for n_points in downsample_point_list] if sheet in downsampled_sheet_list else []
+                writers[sheet].write(block)
+                for downsampler in downsamplers[sheet]:
+                    downsampler.observe(block)
+                publisher.write(sheet, block)    # only the changed ranges are sent unless the layout changed
+                spool.write(sheet, block)
+
+        for sheet, writer in writers.items():
+            n_bytes = writer.close()
+            log_event('updated google cloud file!', file=_cloud_file(sheet), rows=writer.rows, bytes=n_bytes)
+
+        # Output summary to google cloud storage
+        summary_df = make_summary()
+        _output_summary_to_cloud(summary_df)
+
+        # Output chart-ready downsampled variants of the time histories next to them
+        for sheet in downsamplers:
+            if not downsamplers[sheet]:
+                continue
+            for block in spool.replay(sheet):
+                for downsampler in downsamplers[sheet]:
+                    downsampler.feed(block)
+            for n_points, downsampler in zip(downsample_point_list, downsamplers[sheet]):
+                df = downsampler.result()
+                cloud_file = cloud_file_path + '/' + downsampled_file_name('eoc-dashboard-stablecoins-' + sheet + '.csv', n_points)
+                n_bytes = write_csv(df, cloud_file, header=True, index=True)
+                log_event('updated google cloud file!', file=cloud_file, rows=len(df), bytes=n_bytes)
+
+        # Output the summary and last updated sheets to google sheets, and the whole workbook if a full upload is needed
+        last_updated_df = pd.DataFrame({'Last Updated': [datetime.datetime.utcnow()]})    # add last updated sheet
+        publisher.write('summary', summary_df)
+        publisher.write('last_updated', last_updated_df)
+        sheet_dict = {'summary': summary_df}
+        for sheet in writers:
+            sheet_dict[sheet] = lambda sheet=sheet: spool.replay(sheet)
+        sheet_dict['last_updated'] = last_updated_df
+        publisher.close(sheet_dict)
+
+
+def _calculate_ssr(panel):
+    """ Takes the aligned field panel in. Calculates the total stablecoin market cap (the
+    'total-stablecoin' basket in utils/baskets.py) and the stablecoin supply ratio (SSR)
+    based on BTC MC / Total Stablecoin MC on the bitcoin dates. Returns that time history. """
+
+    members = [coin for coin in basket_dict['total-stablecoin']['members'] if coin + '-mc' in panel.columns]
+    mc_panel = panel[[coin + '-mc' for coin in members]].set_axis(members, axis=1)
+    total_mc = basket_market_caps(mc_panel, {'total-stablecoin': basket_dict['total-stablecoin']})['total-stablecoin']
+
+    bitcoin_mc = panel['bitcoin-mc'].dropna()
+    total_mc = total_mc.reindex(bitcoin_mc.index)
+    df = pd.DataFrame({'bitcoin-mc': bitcoin_mc.values, 'date': bitcoin_mc.index.date, 'total-stablecoin-mc': total_mc.values})
+    df['ssr'] = df['bitcoin-mc'] / df['total-stablecoin-mc']
+
     return df
 
 
-def _create_sub_sheet(input_df, key_word):
-    """ Takes the full combined df of data for stablecoins in and separates out columns
-    containing the key word so they can be output into more focused sheets in the excel
-    files on the cloud and drive. Returns a dataframe of the subset of interest. """
+def _build_field_panel(source_dict):
+    """ Reads the price, market cap and volume history of each coin and aligns them into a
+    single (dates x coin-fields) panel. Only called when the cached panel is out of date. """
 
-    df = input_df.copy()
-    key_word_cols = [col for col in df.columns if key_word in col]
-    key_word_cols = key_word_cols + ['date']
-    df = df.loc[:, key_word_cols]
+    frames = []
+    for crypto, path in source_dict.items():
+        try:
+            with span('fetch', asset=crypto) as s:
+                frames.append(read_history_columns(path, {'price(usd)': crypto + '-price', 'market_cap(usd)': crypto + '-mc', 'volume(usd)': crypto + '-vol'}))    # make column names coin-specific
+                s.record(rows=len(frames[-1]))
 
-    return df
+        except Exception as e:
+            log_event('Error while loading and creating time hitories for for:  ' + crypto, severity='ERROR', asset=crypto, error=repr(e))
 
+    return build_panel(frames)
 
-def generate_stablecoin_page(event, context):    # FIXME: for google cloud function deployment
-# def generate_stablecoin_page():
-    """ Main run function that is called to pull stablecoin histories from clouds, compute useful metrics,
-    then output those metrics as tables and coin time histories to the cloud and drive for front end use. """
 
-    # GET DATA
-    history_dict = {}
-    most_recent_value_list = []
+def _to_long(block, crypto_list):
+    """ Takes a date block of the aligned field panel and returns it in long format: one row per
+    (date, coin) the coin has data for, with the date, coin, and field columns. """
 
-    # Load cryptos
-    for crypto in crypto_list:
-        
-        try:
-            crypto_df = pd.read_csv('gs://eoc-dashboard-bucket/data/coin_histories/coingecko_coin_history_24h_' + crypto + '.csv')    
+    values = block[[crypto + '-' + field for crypto in crypto_list for field in field_list]].to_numpy(dtype=np.float64)
+    values = values.reshape(len(block) * len(crypto_list), len(field_list))
+    df = pd.DataFrame(values, columns=field_list)
+    df.insert(0, 'date', np.repeat(block.index.values, len(crypto_list)))
+    df.insert(1, 'coin', pd.Categorical(np.tile(crypto_list, len(block)), categories=crypto_list))
 
-            crypto_df.columns = ['unix', crypto + '-price', crypto + '-mc', crypto + '-vol', 'utc']    # make column names coin-specific
-            crypto_df['date'] = pd.to_datetime(crypto_df['utc']).dt.date    # type cast to a datetime column
+    return df[~np.isnan(values).all(axis=1)].reset_index(drop=True)    # only each coin's own rows, so 24h changes never span a gap in the panel
 
-            crypto_df[crypto + '-supply'] = crypto_df[crypto + '-mc'] / crypto_df[crypto + '-price']    # add supply time history (mc / price)
-            crypto_df[crypto + '-supply_shift'] = crypto_df[crypto + '-supply'].shift(periods=1)   
-            crypto_df[crypto + '-supply-24h-change'] = (crypto_df[crypto + '-supply'] - crypto_df[crypto + '-supply_shift']) / crypto_df[crypto + '-supply_shift']    # calc 24h supply change
 
-            crypto_df[crypto + '-vol_shift'] = crypto_df[crypto + '-vol'].shift(periods=1)   
-            crypto_df[crypto + '-vol-24h-change'] = (crypto_df[crypto + '-vol'] - crypto_df[crypto + '-vol_shift']) / crypto_df[crypto + '-vol_shift']    # calc 24h volume change
+def _calculate_metrics(long_df, previous_df=None):
+    """ Takes the long format (date, coin) rows of a date block and returns them with the supply
+    and 24h change metrics of every coin added in one grouped pass. Changes are against each coin's
+    previous row with data, which for the first rows of the block comes from previous_df (the last
+    row of each coin so far). Returns (metrics, last row of each coin including this block). """
 
-            crypto_df = crypto_df.drop_duplicates(subset=['date'], keep="first")    # eliminate unnecessary columns
-            crypto_df.drop(crypto + '-supply_shift', axis=1, inplace=True)    
-            crypto_df.drop(crypto + '-vol_shift', axis=1, inplace=True)    
-            crypto_df.drop('unix', axis=1, inplace=True)   
-            crypto_df.drop('utc', axis=1, inplace=True)   
+    df = long_df.assign(supply=long_df['mc'] / long_df['price'])    # add supply time history (mc / price)
+    n_previous = 0
+    if previous_df is not None:
+        n_previous = len(previous_df)
+        df = pd.concat([previous_df[df.columns], df], ignore_index=True)
 
-            history_dict[crypto] = crypto_df 
-            most_recent_value_list.append([crypto] + crypto_df.iloc[len(crypto_df)-1].to_list())        
+    previous = df.groupby('coin', observed=True, sort=False)[['supply', 'vol']].shift(periods=1)    # rows stay in date order within each coin
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['supply-24h-change'] = (df['supply'] - previous['supply']) / previous['supply']    # calc 24h supply change
+        df['vol-24h-change'] = (df['vol'] - previous['vol']) / previous['vol']    # calc 24h volume change
+    df['previous-supply'] = previous['supply']
+    df['previous-vol'] = previous['vol']
 
-        except Exception as e:
-            print('Error while loading and creating time hitories for for:  ' + crypto)
-            print(e)
+    last_df = df.groupby('coin', observed=True, sort=False).tail(1)
+    return df.iloc[n_previous:], last_df
 
-    # Combine into single time history df
-    most_recent_data_df = pd.DataFrame(most_recent_value_list, columns=summary_col_list)
-    combined_df = _format_time_history(history_dict)
 
-    # Add all pages to be output for stablecoins
-    stablecoin_page_dict = {}
+def _pivot_metrics(metrics_df, crypto_list, dates):
+    """ Pivots long format metrics to one row per date and one column per coin metric
+    (coin-metric, coins in crypto_list order, each with the metric_list columns), null for all
+    rows where a coin has no data. """
 
-    # Add summary sheet for most recent data on each coin
-    stablecoin_page_dict['summary'] = most_recent_data_df
+    df = metrics_df.set_index(['date', 'coin'])[metric_list].unstack('coin').swaplevel(axis=1)
+    df = df.reindex(index=dates, columns=pd.MultiIndex.from_product([crypto_list, metric_list]))
+    df.columns = [crypto + '-' + metric for crypto, metric in df.columns]
+    return df
 
-    # Add time histories 
-    stablecoin_page_dict['full-time-history'] = combined_df    # full time history for all stables, all values
-    stablecoin_page_dict['mc-time-history'] = _create_sub_sheet(combined_df, 'mc')    # market cap only
-    stablecoin_page_dict['price-time-history'] = _create_sub_sheet(combined_df, 'price')    # price only
-    stablecoin_page_dict['vol-time-history'] = _create_sub_sheet(combined_df, 'vol')    # volume only
-    stablecoin_page_dict['supply-time-history'] = _create_sub_sheet(combined_df, 'supply')    # supply only
 
-    # Calculate and add total MC, SSR FIXM: add SSR oscillator?
-    # full_df = _calculate_ssr(combined_df)    
+def _time_history_blocks(panel, crypto_list, last_row_dict):
+    """ Takes the aligned field panel and yields (panel block, time history block) one date block
+    at a time. Uses bitcoin (aka the one with the longest running time history) dates for the rows
+    of the time history, which holds every coin's 1 day metrics with a null value for all rows
+    where no data exists. last_row_dict['last'] holds the last row of each coin so far. """
+
+    offset = 0
+    for start in range(0, len(panel), block_rows):
+        block = panel.iloc[start:start + block_rows]
+        metrics_df, last_row_dict['last'] = _calculate_metrics(_to_long(block, crypto_list), last_row_dict.get('last'))
+
+        dates = block.index[block[['bitcoin-' + field for field in field_list]].notna().any(axis=1).to_numpy()]
+        df = _pivot_metrics(metrics_df, crypto_list, dates).reset_index(drop=True)
+        df.index = df.index + offset
+        df.insert(3, 'date', dates.date)    # keep date right after the bitcoin price, mc and vol columns
+        offset = offset + len(df)
+        yield block, df
+
+
+def _apply_snapshot(last_df, snapshot_df):
+    """ Takes each coin's last row with data (long format) and returns it with the price, mc
+    and vol (and so the supply and 24h changes) taken from the market snapshot where it is newer.
+    A snapshot from the same day as the last row replaces that row, so its changes are against
+    the row before, otherwise they are against the last row. """
+
+    df = last_df.reset_index(drop=True)
+    snapshot = snapshot_df.reindex(df['coin'].astype(str))
+    snapshot_time = pd.to_datetime(snapshot['utc']).to_numpy(dtype='datetime64[ns]')
+    last_time = df['date'].to_numpy(dtype='datetime64[ns]')
+    newer = snapshot_time > last_time
+    same_day = snapshot_time.astype('datetime64[D]') == last_time.astype('datetime64[D]')
+
+    price = snapshot['price(usd)'].to_numpy(dtype=np.float64)
+    mc = snapshot['market_cap(usd)'].to_numpy(dtype=np.float64)
+    vol = snapshot['volume(usd)'].to_numpy(dtype=np.float64)
+    previous_supply = np.where(same_day, df['previous-supply'], df['supply'])
+    previous_vol = np.where(same_day, df['previous-vol'], df['vol'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        supply = mc / price
+        update_dict = {
+            'date': snapshot_time,
+            'price': price,
+            'mc': mc,
+            'vol': vol,
+            'supply': supply,
+            'supply-24h-change': (supply - previous_supply) / previous_supply,
+            'vol-24h-change': (vol - previous_vol) / previous_vol,
+            'previous-supply': previous_supply,
+            'previous-vol': previous_vol,
+        }
+    return df.assign(**{column: np.where(newer, values, df[column].to_numpy()) for column, values in update_dict.items()})
+
+
+def _format_summary(last_df):
+    """ Takes each coin's last row (long format) and returns the summary sheet. """
+
+    df = last_df.sort_values('coin').reset_index(drop=True)
+    df = df.assign(coin=df['coin'].astype(str), date=pd.to_datetime(df['date']).dt.date)
+    return df[['coin', 'price', 'mc', 'vol', 'date'] + metric_list[3:]].set_axis(summary_col_list, axis=1)
+
+
+def _stored_last_rows(tracker, source_dict):
+    """ Returns each coin's last row as stored by the previous full run (long format), or None
+    if any coin's history changed or has no stored row. """
+
+    row_list = []
+    for crypto, path in source_dict.items():
+        row = tracker.asset_result(crypto, [path])
+        if row is None:
+            return None
+        row_list.append(dict(row, coin=crypto))
+    df = pd.DataFrame(row_list)
+    return df.assign(date=pd.to_datetime(df['date']), coin=pd.Categorical(df['coin'], categories=list(source_dict)))
+
+
+def _create_sub_sheet(input_df, crypto_list, metrics):
+    """ Takes a date block of the combined df of data for stablecoins in and separates out the
+    columns of the input metrics of every coin so they can be output into more focused sheets in
+    the excel files on the cloud and drive. Returns a dataframe of the subset of interest. The
+    columns are spread across the block, so pandas copies them (it can't return a view), but
+    only ever for one block of block_rows rows. """
+
+    return input_df.loc[:, [crypto + '-' + metric for crypto in crypto_list for metric in metrics] + ['date']]
+
+
+def _sheet_blocks(panel, crypto_list, last_row_dict):
+    """ Yields the time history sheets (sheet name -> block of rows) of the page one date block
+    at a time: the full time history, its mc / price / vol / supply sub sheets, and the total
+    stablecoin MC and SSR. """
+
+    ssr_offset = 0
+    for block, df in _time_history_blocks(panel, crypto_list, last_row_dict):
+        sheets = {'full-time-history': df}    # full time history for all stables, all values
+        for sheet, metrics in sub_sheet_dict.items():
+            sheets[sheet] = _create_sub_sheet(df, crypto_list, metrics)    # market cap, price, volume, supply only
+
+        ssr_df = _calculate_ssr(block)    # add total stablecoin MC and SSR (FIXME: add SSR oscillator?)
+        ssr_df.index = ssr_df.index + ssr_offset
+        ssr_offset = ssr_offset + len(ssr_df)
+        sheets['ssr-time-history'] = ssr_df
+        yield sheets
+
+
+@entry_point('generate_stablecoin_page')
+def generate_stablecoin_page(event, context):    # FIXME: for google cloud function deployment
+# def generate_stablecoin_page():
+    """ Main run function that is called to pull stablecoin histories from clouds, compute useful metrics,
+    then output those metrics as tables and coin time histories to the cloud and drive for front end use. """
+
+    # GET DATA
+    # Skip the run entirely if no coin history changed since the outputs were built
+    tracker = SourceTracker(get_storage(), 'stablecoins')
+    source_dict = {crypto: crypto_path + crypto + '.csv' for crypto in crypto_list}
+    passing_list = quality_gate(list(source_dict.values()))
+    if source_dict['bitcoin'] not in passing_list:    # every time history is laid out on the bitcoin dates
+        log_event('Bitcoin history failed quality checks, stablecoin outputs were not rebuilt.', severity='WARNING')
+        return
+    source_dict = {crypto: path for crypto, path in source_dict.items() if path in passing_list}    # leave out histories that failed the quality checks
+    changed_list = tracker.changed(list(source_dict.values()) + [snapshot_path])
+    if not changed_list:
+        log_event('No coin histories or market snapshot changed since the last run, stablecoin outputs are up to date.')
+        return
+    snapshot_df = read_snapshot()
+
+    # Only the market snapshot changed: refresh the summary from the stored last rows, the time histories are up to date
+    if changed_list == [snapshot_path]:
+        last_df = _stored_last_rows(tracker, source_dict)
+        if last_df is not None:
+            _output_summary_to_cloud(_format_summary(_apply_snapshot(last_df, snapshot_df)))    # google sheets are refreshed with the histories
+            tracker.commit()
+            return
+
+    # Load cryptos (memory-mapped from the panel cache when a warm instance already built it)
+    with span('transform', assets=len(source_dict)) as s:
+        panel = load_panel('stablecoins-fields', tracker.generations(list(source_dict.values())), lambda: _build_field_panel(source_dict), [crypto + '-' + field for crypto in source_dict for field in field_list])
+        s.record(rows=len(panel), columns=len(panel.columns))
+
+    # Build the time histories one date block at a time, each block going to every output once it is computed
+    crypto_list_found = [crypto for crypto in crypto_list if crypto + '-price' in panel.columns]
+    last_row_dict = {}
+
+    def make_summary():    # add summary sheet for most recent data on each coin
+        for row in last_row_dict['last'].to_dict('records'):    # for summary only refreshes
+            tracker.set_asset_result(str(row['coin']), [source_dict[str(row['coin'])]], dict({column: float(row[column]) for column in last_row_col_list[1:]}, date=str(row['date'])))
+        return _format_summary(_apply_snapshot(last_row_dict['last'], snapshot_df))
 
     # Output results
-    _output_to_cloud(stablecoin_page_dict)    # FIXME
-    _output_to_drive(stablecoin_page_dict)
+    _output_results(_sheet_blocks(panel, crypto_list_found, last_row_dict), make_summary)
+    tracker.commit()
 
 
 # ENTRY POINT
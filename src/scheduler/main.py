@@ -0,0 +1,257 @@
+###############################################################################
+# FILENAME: main.py
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE CREATED: 19-October-2026
+# DESCRIPTION: Long-running alternative to deploying every collector and page
+# as its own cold-start cloud function. One asyncio process imports each entry
+# module once and runs the (unchanged) entry points on cron-like schedules,
+# so module level clients, secrets, the drive client, the storage mirror, and
+# the memory-mapped panel caches all stay warm between runs. Each job has a
+# concurrency limit (overlapping runs are skipped) and a timeout, and run
+# timings are logged and served as json on GET /jobs.
+#
+# Usage: python src/scheduler/main.py [--run-now] [--port 8081]
+###############################################################################
+import os
+import sys
+import time
+import asyncio
+import argparse
+import datetime
+import importlib.util
+
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))    # enable imports from src directory
+from utils.instrumentation import log_event
+
+
+# CONFIG
+src_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+host = '0.0.0.0'
+port = int(os.environ.get('EOC_SCHEDULER_PORT', 8081))
+max_concurrent_jobs = 4    # jobs running at once across the whole process
+job_list = [    # schedules are cron expressions in utc: minute hour day-of-month month day-of-week (0 = sunday)
+    {'name': 'coingecko', 'module': 'data/coingecko/main.py', 'entry_point': 'coingecko_coin_history_daily', 'schedule': '15 0 * * *', 'timeout_seconds': 1800},
+    {'name': 'coingecko_snapshot', 'module': 'data/coingecko/main.py', 'entry_point': 'coingecko_markets_snapshot', 'schedule': '*/15 * * * *', 'timeout_seconds': 120},    # latest values only, a single request
+    {'name': 'financialmodelingprep', 'module': 'data/financialmodelingprep/main.py', 'entry_point': 'fmp_stock_history_daily', 'schedule': '30 22 * * 1-5', 'timeout_seconds': 900},
+    {'name': 'quality', 'module': 'data/quality/main.py', 'entry_point': 'validate_histories_daily', 'schedule': '45 0,23 * * *', 'timeout_seconds': 600},    # after the collectors
+    {'name': 'ath', 'module': 'pages/ath/main.py', 'entry_point': 'generate_ath_page', 'schedule': '0 * * * *', 'timeout_seconds': 600},
+    {'name': 'compare_time_history', 'module': 'pages/compare_time_history/main.py', 'entry_point': 'generate_time_history_comparison_files', 'schedule': '0 * * * *', 'timeout_seconds': 600},
+    {'name': 'correlation', 'module': 'pages/correlation/main.py', 'entry_point': 'generate_correlation_page', 'schedule': '5 * * * *', 'timeout_seconds': 900},
+    {'name': 'risk', 'module': 'pages/risk/main.py', 'entry_point': 'generate_risk_page', 'schedule': '5 * * * *', 'timeout_seconds': 600},
+    {'name': 'stablecoins', 'module': 'pages/stablecoins/main.py', 'entry_point': 'generate_stablecoin_page', 'schedule': '0 * * * *', 'timeout_seconds': 600},
+    {'name': 'baskets', 'module': 'pages/baskets/main.py', 'entry_point': 'generate_baskets_page', 'schedule': '0 * * * *', 'timeout_seconds': 600},
+    {'name': 'anomalies', 'module': 'pages/anomalies/main.py', 'entry_point': 'generate_anomaly_page', 'schedule': '10 * * * *', 'timeout_seconds': 600},    # after ath
+]
+cron_field_ranges = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+# SCHEDULES
+class CronSchedule:
+    """ Minimal cron expression ('*', '*/n', 'a-b', 'a-b/n', and comma separated lists in each
+    of the five fields). As in cron, when both day-of-month and day-of-week are restricted a
+    day matching either one fires. """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('Cron expression needs 5 fields: ' + expression)
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [self._parse(field, lo, hi) for field, (lo, hi) in zip(fields, cron_field_ranges)]
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, lo, hi):
+        values = set()
+        for part in field.split(','):
+            value_range, step = (part.split('/') + ['1'])[:2]
+            if value_range == '*':
+                start, end = lo, hi
+            elif '-' in value_range:
+                start, end = [int(v) for v in value_range.split('-')]
+            else:
+                start = end = int(value_range)
+                if '/' in part:
+                    end = hi
+            if start < lo or end > hi or start > end:
+                raise ValueError('Cron field out of range: ' + field)
+            values.update(range(start, end + 1, int(step)))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays    # cron counts from sunday = 0
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """ Returns the first matching minute strictly after the input (naive utc) datetime,
+        skipping whole months / days / hours that can't match. """
+
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment = moment + datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError('Cron expression never fires: ' + self.expression)
+
+
+# JOBS
+class Job:
+    """ A scheduled entry point. The module is imported once and kept, so everything it
+    caches at module level survives between runs. """
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.config = config
+        self.schedule = CronSchedule(config['schedule'])
+        self.timeout = config.get('timeout_seconds', 600)
+        self.slots = asyncio.Semaphore(config.get('max_concurrency', 1))
+        self.func = None
+        self.next_run = None
+        self.stats = {'runs': 0, 'ok': 0, 'errors': 0, 'timeouts': 0, 'skipped': 0, 'running': 0,
+                      'last_status': None, 'last_started': None, 'last_duration_ms': None,
+                      'mean_duration_ms': None, 'max_duration_ms': None}
+
+    def load(self):
+        """ Imports the entry module from its directory and returns its entry point. """
+
+        if self.func is None:
+            module_path = os.path.abspath(os.path.join(src_directory, self.config['module']))
+            sys.path.insert(0, os.path.dirname(module_path))    # pages import their own config modules
+            spec = importlib.util.spec_from_file_location('eoc_job_' + self.name, module_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self.func = getattr(module, self.config['entry_point'])
+        return self.func
+
+    def _record(self, status, duration_ms):
+        stats = self.stats
+        completed = stats['ok'] + stats['errors'] + stats['timeouts']
+        stats['last_status'] = status
+        stats['last_duration_ms'] = duration_ms
+        stats['max_duration_ms'] = max(stats['max_duration_ms'] or 0, duration_ms)
+        stats['mean_duration_ms'] = round(((stats['mean_duration_ms'] or 0) * completed + duration_ms) / (completed + 1), 3)
+        stats[{'ok': 'ok', 'error': 'errors', 'timeout': 'timeouts'}[status]] += 1
+
+    async def run(self, global_slots, trigger='schedule'):
+        """ Runs the entry point in a worker thread unless the job already has max_concurrency
+        runs in flight. A run that exceeds the timeout is reported as timed out; its thread can't
+        be interrupted, so its slot is only freed once it actually returns. """
+
+        if self.slots.locked():
+            self.stats['skipped'] += 1
+            log_event('Skipped job run, previous run still in progress', severity='WARNING', job=self.name, trigger=trigger)
+            return
+
+        await self.slots.acquire()
+        await global_slots.acquire()
+        self.stats['runs'] += 1
+        self.stats['running'] += 1
+        self.stats['last_started'] = datetime.datetime.utcnow().isoformat()
+        start = time.perf_counter()
+
+        event = {'attributes': dict(self.config.get('attributes', {})), 'trigger': trigger}
+        func = self.load()
+        future = asyncio.ensure_future(asyncio.to_thread(func, event, None))
+
+        def _release(_):
+            self.stats['running'] -= 1
+            self.slots.release()
+            global_slots.release()
+        future.add_done_callback(_release)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+            status, error = 'ok', None
+        except asyncio.TimeoutError:
+            status, error = 'timeout', 'exceeded {} seconds'.format(self.timeout)
+        except Exception as e:
+            status, error = 'error', repr(e)
+
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        self._record(status, duration_ms)
+        log_event('job ' + status, severity='INFO' if status == 'ok' else 'ERROR', job=self.name, trigger=trigger, duration_ms=duration_ms, error=error)
+
+
+class Scheduler:
+    """ Runs every job on its schedule until cancelled. """
+
+    def __init__(self, configs=None, max_concurrent=max_concurrent_jobs):
+        self.jobs = {config['name']: Job(config) for config in (configs if configs is not None else job_list)}
+        self.max_concurrent = max_concurrent
+        self.global_slots = None
+        self.tasks = set()
+
+    def _start(self, job, trigger):
+        task = asyncio.ensure_future(job.run(self.global_slots, trigger=trigger))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _loop(self, job):
+        while True:
+            now = datetime.datetime.utcnow()
+            job.next_run = job.schedule.next_after(now)
+            await asyncio.sleep((job.next_run - now).total_seconds())
+            self._start(job, 'schedule')
+
+    async def run(self, run_now=False):
+        """ Imports every job up front (so import errors show at startup, not at the first
+        trigger), optionally runs them all once, then follows the schedules. """
+
+        self.global_slots = asyncio.Semaphore(self.max_concurrent)
+        for job in self.jobs.values():
+            job.load()
+        log_event('Scheduler started', jobs={name: job.schedule.expression for name, job in self.jobs.items()})
+        if run_now:
+            for job in self.jobs.values():
+                self._start(job, 'startup')
+        await asyncio.gather(*[self._loop(job) for job in self.jobs.values()])
+
+    def status(self):
+        """ Returns the schedule and run timings of every job. """
+
+        return {name: dict(job.stats, schedule=job.schedule.expression, timeout_seconds=job.timeout,
+                           next_run=job.next_run.isoformat() if job.next_run else None) for name, job in self.jobs.items()}
+
+
+async def handle_jobs(request):
+    """ GET /jobs -> schedule, run counts, and timings of every job. """
+    return web.json_response(request.app['scheduler'].status())
+
+
+async def main(run_now=False, status_port=port):
+    """ Starts the status endpoint and runs the scheduler until interrupted. """
+
+    scheduler = Scheduler()
+    app = web.Application()
+    app['scheduler'] = scheduler
+    app.router.add_get('/jobs', handle_jobs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, status_port).start()
+    try:
+        await scheduler.run(run_now=run_now)
+    finally:
+        await runner.cleanup()
+
+
+# ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='EOC dashboard engine scheduler')
+    parser.add_argument('--run-now', action='store_true', help='run every job once at startup')
+    parser.add_argument('--port', type=int, default=port, help='port for the GET /jobs status endpoint')
+    args = parser.parse_args()
+    asyncio.run(main(run_now=args.run_now, status_port=args.port))
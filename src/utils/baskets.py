@@ -0,0 +1,177 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: baskets.py
+# DESCRIPTION: Declarative basket / index engine. Each basket in basket_dict
+# lists its members, a weighting ('market_cap' or 'equal') and a rebalance
+# frequency, and every basket is computed at once from the aligned
+# (dates x coins) price and market cap panels with matrix operations: one
+# (dates x baskets x coins) weight tensor, one chain-linked level series per
+# basket, and one membership matmul for the basket market caps. Levels can be
+# extended incrementally from a saved state (last level and units held per
+# basket) so a daily run only computes the new rows.
+###############################################################################
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# CONFIG
+default_base = 100    # index level on each basket's first day
+rebalance_period_dict = {'daily': None, 'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}    # rebalance at the close of the first day of each period
+basket_dict = {
+    'total-stablecoin': {
+        'members': ['tether', 'usd-coin', 'binance-usd', 'dai', 'frax', 'true-usd', 'paxos-standard'],
+        'weighting': 'market_cap',
+        'rebalance': 'daily',
+    },
+    'defi': {
+        'members': ['aave', 'uniswap', 'sushi'],
+        'weighting': 'market_cap',
+        'rebalance': 'monthly',
+    },
+    'layer-1': {
+        'members': ['ethereum', 'binancecoin', 'cardano', 'solana', 'avalanche-2', 'polkadot'],
+        'weighting': 'market_cap',
+        'rebalance': 'monthly',
+    },
+    'layer-1-equal': {
+        'members': ['ethereum', 'binancecoin', 'cardano', 'solana', 'avalanche-2', 'polkadot'],
+        'weighting': 'equal',
+        'rebalance': 'quarterly',
+    },
+}
+
+
+# FUNCTIONS
+def basket_members(baskets=None):
+    """ Returns every coin used by the input baskets (default basket_dict), in first seen order. """
+
+    baskets = basket_dict if baskets is None else baskets
+    members = []
+    for basket in baskets.values():
+        members = members + [member for member in basket['members'] if member not in members]
+    return members
+
+
+def config_hash(baskets=None):
+    """ Short hash of the basket definitions. A saved state is only reused for the same definitions. """
+
+    baskets = basket_dict if baskets is None else baskets
+    return hashlib.sha1(json.dumps(baskets, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def membership_matrix(baskets, assets):
+    """ Returns the (baskets x assets) 0/1 membership matrix. """
+
+    return np.array([[1.0 if asset in basket['members'] else 0.0 for asset in assets] for basket in baskets.values()])
+
+
+def rebalance_mask(dates, baskets):
+    """ Returns the (dates x baskets) mask of rebalance days: every day for daily baskets,
+    otherwise the first day of each week / month / quarter. Only looks back, so the mask of a
+    date never changes when later dates are added (required for incremental updates). """
+
+    mask = np.ones((len(dates), len(baskets)), dtype=bool)
+    for column, basket in enumerate(baskets.values()):
+        period = rebalance_period_dict[basket['rebalance']]
+        if period is not None:
+            periods = dates.to_period(period)
+            mask[1:, column] = periods[1:] != periods[:-1]
+    return mask
+
+
+def basket_market_caps(mc_panel, baskets=None):
+    """ Returns the (dates x baskets) total market cap of each basket's members as one matmul
+    over the (dates x coins) market cap panel. Null on days no member has a market cap. """
+
+    baskets = basket_dict if baskets is None else baskets
+    values = mc_panel.to_numpy(dtype=np.float64)
+    membership = membership_matrix(baskets, list(mc_panel.columns))
+    totals = np.nan_to_num(values) @ membership.T
+    has_data = (~np.isnan(values)).astype(np.float64) @ membership.T > 0
+    return pd.DataFrame(np.where(has_data, totals, np.nan), index=mc_panel.index, columns=list(baskets))
+
+
+def compute_baskets(price_panel, mc_panel, baskets=None, state=None, base=default_base):
+    """ Computes the level of every basket over the aligned (dates x coins) price and market
+    cap panels (same index and columns). Between rebalances each basket holds fixed units of its
+    members, on rebalance days the units are reset to the target weights (market cap share or
+    1 / n of the members with data that day), so level_t = sum(units * price_t).
+
+    Without a state every basket starts at base on the first day any member has data. With a
+    state (from a previous call) the first row of the panels must be the state's date: the
+    baskets continue from the saved levels and units and only the following rows are new.
+
+    Returns (levels_df, weights_df, state) where weights_df holds each basket's current
+    (drifted) weights and state is a json serializable dict for the next incremental call. """
+
+    baskets = basket_dict if baskets is None else baskets
+    assets = list(price_panel.columns)
+    membership = membership_matrix(baskets, assets).astype(bool)    # (baskets x assets)
+
+    prices = price_panel.ffill().to_numpy(dtype=np.float64)    # (dates x assets)
+    market_caps = mc_panel[assets].ffill().to_numpy(dtype=np.float64)
+    has_price = ~np.isnan(prices)
+    prices = np.where(has_price, prices, 1.0)    # unlisted members always have zero weight
+
+    # Target weights for every day, basket, and member (dates x baskets x assets)
+    equal = np.array([basket['weighting'] == 'equal' for basket in baskets.values()])
+    size = np.where(equal[None, :, None], 1.0, np.nan_to_num(market_caps)[:, None, :])
+    eligible = membership[None, :, :] & has_price[:, None, :] & (equal[None, :, None] | ~np.isnan(market_caps)[:, None, :])
+    raw = np.where(eligible, size, 0.0)
+    total = raw.sum(axis=2, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = np.where(total > 0, raw / total, 0.0)
+
+    # Rebalance days, including each basket's first day with data
+    started = total[:, :, 0] > 0
+    rebalance = rebalance_mask(price_panel.index, baskets)
+    rebalance[1:] = rebalance[1:] | (started[1:] & ~started[:-1])
+    rebalance[0] = True
+    start_levels = np.full(len(baskets), float(base))
+
+    # Continue from the saved state (baskets that had not started yet start fresh)
+    if state is not None:
+        saved = [name in state['levels'] and state['levels'][name] is not None for name in baskets]
+        for column, name in enumerate(baskets):
+            if saved[column]:
+                units = np.array([state['units'][name].get(asset, 0.0) for asset in assets])
+                start_levels[column] = state['levels'][name]
+                weights[0, column] = units * prices[0] / state['levels'][name]    # drifted weights on the state date
+                started[0, column] = True
+
+    # Each day is valued with the weights of the last rebalance before it (its anchor)
+    days = np.arange(len(prices))
+    last_rebalance = np.maximum.accumulate(np.where(rebalance, days[:, None], 0), axis=0)    # (dates x baskets)
+    anchor = np.concatenate([np.zeros((1, len(baskets)), dtype=np.int64), last_rebalance[:-1]])
+    anchor_weights = weights[anchor, np.arange(len(baskets))[None, :]]    # (dates x baskets x assets)
+    anchor_prices = prices[anchor]
+    previous_prices = np.concatenate([prices[:1], prices[:-1]])
+
+    numerator = np.einsum('tba,tba->tb', anchor_weights, prices[:, None, :] / anchor_prices)
+    denominator = np.einsum('tba,tba->tb', anchor_weights, previous_prices[:, None, :] / anchor_prices)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily_ratio = np.where(denominator > 0, numerator / denominator, 1.0)
+    daily_ratio[0] = 1.0
+    levels = start_levels[None, :] * np.cumprod(daily_ratio, axis=0)
+    levels = np.where(np.maximum.accumulate(started, axis=0), levels, np.nan)    # no level before a basket's first day
+
+    # Units held after the last row, and the current (drifted) weights
+    end_anchor = last_rebalance[-1]
+    units = weights[end_anchor, np.arange(len(baskets))] * levels[end_anchor, np.arange(len(baskets))][:, None] / prices[end_anchor]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        current_weights = units * prices[-1][None, :] / levels[-1][:, None]
+
+    levels_df = pd.DataFrame(levels, index=price_panel.index, columns=list(baskets))
+    weights_df = pd.DataFrame(np.where(membership, current_weights, np.nan), index=list(baskets), columns=assets)
+    state = {
+        'date': str(price_panel.index[-1].date()),
+        'config': config_hash(baskets),
+        'levels': {name: (None if np.isnan(levels[-1, column]) else float(levels[-1, column])) for column, name in enumerate(baskets)},
+        'units': {name: {asset: float(units[column, a]) for a, asset in enumerate(assets) if membership[column, a] and units[column, a] > 0} for column, name in enumerate(baskets)},
+    }
+
+    return levels_df, weights_df, state
@@ -0,0 +1,85 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: credentials.py
+# DESCRIPTION: Lazily created secret manager and google drive clients. The
+# secret manager, pydrive and oauth2client stacks are only imported (and the
+# service account only authenticated) the first time a function that needs
+# them is called, then reused for the life of the (warm) instance, so pages
+# and collectors don't pay for them at import time or on runs that skip the
+# drive upload.
+###############################################################################
+import os
+import json
+
+
+# CONFIG
+SCOPES = ['https://www.googleapis.com/auth/drive']
+project_id = "eoc-dashboard-352623"
+service_account_secret_name = "EOC_DASHBOARD_SERVICE_ACCT_KEY_JSON"
+
+_secrets = {}    # secret name -> value
+_drive = None
+_service_credentials = None
+
+
+# FUNCTIONS
+def get_secret(secret_name):
+    """ Returns the latest version of the secret from google secret manager (cached). An
+    environment variable with the secret's name takes precedence (dev / offline replays). """
+
+    if secret_name in os.environ:
+        return os.environ[secret_name]
+    if secret_name not in _secrets:
+        from google.cloud import secretmanager    # deferred, heavy grpc import
+        client = secretmanager.SecretManagerServiceClient()
+        request = {"name": f"projects/{project_id}/secrets/{secret_name}/versions/latest"}
+        response = client.access_secret_version(request)
+        _secrets[secret_name] = response.payload.data.decode("UTF-8")
+    return _secrets[secret_name]
+
+
+def get_drive():
+    """ Returns the pydrive google drive API instance, authenticated with the dashboard
+    service account key stored in secret manager (created on first use). """
+
+    global _drive
+    if _drive is None:
+        from pydrive.auth import GoogleAuth    # deferred, only the drive upload paths need these
+        from pydrive.drive import GoogleDrive
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        gauth = GoogleAuth()    # pydrive library helper class for authenticating
+        credentials_json = json.loads(get_secret(service_account_secret_name))
+        gauth.credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)
+        _drive = GoogleDrive(gauth)    # this creates the google drive API instance... correct creds must already be contained in gauth
+    return _drive
+
+
+def get_access_token():
+    """ Returns an oauth access token for the dashboard service account (drive scope, which also
+    covers the sheets api), refreshed by oauth2client when it expires. EOC_SHEETS_TOKEN takes
+    precedence (e.g. for a local fake sheets endpoint). """
+
+    global _service_credentials
+    if 'EOC_SHEETS_TOKEN' in os.environ:
+        return os.environ['EOC_SHEETS_TOKEN']
+    if _service_credentials is None:
+        from oauth2client.service_account import ServiceAccountCredentials    # deferred, see get_drive
+        credentials_json = json.loads(get_secret(service_account_secret_name))
+        _service_credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_json, SCOPES)
+    return _service_credentials.get_access_token().access_token
+
+
+def upload_to_drive(local_file, file_id, folder_id, title):
+    """ Uploads the local excel file over the existing drive file, converted to a google sheet.
+    With file_id None a new sheet is created in the folder. Returns the drive file id. """
+
+    metadata = {'parents': [{'id': folder_id}], 'title': title, 'mimeType': 'application/vnd.ms-excel'}
+    if file_id is not None:
+        metadata['id'] = file_id
+    csv = get_drive().CreateFile(metadata)
+    csv.SetContentFile(local_file)
+    csv.Upload({'convert': True})
+    return csv['id']
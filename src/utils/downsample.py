@@ -0,0 +1,228 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: downsample.py
+# DESCRIPTION: Shape preserving downsampling of time history outputs for the
+# front end charts. Runs Largest-Triangle-Three-Buckets (LTTB) over every
+# series of a frame at once (one numpy pass per bucket across all columns),
+# picking one set of rows for all of them so the result still shares a single
+# date column.
+###############################################################################
+import numpy as np
+import pandas as pd
+
+
+# FUNCTIONS
+def lttb_indices(x, values, n_out):
+    """ Returns the n_out row indices Largest-Triangle-Three-Buckets keeps for the columns of
+    values (a T x k float array without nulls) against the shared x (T,). Each bucket picks
+    the row with the largest triangle area summed over all series (each scaled to its own
+    range first), so a single set of rows preserves the shape of every series. With one
+    column this is plain LTTB. """
+
+    n_rows, n_series = values.shape
+    if n_out >= n_rows or n_out < 3:
+        return np.arange(n_rows)
+
+    spread = values.max(axis=0) - values.min(axis=0)
+    values = (values - values.min(axis=0)) / np.where(spread > 0, spread, 1.0)    # so no single series dominates the sum
+    x = (x - x[0]) / max(x[-1] - x[0], 1.0)
+
+    edges = (np.arange(n_out - 1) * (n_rows - 2) / (n_out - 2)).astype(np.int64) + 1    # bucket boundaries, first and last points excluded
+    edges[-1] = n_rows - 1
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n_rows - 1
+
+    a = 0    # previously selected row
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n_rows
+        next_x = x[hi:next_hi].mean()    # average point of the next bucket
+        next_y = values[hi:next_hi].mean(axis=0)
+
+        area = np.abs((x[a] - next_x) * (values[lo:hi] - values[a]) - (x[a] - x[lo:hi, None]) * (next_y - values[a]))    # (bucket rows x series)
+        a = lo + area.sum(axis=1).argmax()
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_frame(df, n_out, x_column='date', columns=None):
+    """ Returns the rows of the input frame LTTB keeps for its numeric columns (or the
+    input columns) at the n_out point budget, in their original order. Each series'
+    first and last valid rows are kept as well so lines start and end where the full
+    resolution ones do. """
+
+    if len(df) <= n_out:
+        return df
+
+    x_values = df[x_column] if x_column in df.columns else df.index.to_series()
+    x = pd.to_datetime(x_values).values.astype('datetime64[D]').astype(np.float64)
+    if columns is None:
+        columns = [col for col in df.select_dtypes(include='number').columns if col != x_column]
+    values = df[columns].ffill().bfill().to_numpy(dtype=np.float64)    # gaps don't win buckets
+    values = np.nan_to_num(values)
+
+    keep = np.unique(lttb_indices(x, values, n_out))
+    valid = df[columns].notna().to_numpy()
+    has_data = valid.any(axis=0)
+    first = valid.argmax(axis=0)[has_data]
+    last = (len(df) - 1 - valid[::-1].argmax(axis=0))[has_data]
+    keep = np.union1d(keep, np.concatenate([first, last]))
+
+    return df.iloc[keep]
+
+
+def downsampled_file_name(file_name, n_out):
+    """ e.g. eoc-dashboard-time-history-comparison.csv -> eoc-dashboard-time-history-comparison-500pt.csv """
+    root, ext = file_name.rsplit('.', 1)
+    return '{}-{}pt.{}'.format(root, n_out, ext)
+
+
+class ChunkedDownsampler:
+    """ downsample_frame for a frame that is only ever seen in row blocks, keeping memory
+    bounded by the point budget and a couple of buckets instead of the whole frame. Needs two
+    passes over the same blocks: observe() each block first (row count, x range, and each
+    series' range and first / last valid rows), then feed() each block again. result()
+    returns the same rows downsample_frame would for the concatenated blocks (which must have
+    a unique, increasing index, e.g. running row numbers). """
+
+    def __init__(self, n_out, x_column='date', columns=None):
+        self.n_out = n_out
+        self.x_column = x_column
+        self.columns = columns
+        self.n_rows = 0
+        self.x_first = None
+        self.x_last = None
+        self.minimum = None
+        self.maximum = None
+        self.first_value = None
+        self.first_valid = None
+        self.last_valid = None
+        self.kept = []    # row blocks of the output, copies so they don't pin the blocks they came from
+        self.position = 0    # rows fed so far
+        self.selected = 0    # lttb buckets decided so far
+        self.anchor = None    # (x, values) of the previously selected row
+        self.buffer = None    # (first row, x, values, frame) of rows not yet past their bucket
+        self.last_filled = None
+
+    def _x(self, df):
+        x_values = df[self.x_column] if self.x_column in df.columns else df.index.to_series()
+        return pd.to_datetime(x_values).values.astype('datetime64[D]').astype(np.float64)
+
+    def _columns(self, df):
+        if self.columns is None:
+            self.columns = [col for col in df.select_dtypes(include='number').columns if col != self.x_column]
+        return self.columns
+
+    def observe(self, df):
+        """ First pass: records the statistics of the block. """
+
+        if len(df) == 0:
+            return
+        values = df[self._columns(df)].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        x = self._x(df)
+        rows = self.n_rows + np.arange(len(df))
+
+        if self.minimum is None:
+            self.x_first = x[0]
+            self.minimum = np.full(values.shape[1], np.inf)
+            self.maximum = np.full(values.shape[1], -np.inf)
+            self.first_value = np.full(values.shape[1], np.nan)
+            self.first_valid = np.full(values.shape[1], -1)
+            self.last_valid = np.full(values.shape[1], -1)
+        self.x_last = x[-1]
+        with np.errstate(invalid='ignore'):
+            self.minimum = np.fmin(self.minimum, np.where(valid, values, np.inf).min(axis=0))
+            self.maximum = np.fmax(self.maximum, np.where(valid, values, -np.inf).max(axis=0))
+
+        has_data = valid.any(axis=0)
+        new = has_data & (self.first_valid < 0)
+        first = valid.argmax(axis=0)
+        self.first_value[new] = values[first[new], np.arange(values.shape[1])[new]]
+        self.first_valid[new] = rows[first[new]]
+        last = len(df) - 1 - valid[::-1].argmax(axis=0)
+        self.last_valid[has_data] = rows[last[has_data]]
+        self.n_rows = self.n_rows + len(df)
+
+    def _normalized(self, df):
+        """ The block's x and values scaled the way lttb_indices scales the whole frame, with gaps
+        forward filled (and leading gaps back filled) across block boundaries. """
+
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        if self.last_filled is None:
+            self.last_filled = np.where(np.isnan(self.first_value), 0.0, self.first_value)    # bfill of leading gaps, all null series are 0
+        filled = pd.DataFrame(np.vstack([self.last_filled, values])).ffill().to_numpy()[1:]
+        self.last_filled = filled[-1]
+
+        all_null = np.isnan(self.first_value)
+        minimum = np.where(all_null, 0.0, self.minimum)
+        spread = np.where(all_null, 0.0, self.maximum - self.minimum)
+        values = (filled - minimum) / np.where(spread > 0, spread, 1.0)
+        x = (self._x(df) - self.x_first) / max(self.x_last - self.x_first, 1.0)
+        return x, values
+
+    def feed(self, df):
+        """ Second pass: selects the rows of every bucket that is complete (a bucket needs the
+        whole following bucket) and keeps them, dropping rows that can no longer be picked. """
+
+        if len(df) == 0:
+            return
+        start = self.position
+        self.position = self.position + len(df)
+        rows = start + np.arange(len(df))
+
+        if self.n_rows <= self.n_out or self.n_out < 3:    # nothing to downsample
+            self.kept.append(df)
+            return
+
+        extra = np.isin(rows, np.concatenate([self.first_valid[self.first_valid >= 0], self.last_valid[self.last_valid >= 0]]))
+        x, values = self._normalized(df)
+        if self.buffer is None:
+            self.buffer = (start, x, values, df)
+            self.anchor = (x[0], values[0])
+            self._keep(df.iloc[:1])
+        else:
+            first, bx, bv, bdf = self.buffer
+            self.buffer = (first, np.concatenate([bx, x]), np.concatenate([bv, values]), pd.concat([bdf, df]))
+        if extra.any():
+            self._keep(df[extra])
+
+        n_rows = self.n_rows
+        edges = (np.arange(self.n_out - 1) * (n_rows - 2) / (self.n_out - 2)).astype(np.int64) + 1
+        edges[-1] = n_rows - 1
+        while self.selected < self.n_out - 2:
+            i = self.selected
+            lo, hi = edges[i], edges[i + 1]
+            next_hi = edges[i + 2] if i + 2 < len(edges) else n_rows
+            if next_hi > self.position:
+                break    # the next bucket isn't complete yet
+            first, bx, bv, bdf = self.buffer
+            next_x = bx[hi - first:next_hi - first].mean()
+            next_y = bv[hi - first:next_hi - first].mean(axis=0)
+            ax, ay = self.anchor
+            area = np.abs((ax - next_x) * (bv[lo - first:hi - first] - ay) - (ax - bx[lo - first:hi - first, None]) * (next_y - ay))
+            chosen = lo + area.sum(axis=1).argmax()
+            self.anchor = (bx[chosen - first], bv[chosen - first])
+            self._keep(bdf.iloc[chosen - first:chosen - first + 1])
+            self.buffer = (hi, bx[hi - first:], bv[hi - first:], bdf.iloc[hi - first:])    # earlier rows can't be picked any more
+            self.selected = i + 1
+
+        if self.position == n_rows:
+            self._keep(df.iloc[-1:])
+
+    def _keep(self, rows):
+        self.kept.append(rows.copy())
+        if len(self.kept) >= 256:    # one frame per few hundred rows rather than a frame per row
+            self.kept = [pd.concat(self.kept)]
+
+    def result(self):
+        """ Returns the kept rows in their original order. """
+
+        if not self.kept:
+            return pd.DataFrame(columns=self.columns)
+        df = pd.concat(self.kept)
+        return df[~df.index.duplicated()].sort_index()
@@ -0,0 +1,174 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: http_cache.py
+# DESCRIPTION: On-disk cache for the api requests made by the collectors.
+# Responses are keyed by normalized url (api keys stripped) and the mode is
+# picked with the EOC_HTTP_CACHE environment variable:
+#   off     - plain requests.get, nothing stored (default)
+#   cache   - reuse stored responses for ttl seconds, then revalidate them with
+#             If-None-Match / If-Modified-Since
+#   record  - always hit the api and save every response as a fixture
+#   replay  - only serve saved fixtures, never touch the network
+# record / replay let ingestion be re-run and benchmarked deterministically.
+###############################################################################
+import os
+import json
+import time
+import shutil
+import hashlib
+import urllib.parse
+import requests
+
+
+# CONFIG
+cache_mode = os.environ.get('EOC_HTTP_CACHE', 'off')
+cache_dir = os.environ.get('EOC_HTTP_CACHE_DIR', '/tmp/eoc-http-cache')
+fixture_dir = os.environ.get('EOC_HTTP_FIXTURE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'fixtures', 'http'))
+ignore_params = [param for param in os.environ.get('EOC_HTTP_CACHE_IGNORE_PARAMS', '').split(',') if param]    # e.g. 'to' to replay yesterday's fixtures today
+default_ttl = 6 * 60 * 60    # seconds a cached response is used without revalidating
+secret_params = ['apikey', 'api_key', 'key', 'token', 'x_cg_demo_api_key', 'x_cg_pro_api_key']    # never written to disk
+chunk_size = 64 * 1024
+kept_headers = ['Content-Type', 'ETag', 'Last-Modified']
+
+
+# RESPONSES
+class CachedResponse:
+    """ Stored response with the parts of the requests.Response interface the collectors
+    use. The body stays on disk and is streamed by iter_content(). """
+
+    def __init__(self, body_path, meta):
+        self.body_path = body_path
+        self.status_code = meta['status_code']
+        self.headers = meta['headers']
+        self.url = meta['url']
+        self.from_cache = True
+
+    @property
+    def content(self):
+        with open(self.body_path, 'rb') as f:
+            return f.read()
+
+    def iter_content(self, chunk_size=chunk_size):
+        with open(self.body_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('{} error (cached) for url: {}'.format(self.status_code, self.url))
+
+
+# FUNCTIONS
+def normalize_url(url, params=None):
+    """ Returns the url with params merged in, api keys removed, and the query sorted, so the
+    same request always maps to the same cache entry and no secrets end up on disk. """
+
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query = query + [(k, str(v)) for k, v in params.items()]
+    query = sorted((k, v) for k, v in query if k.lower() not in secret_params and k not in ignore_params)
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), ''))
+
+
+def _entry_paths(directory, normalized_url):
+    key = hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()
+    return os.path.join(directory, key + '.json'), os.path.join(directory, key + '.body')
+
+
+def _load(directory, normalized_url):
+    meta_path, body_path = _entry_paths(directory, normalized_url)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta, body_path
+
+
+def _store(directory, normalized_url, response):
+    """ Streams the live response body to disk and writes its metadata. Returns the
+    stored CachedResponse. """
+
+    os.makedirs(directory, exist_ok=True)
+    meta_path, body_path = _entry_paths(directory, normalized_url)
+    with open(body_path + '.tmp', 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+    os.replace(body_path + '.tmp', body_path)
+
+    meta = {
+        'url': normalized_url,
+        'status_code': response.status_code,
+        'headers': {header: response.headers[header] for header in kept_headers if header in response.headers},
+        'fetched_at': time.time(),
+    }
+    _write_meta(meta_path, meta)
+    return CachedResponse(body_path, meta)
+
+
+def _write_meta(meta_path, meta):
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def get(url, params=None, ttl=default_ttl, mode=None, **kwargs):
+    """ Drop-in replacement for requests.get that goes through the response cache. In 'off'
+    mode this is requests.get; otherwise a CachedResponse is returned. Extra keyword args
+    are passed on to requests.get. """
+
+    mode = mode or cache_mode
+    if mode == 'off':
+        return requests.get(url, params=params, **kwargs)
+
+    kwargs['stream'] = True    # bodies are streamed to disk, never held in memory
+    normalized_url = normalize_url(url, params)
+
+    if mode == 'replay':
+        meta, body_path = _load(fixture_dir, normalized_url)
+        if meta is None:
+            raise FileNotFoundError('No recorded fixture for ' + normalized_url)
+        return CachedResponse(body_path, meta)
+
+    if mode == 'record':
+        response = requests.get(url, params=params, **kwargs)
+        return _store(fixture_dir, normalized_url, response)
+
+    if mode != 'cache':
+        raise ValueError('Unknown http cache mode: ' + mode)
+
+    meta, body_path = _load(cache_dir, normalized_url)
+    if meta is not None and meta['status_code'] == 200:
+        if time.time() - meta['fetched_at'] < ttl:
+            return CachedResponse(body_path, meta)
+
+        headers = dict(kwargs.pop('headers', None) or {})    # stale, revalidate
+        if 'ETag' in meta['headers']:
+            headers['If-None-Match'] = meta['headers']['ETag']
+        if 'Last-Modified' in meta['headers']:
+            headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+        response = requests.get(url, params=params, headers=headers, **kwargs)
+        if response.status_code == 304:
+            response.close()
+            meta['fetched_at'] = time.time()
+            _write_meta(_entry_paths(cache_dir, normalized_url)[0], meta)
+            return CachedResponse(body_path, meta)
+    else:
+        response = requests.get(url, params=params, **kwargs)
+
+    if response.status_code != 200:    # don't cache errors / rate limits
+        return response
+    return _store(cache_dir, normalized_url, response)
+
+
+def clear(directory=cache_dir):
+    """ Deletes every cached response. """
+    shutil.rmtree(directory, ignore_errors=True)
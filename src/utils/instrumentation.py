@@ -0,0 +1,154 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: instrumentation.py
+# DESCRIPTION: Lightweight timing / metrics helpers shared by the collectors
+# and pages. Emits one structured json log line per stage (fetch, parse,
+# transform, compute, upload) with durations, byte counts, and row counts.
+# Set EOC_PROFILE=cprofile and/or EOC_PROFILE=tracemalloc (comma separated)
+# to also capture a cpu profile / peak memory for each entry point run.
+###############################################################################
+import io
+import os
+import sys
+import json
+import time
+import logging
+import functools
+
+
+# CONFIG
+profile_modes = [mode.strip() for mode in os.environ.get('EOC_PROFILE', '').split(',') if mode.strip()]
+profile_top_n = 25    # number of functions kept in the cprofile summary
+summary_max_columns = 10    # bounded frame / payload summaries instead of full dumps
+
+
+# LOGGER
+logger = logging.getLogger('eoc')
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))    # records are already json
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_event(message, severity='INFO', **fields):
+    """ Writes a single structured (json) log record. The 'severity' key is picked
+    up by google cloud logging. """
+
+    record = {'severity': severity, 'message': message}
+    record.update(fields)
+    logger.log(getattr(logging, severity, logging.INFO), json.dumps(record, default=str))
+
+
+# SPANS
+class Span:
+    """ Times a stage of work. Use as a context manager (or via the timed decorator)
+    and attach metrics with record(), e.g.
+
+        with span('fetch', asset='bitcoin') as s:
+            res = requests.get(url)
+            s.record(bytes=len(res.content))
+    """
+
+    def __init__(self, stage, profile=False, **fields):
+        self.stage = stage
+        self.fields = fields
+        self.profile = profile
+        self.duration_ms = None
+        self._profiler = None
+
+    def record(self, **fields):
+        """ Adds metrics (rows, bytes, etc.) to the log record for this span. """
+        self.fields.update(fields)
+
+    def __enter__(self):
+        if self.profile and 'tracemalloc' in profile_modes:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile and 'cprofile' in profile_modes:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        record = {'stage': self.stage, 'duration_ms': self.duration_ms, 'status': 'ok' if exc is None else 'error'}
+        if exc is not None:
+            record['error'] = repr(exc)
+        record.update(self.fields)
+
+        if self._profiler is not None:
+            import pstats
+            self._profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(profile_top_n)
+            record['cprofile'] = stream.getvalue()
+        if self.profile and 'tracemalloc' in profile_modes:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record['tracemalloc_peak_bytes'] = peak
+
+        log_event(self.stage, severity='INFO' if exc is None else 'ERROR', **record)
+        return False    # never swallow exceptions
+
+
+def span(stage, **fields):
+    """ Returns a Span for the input stage (fetch, parse, transform, compute, upload). """
+    return Span(stage, **fields)
+
+
+def timed(stage, **fields):
+    """ Decorator version of span(). The wrapped function's name is added to the record. """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(stage, function=func.__name__, **fields):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def entry_point(name):
+    """ Decorator for cloud function entry points. Times the whole run and, when
+    EOC_PROFILE is set, captures a cprofile and / or tracemalloc report for it. """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span('run', profile=bool(profile_modes), entry_point=name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# SUMMARIES
+def summarize_frame(df):
+    """ Returns a small, bounded description of a data frame for logging (shape, a few
+    column names, and the first / last row of the first few columns). """
+
+    columns = list(df.columns)
+    summary = {'rows': len(df), 'columns': len(columns), 'column_names': [str(col) for col in columns[:summary_max_columns]]}
+    if len(df) > 0:
+        head = df.iloc[0, :summary_max_columns]
+        tail = df.iloc[-1, :summary_max_columns]
+        summary['first'] = {str(k): v for k, v in head.items()}
+        summary['last'] = {str(k): v for k, v in tail.items()}
+    return summary
+
+
+def summarize_payload(payload):
+    """ Returns a small, bounded description of a decoded json api payload (top level
+    keys and the length of each list) instead of the payload itself. """
+
+    if isinstance(payload, dict):
+        return {str(k): (len(v) if isinstance(v, (list, dict)) else v) for k, v in list(payload.items())[:summary_max_columns]}
+    if isinstance(payload, list):
+        return {'items': len(payload)}
+    return {'value': str(payload)[:200]}
@@ -0,0 +1,89 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: lineage.py
+# DESCRIPTION: Change tracking for page outputs. Records which source blobs
+# (by generation) each page output was built from, so a page can skip a run
+# when none of its inputs changed, and per-asset pages (e.g. ath) can reuse
+# results for the assets whose history didn't change.
+###############################################################################
+import os
+import json
+import time
+import posixpath
+
+
+# CONFIG
+lineage_directory = 'data/lineage'
+force_recompute = os.environ.get('EOC_FORCE_RECOMPUTE', '') == '1'    # ignore lineage and rebuild everything
+
+
+class SourceTracker:
+    """ Lineage for a single page, persisted at data/lineage/<page>.json through a storage
+    backend (see utils/storage.py). Typical use:
+
+        tracker = SourceTracker(get_storage(), 'ath')
+        if not tracker.changed(sources):
+            return    # outputs are already up to date
+        ... build outputs, reusing tracker.asset_result() for unchanged assets ...
+        tracker.commit()
+    """
+
+    def __init__(self, storage, page):
+        self.storage = storage
+        self.page = page
+        self.path = lineage_directory + '/' + page + '.json'
+        self.current = {}    # generations seen during this run
+        try:
+            self.record = json.loads(self.storage.read_bytes(self.path))
+        except FileNotFoundError:
+            self.record = {'page': page, 'sources': {}, 'assets': {}}
+
+    def generations(self, paths):
+        """ Returns (and remembers) the current generation of every input path, using one
+        listing per directory rather than a request per file. """
+
+        missing = [path for path in paths if path not in self.current]
+        for directory in sorted(set(posixpath.dirname(path) for path in missing)):
+            listed = self.storage.list_generations(directory + '/')
+            for path in missing:
+                if posixpath.dirname(path) == directory:
+                    self.current[path] = listed.get(path)
+        return {path: self.current[path] for path in paths}
+
+    def changed(self, paths):
+        """ Returns the input paths whose generation differs from the one the current
+        outputs were built from (all of them when EOC_FORCE_RECOMPUTE=1). """
+
+        generations = self.generations(paths)
+        if force_recompute:
+            return list(paths)
+        return [path for path in paths if generations[path] != self.record['sources'].get(path)]
+
+    def asset_result(self, asset, paths):
+        """ Returns the stored result for the asset if none of its source paths changed
+        since it was computed, otherwise None. """
+
+        entry = self.record['assets'].get(asset)
+        if entry is None or force_recompute:
+            return None
+        generations = self.generations(paths)
+        if any(generations[path] is None or generations[path] != entry['sources'].get(path) for path in paths):
+            return None
+        return entry['result']
+
+    def set_asset_result(self, asset, paths, result):
+        """ Stores a (small, json serializable) result for the asset against the current
+        generations of its source paths. """
+
+        generations = self.generations(paths)
+        self.record['assets'][asset] = {'sources': generations, 'result': result}
+
+    def commit(self):
+        """ Records the generations seen during this run as the ones the outputs are built
+        from. Call only after the outputs were published successfully. """
+
+        self.record['sources'].update(self.current)
+        self.record['updated'] = time.time()
+        self.storage.write_bytes(self.path, json.dumps(self.record, indent=2).encode('utf-8'), content_type='application/json')
@@ -0,0 +1,99 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: panel_cache.py
+# DESCRIPTION: Memory-mapped cache of aligned (dates x assets) panels between
+# warm invocations. A panel is saved as .npy files under /tmp (or
+# EOC_PANEL_CACHE_DIR) with a small manifest of what it was built from (storage
+# backend, source generations, and requested columns), and reopened with np.load(mmap_mode='r') on the next invocation,
+# so pages start from a zero-copy view instead of re-parsing and re-merging
+# the history csvs.
+###############################################################################
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from utils.storage import get_storage, read_csv
+
+
+# CONFIG
+panel_cache_dir = os.environ.get('EOC_PANEL_CACHE_DIR', '/tmp/eoc-panel-cache')
+
+
+# FUNCTIONS
+def _paths(name):
+    base = os.path.join(panel_cache_dir, name)
+    return base + '.manifest.json', base + '.values.npy', base + '.dates.npy'
+
+
+def _open(name, manifest):
+    """ Reopens a saved panel as a data frame backed by the memory-mapped values. """
+
+    manifest_path, values_path, dates_path = _paths(name)
+    values = np.load(values_path, mmap_mode='r')
+    dates = np.load(dates_path)
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=manifest['columns'], copy=False)
+
+
+def _save(name, panel, key):
+    """ Saves the panel (values as one float64 matrix) and then its manifest, each written
+    atomically so a concurrent reader never sees a half written cache. """
+
+    os.makedirs(panel_cache_dir, exist_ok=True)
+    manifest_path, values_path, dates_path = _paths(name)
+    for path, array in [(values_path, np.ascontiguousarray(panel.to_numpy(dtype=np.float64))),
+                        (dates_path, panel.index.values.astype('datetime64[D]'))]:
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(path + '.tmp', path)
+
+    manifest = dict(key, columns=[str(col) for col in panel.columns], shape=list(panel.shape))
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def load_panel(name, generations, build, columns, storage=None):
+    """ Returns the panel called name. generations is a dict of source path -> generation
+    (e.g. from SourceTracker.generations()) describing the inputs it is built from, and columns
+    the columns build() is asked to produce. If the cached panel was built from exactly those
+    generations of the same storage backend (generations alone repeat across buckets, local
+    directories, and memory backends) with the same columns it is reopened memory-mapped (read
+    only), otherwise build() is called to make a new one (a data frame with a DatetimeIndex and
+    float columns), which is cached for the next invocation. """
+
+    storage = storage if storage is not None else get_storage()
+    key = {'storage': storage.identity, 'sources': generations, 'requested_columns': [str(col) for col in columns]}
+    manifest_path, values_path, dates_path = _paths(name)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if all(manifest.get(field) == value for field, value in key.items()) and os.path.exists(values_path) and os.path.exists(dates_path):
+            return _open(name, manifest)
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    panel = build()
+    _save(name, panel, key)
+    return panel
+
+
+def read_history_columns(path, columns, date_column='utc', storage=None):
+    """ Reads a stored history csv and returns the requested value columns indexed by day
+    (first row kept for duplicated days, like the pages have always done). columns is a
+    dict of csv column -> output column name. """
+
+    df = read_csv(path, storage=storage, usecols=[date_column] + list(columns.keys()))
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop(date_column)).dt.normalize(), name='date')
+    df = df[~df.index.duplicated(keep='first')]
+    return df.rename(columns=columns)
+
+
+def build_panel(frames):
+    """ Aligns a list of per-asset frames (DatetimeIndex, one or more columns each) on the
+    union of their dates into a single float64 panel sorted by date. """
+
+    panel = pd.concat(frames, axis=1, join='outer', copy=False).sort_index()
+    return panel.astype(np.float64, copy=False)
@@ -0,0 +1,66 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: performance.py
+# DESCRIPTION: Rebased performance comparisons ("rebased to 100 at date X for
+# assets A..K between X and Y") answered from a precomputed panel of
+# cumulative log returns. A query is a date slice plus a subtraction and exp
+# over the k requested columns, so it never touches the rest of the panel or
+# re-merges histories.
+###############################################################################
+import numpy as np
+import pandas as pd
+
+
+# CONFIG
+default_base = 100.0
+default_windows = ['ytd', '1y', '3y']
+
+
+# FUNCTIONS
+def cumulative_log_returns(price_panel):
+    """ Takes an aligned (dates x assets) price panel and returns each asset's cumulative
+    log return since its first price. Gaps after the first price carry the last value
+    forward so every date can be used as a rebase date. """
+
+    log_prices = np.log(price_panel.where(price_panel > 0)).ffill()
+    return log_prices - log_prices.bfill().iloc[0]
+
+
+def rebase(cumulative, assets, start, end=None, base=default_base):
+    """ Returns the input assets rebased to base at start, between start and end (inclusive),
+    as a frame indexed by date. cumulative is a cumulative log return panel indexed by
+    sorted dates (datetimes or iso date strings). Assets that start trading after the start
+    date are rebased at their first date in the range. """
+
+    lo = cumulative.index.searchsorted(start, side='left')
+    hi = len(cumulative) if end is None else cumulative.index.searchsorted(end, side='right')
+    window = cumulative.iloc[lo:hi][list(assets)]    # only the k x range block is copied
+
+    block = window.to_numpy(dtype=np.float64)
+    if len(block) == 0:
+        return window
+    first = (~np.isnan(block)).argmax(axis=0)    # first row each asset has a value in the range
+    anchor = block[first, np.arange(block.shape[1])]
+    return pd.DataFrame(base * np.exp(block - anchor), index=window.index, columns=window.columns)
+
+
+def window_start(end, window):
+    """ Returns the start date of a named window ('ytd', or a number of years like '1y')
+    ending at the input date. """
+
+    end = pd.Timestamp(end)
+    if window == 'ytd':
+        return pd.Timestamp(end.year, 1, 1)
+    if window.endswith('y'):
+        return end - pd.DateOffset(years=int(window[:-1]))
+    raise ValueError('Unknown window: ' + window)
+
+
+def rebased_windows(cumulative, windows=default_windows, base=default_base):
+    """ Returns a dict of window name -> all assets rebased to base at the start of that
+    window, for windows ending at the last date of the panel. """
+
+    end = cumulative.index[-1]
+    return {window: rebase(cumulative, cumulative.columns, window_start(end, window), base=base) for window in windows}
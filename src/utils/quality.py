@@ -0,0 +1,229 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: quality.py
+# DESCRIPTION: Data quality gate between the collectors and the pages. Every
+# coin and stock history that was (re)written since it was last checked is
+# read once and all of them are checked together in one vectorized pass over
+# the concatenated series: empty or unreadable files (e.g. an error payload
+# parsed as an empty frame), duplicate and out of order days, gaps, null and
+# zero / negative prices, and how stale the last row is. Results are kept in
+# a report (data/quality/report.json) keyed by file generation, and pages call
+# quality_gate() to leave out the assets that fail instead of recomputing and
+# publishing outputs built on bad inputs. Set EOC_QUALITY_GATE=0 to only
+# report (e.g. for dev data that is stale by design).
+###############################################################################
+import os
+import json
+import time
+import datetime
+import posixpath
+import numpy as np
+import pandas as pd
+
+from utils.instrumentation import log_event
+from utils.storage import get_storage, read_csv, GenerationMismatch
+
+
+# CONFIG
+report_path = 'data/quality/report.json'
+gate_enabled = os.environ.get('EOC_QUALITY_GATE', '1') != '0'
+history_dict = {    # directory: date column, price column, largest normal step between rows (days), days after which the last row is stale
+    'data/coin_histories': ('utc', 'price(usd)', 1, 3),
+    'data/stock_histories': ('date', 'close', 4, 7),    # weekends plus a holiday
+}
+severity_dict = {    # 'fail' holds the asset back from the pages, 'warn' is only reported
+    'missing': 'fail',
+    'unreadable': 'fail',
+    'empty': 'fail',
+    'non_positive_prices': 'fail',
+    'duplicate_days': 'fail',
+    'out_of_order': 'fail',
+    'stale': 'fail',
+    'gaps': 'warn',
+    'null_prices': 'warn',
+}
+max_write_retries = 20    # conditional write attempts before giving up on a report update
+
+
+# FUNCTIONS
+def check_histories(frames, max_step_list):
+    """ Runs every check over a list of (date, price) frames at once. The frames are
+    concatenated into one long series with a code per frame, so each check is a single
+    vectorized operation however many frames there are. max_step_list holds each frame's
+    largest normal step between rows in days. Returns a data frame with one row per frame:
+    row count, first / last date, and the count of every problem found. """
+
+    n = len(frames)
+    lengths = np.array([len(df) for df in frames], dtype=np.int64)
+    codes = np.repeat(np.arange(n), lengths)
+    days = np.concatenate([df['date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64) for df in frames] + [np.empty(0, dtype=np.int64)])
+    prices = np.concatenate([df['price'].to_numpy(dtype=np.float64) for df in frames] + [np.empty(0)])
+
+    is_last = np.zeros(len(codes), dtype=bool)
+    is_last[np.cumsum(lengths)[lengths > 0] - 1] = True
+    same = codes[1:] == codes[:-1]    # consecutive rows of the same frame
+    step = np.diff(days)
+    following = codes[1:]
+
+    def _count(mask, row_codes):
+        return np.bincount(row_codes[mask], minlength=n)
+
+    largest_step = np.zeros(n, dtype=np.int64)
+    np.maximum.at(largest_step, following[same], step[same])
+    first_day = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(first_day, codes, days)
+    last_day = np.full(n, np.iinfo(np.int64).min)
+    np.maximum.at(last_day, codes, days)
+
+    with np.errstate(invalid='ignore'):
+        return pd.DataFrame({
+            'rows': lengths,
+            'first_date': np.where(lengths > 0, first_day, 0).astype('datetime64[D]'),
+            'last_date': np.where(lengths > 0, last_day, 0).astype('datetime64[D]'),
+            'empty': (lengths == 0).astype(np.int64),
+            'null_prices': _count(np.isnan(prices), codes),
+            'non_positive_prices': _count(prices <= 0, codes),
+            'duplicate_days': _count(same & (step == 0) & ~is_last[1:], following),    # coingecko's latest intraday point shares the last day
+            'out_of_order': _count(same & (step < 0), following),
+            'gaps': _count(same & (step > np.asarray(max_step_list, dtype=np.int64)[following]), following),
+            'largest_gap_days': largest_step,
+        })
+
+
+def _history_config(path):
+    return history_dict.get(posixpath.dirname(path))
+
+
+def failed_checks(entry, today=None):
+    """ Returns the failing checks of a report entry, with staleness judged against today
+    (it changes without the file changing). """
+
+    today = today or datetime.date.today()
+    checks = dict(entry['checks'])
+    config = _history_config(entry['path'])
+    if entry.get('last_date') and config is not None:
+        checks['stale'] = int((today - datetime.date.fromisoformat(entry['last_date'])).days > config[3])
+    return [check for check, count in checks.items() if count and severity_dict.get(check) == 'fail']
+
+
+def load_report(storage=None):
+    """ Returns the quality report ({'sources': {path: entry}}), empty if there isn't one. """
+
+    storage = storage if storage is not None else get_storage()
+    for attempt in range(max_write_retries):
+        try:
+            data, generation = storage.read_with_generation(report_path)
+            return json.loads(data) if data is not None else {'sources': {}}
+        except GenerationMismatch:
+            time.sleep(0.05 * (attempt + 1))    # rewritten while it was read, read again
+    raise RuntimeError('Could not read quality report ' + report_path)
+
+
+def _update_report(storage, entries):
+    """ Merges the entries into the stored report with a generation precondition (retried),
+    so overlapping runs never drop each other's results. """
+
+    for attempt in range(max_write_retries):
+        try:
+            data, generation = storage.read_with_generation(report_path)    # gcs raises GenerationMismatch if a write lands mid read
+            report = json.loads(data) if data is not None else {'sources': {}}
+            report['sources'].update(entries)
+            report['updated'] = time.time()
+            storage.write_bytes(report_path, json.dumps(report, indent=2).encode('utf-8'), content_type='application/json', if_generation_match=generation or '0')
+            return report
+        except GenerationMismatch:
+            time.sleep(0.05 * (attempt + 1))    # another run wrote first, reload and retry
+    raise RuntimeError('Could not update quality report ' + report_path)
+
+
+def _generations(storage, paths):
+    generations = {}
+    for directory in sorted(set(posixpath.dirname(path) for path in paths)):
+        listed = storage.list_generations(directory + '/')
+        generations.update({path: listed.get(path) for path in paths if posixpath.dirname(path) == directory})
+    return generations
+
+
+def validate_histories(paths=None, storage=None, force=False):
+    """ Checks the histories at the input paths (default: every history in history_dict's
+    directories) that were not checked at their current generation yet (all of them with
+    force) and merges the results into the report. Returns the report. """
+
+    storage = storage if storage is not None else get_storage()
+    if paths is None:
+        paths = sorted(path for directory in history_dict for path in storage.list_generations(directory + '/') if path.endswith('.csv'))
+    paths = [path for path in paths if _history_config(path) is not None]
+    generations = _generations(storage, paths)
+    report = load_report(storage)
+    todo = [path for path in paths if force or generations[path] is None or report['sources'].get(path, {}).get('generation') != generations[path]]
+    if not todo:
+        return report
+
+    # Read every new history, only the date and price columns
+    frames = []
+    problems = []
+    for path in todo:
+        date_column, price_column, max_step, max_stale = _history_config(path)
+        problem = None
+        try:
+            df = read_csv(path, storage=storage, usecols=[date_column, price_column])
+            df = pd.DataFrame({'date': pd.to_datetime(df[date_column]), 'price': pd.to_numeric(df[price_column], errors='coerce')})
+        except FileNotFoundError:
+            df, problem = None, 'missing'
+        except Exception as e:    # e.g. an error payload stored instead of a history
+            df, problem = None, 'unreadable'
+            log_event('Could not read history for quality checks: ' + path, severity='WARNING', source=path, error=repr(e))
+        frames.append(df if df is not None else pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'price': pd.Series(dtype=np.float64)}))
+        problems.append(problem)
+
+    # Check them all in one pass
+    results = check_histories(frames, [_history_config(path)[2] for path in todo])
+    entries = {}
+    today = datetime.date.today()
+    for path, problem, (_, row) in zip(todo, problems, results.iterrows()):
+        checks = {check: int(row[check]) for check in ['empty', 'null_prices', 'non_positive_prices', 'duplicate_days', 'out_of_order', 'gaps']}
+        if problem is not None:
+            checks = {problem: 1}
+        entry = {
+            'path': path,
+            'generation': generations[path],
+            'checked': time.time(),
+            'rows': int(row['rows']),
+            'first_date': str(row['first_date'].date()) if row['rows'] > 0 else None,
+            'last_date': str(row['last_date'].date()) if row['rows'] > 0 else None,
+            'largest_gap_days': int(row['largest_gap_days']),
+            'checks': checks,
+        }
+        entry['failed'] = failed_checks(entry, today)
+        entry['status'] = 'fail' if entry['failed'] else ('warn' if any(checks.values()) else 'pass')
+        entries[path] = entry
+
+    report = _update_report(storage, entries)
+    failing = {path: entry['failed'] for path, entry in entries.items() if entry['failed']}
+    log_event('Checked history quality', sources=len(entries), failing=failing, warnings=sum(entry['status'] == 'warn' for entry in entries.values()))
+    return report
+
+
+def quality_gate(paths, storage=None):
+    """ Returns the input paths whose histories pass the quality checks, checking any that
+    changed since they were last checked first. Paths the checks don't cover pass through.
+    With EOC_QUALITY_GATE=0 failures are only logged and every path is returned. """
+
+    storage = storage if storage is not None else get_storage()
+    report = validate_histories(paths, storage=storage)
+    today = datetime.date.today()
+    failing = {}
+    for path in paths:
+        entry = report['sources'].get(path)
+        if entry is not None and _history_config(path) is not None:
+            failed = failed_checks(entry, today)
+            if failed:
+                failing[path] = failed
+
+    if failing:
+        log_event('Histories failed quality checks' + (', left out of this run' if gate_enabled else ''), severity='WARNING', failing=failing)
+    if not gate_enabled:
+        return list(paths)
+    return [path for path in paths if path not in failing]
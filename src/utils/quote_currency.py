@@ -0,0 +1,89 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: quote_currency.py
+# DESCRIPTION: Quote currency derivation. Assets are only ever fetched in usd;
+# other quote currencies (eur, gbp, btc, eth, ...) are derived by dividing the
+# usd values by one reference series per currency (the usd value of one unit
+# of it, e.g. the EURUSD close or the bitcoin usd price) on the aligned dates.
+# Every currency variant of a panel comes out of a single broadcast division.
+###############################################################################
+import numpy as np
+import pandas as pd
+
+from utils.panel_cache import load_panel, read_history_columns, build_panel
+
+
+# CONFIG
+base_currency = 'usd'
+reference_dict = {    # quote currency: series holding the usd value of one unit of it
+    'btc': {'path': 'data/coin_histories/coingecko_coin_history_24h_bitcoin.csv', 'date_column': 'utc', 'column': 'price(usd)'},
+    'eth': {'path': 'data/coin_histories/coingecko_coin_history_24h_ethereum.csv', 'date_column': 'utc', 'column': 'price(usd)'},
+    'eur': {'path': 'data/stock_histories/fmp_stock_history_24h_EURUSD.csv', 'date_column': 'date', 'column': 'close'},
+    'gbp': {'path': 'data/stock_histories/fmp_stock_history_24h_GBPUSD.csv', 'date_column': 'date', 'column': 'close'},
+}
+max_fill_days = 4    # fx closes are carried over weekends / holidays, never further
+
+
+# FUNCTIONS
+def requested_currencies(event, default):
+    """ Returns the quote currencies for a page run: a comma separated 'quote_currencies'
+    attribute on the triggering (pub/sub) event if there is one, otherwise the default list.
+    The base currency is always included. """
+
+    attributes = (event.get('attributes') or {}) if isinstance(event, dict) else {}
+    currencies = [c.strip().lower() for c in attributes.get('quote_currencies', '').split(',') if c.strip()] or list(default)
+    unknown = [currency for currency in currencies if currency != base_currency and currency not in reference_dict]
+    if unknown:
+        raise ValueError('Unknown quote currencies: ' + ','.join(unknown))
+    return [base_currency] + [currency for currency in currencies if currency != base_currency]
+
+
+def reference_paths(currencies):
+    """ Returns the storage paths of the reference series needed for the input currencies. """
+    return [reference_dict[currency]['path'] for currency in currencies if currency != base_currency]
+
+
+def load_reference_panel(currencies, generations, storage=None):
+    """ Returns a (dates x currencies) panel of the usd value of one unit of each non-usd
+    currency, through the panel cache. generations maps reference_paths(currencies) to
+    their current generations (e.g. from SourceTracker.generations()). """
+
+    currencies = [currency for currency in currencies if currency != base_currency]
+    if not currencies:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='date'), dtype=np.float64)
+
+    def _build():
+        frames = []
+        for currency in currencies:
+            reference = reference_dict[currency]
+            frames.append(read_history_columns(reference['path'], {reference['column']: currency}, date_column=reference['date_column'], storage=storage))
+        return build_panel(frames)
+
+    return load_panel('quote-references-' + '-'.join(sorted(currencies)), generations, _build, currencies, storage=storage)
+
+
+def align_reference(reference_panel, dates):
+    """ Returns the reference panel on the input dates, carrying each reference forward over
+    gaps (weekends for fx) of at most max_fill_days. """
+
+    union = reference_panel.index.union(dates)
+    return reference_panel.reindex(union).ffill(limit=max_fill_days).reindex(dates)
+
+
+def convert_panel(panel, reference_panel, currencies):
+    """ Takes a usd denominated (dates x columns) panel (prices, market caps, volumes, ...) and
+    returns a dict of currency -> the same panel denominated in that currency, computed for
+    all currencies at once. """
+
+    others = [currency for currency in currencies if currency != base_currency]
+    converted = {}
+    if others:
+        reference = align_reference(reference_panel[others], panel.index).to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = panel.to_numpy(dtype=np.float64)[:, :, None] / reference[:, None, :]    # (dates x columns x currencies)
+        for position, currency in enumerate(others):
+            converted[currency] = pd.DataFrame(values[:, :, position], index=panel.index, columns=panel.columns)
+
+    return {currency: panel if currency == base_currency else converted[currency] for currency in currencies}
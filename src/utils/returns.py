@@ -0,0 +1,33 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: returns.py
+# DESCRIPTION: Period returns of aligned (dates x assets) price panels, shared
+# by the pages that mix daily crypto and business day stock histories
+# (correlation, risk).
+###############################################################################
+import pandas as pd
+
+
+# FUNCTIONS
+def rate_of_return(prices):
+    """ Returns the rate of return of every column of the input price panel, each calculated
+    against the asset's previous available close. Dates an asset has no price for stay null,
+    so gaps in one asset never shift or remove the returns of the others. """
+
+    previous_close = prices.ffill().shift(periods=1)
+    return ((prices - previous_close) / previous_close).where(prices.notna())
+
+
+def resample_returns(price_panel, rule):
+    """ Resamples the aligned daily price panel to the input pandas offset (business day, week,
+    month end, etc.) using the last close of each period, then returns the period returns of all
+    assets in one pass. Weekend crypto prices roll into the following business day's return. """
+
+    if isinstance(rule, pd.offsets.BusinessDay):
+        sampled = price_panel[price_panel.index.dayofweek < 5]
+    else:
+        sampled = price_panel.resample(rule).last()
+
+    return rate_of_return(sampled)
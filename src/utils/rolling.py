@@ -0,0 +1,77 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: rolling.py
+# DESCRIPTION: Trailing window statistics over a whole (dates x assets)
+# returns matrix at once using cumulative sums, so every window costs O(T)
+# per statistic regardless of its length. Nulls are skipped (each window uses
+# the observations it has), which lets daily crypto and business day stock
+# returns share one panel.
+###############################################################################
+import numpy as np
+
+
+# FUNCTIONS
+def window_sum(values, window):
+    """ Returns the trailing window sum of each column of the (T x k) array, null for the
+    first window - 1 rows. """
+
+    csum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    result = np.full(values.shape, np.nan)
+    result[window - 1:] = csum[window:] - csum[:-window]
+    return result
+
+
+def _centered(values):
+    """ Returns (valid mask, values minus their column mean with nulls as 0). Centering keeps the
+    running sums of squares well conditioned. """
+
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        center = np.nanmean(np.where(valid.any(axis=0), values, 0.0), axis=0)
+    return valid, np.where(valid, values - center, 0.0)
+
+
+def rolling_std(values, window, min_count=2):
+    """ Returns (std, count): the trailing sample standard deviation of each column over the
+    observations in the window, and how many there were. Null where count < min_count. """
+
+    valid, centered = _centered(values)
+    count = window_sum(valid.astype(np.float64), window)
+    s1 = window_sum(centered, window)
+    s2 = window_sum(centered ** 2, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = np.maximum(s2 - s1 ** 2 / count, 0.0) / (count - 1)
+    return np.where(count >= max(min_count, 2), np.sqrt(var), np.nan), count
+
+
+def rolling_downside_deviation(values, window, target=0.0, min_count=1):
+    """ Returns (downside deviation, count): the root mean square shortfall below target of each
+    column over the observations in the window. Null where count < min_count. """
+
+    valid = ~np.isnan(values)
+    shortfall = np.where(valid, np.minimum(np.where(valid, values, target) - target, 0.0), 0.0)
+    count = window_sum(valid.astype(np.float64), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        downside = np.sqrt(window_sum(shortfall ** 2, window) / count)
+    return np.where(count >= max(min_count, 1), downside, np.nan), count
+
+
+def rolling_beta(values, benchmark, window, min_count=2):
+    """ Returns (beta, count): the trailing beta (cov / var of the benchmark) of each column of
+    values (T x k) against the benchmark (T,), using the days both have a return. Null where
+    fewer than min_count shared days are in the window. """
+
+    joint = ~np.isnan(values) & ~np.isnan(benchmark)[:, None]
+    x = np.where(joint, _centered(values)[1], 0.0)
+    y = np.where(joint, _centered(benchmark[:, None])[1], 0.0)
+
+    count = window_sum(joint.astype(np.float64), window)
+    sx = window_sum(x, window)
+    sy = window_sum(y, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = window_sum(x * y, window) - sx * sy / count
+        variance = window_sum(y * y, window) - sy ** 2 / count
+        beta = covariance / variance
+    return np.where((count >= max(min_count, 2)) & (variance > 0), beta, np.nan), count
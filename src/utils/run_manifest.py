@@ -0,0 +1,149 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: run_manifest.py
+# DESCRIPTION: Checkpoint manifest for ingestion runs. Records the status, last
+# timestamp, and content hash of every asset in a run so a collector that hits
+# the function timeout or a provider outage can be rerun and only pick up the
+# assets that are not done yet. Assets are claimed with a lease using
+# conditional (generation match) writes, so overlapping scheduled runs never
+# work on the same asset twice.
+###############################################################################
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import datetime
+
+from utils.storage import GenerationMismatch
+
+
+# CONFIG
+manifest_directory = 'data/manifests'
+lease_seconds = 10 * 60    # a claimed asset is given back if its worker hasn't finished by then
+max_attempts = 3    # failed assets are retried by later invocations of the same run up to this many times
+max_write_retries = 20    # conditional write attempts before giving up on a manifest update
+
+
+def content_hash(data):
+    """ Returns the sha256 hex digest of the input bytes (e.g. an uploaded csv). """
+    return hashlib.sha256(data).hexdigest()
+
+
+class RunManifest:
+    """ Per-run, per-asset checkpoint persisted through a storage backend (see
+    utils/storage.py) at data/manifests/<collector>/<run_id>.json. The run id defaults
+    to today's utc date, so every scheduled invocation on the same day shares (and
+    resumes) the same run. """
+
+    def __init__(self, storage, collector, assets, run_id=None):
+        self.storage = storage
+        self.collector = collector
+        self.assets = list(assets)
+        self.run_id = run_id or datetime.datetime.utcnow().strftime('%Y-%m-%d')
+        self.path = '/'.join([manifest_directory, collector, self.run_id + '.json'])
+        self.worker_id = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.failed = set()    # assets this instance failed, left to later invocations
+
+    def _empty(self):
+        return {
+            'collector': self.collector,
+            'run_id': self.run_id,
+            'created': time.time(),
+            'assets': {},
+        }
+
+    def _update(self, func):
+        """ Read-modify-write of the manifest with a generation precondition, retried
+        until it lands. func mutates the manifest dict in place and returns a result. """
+
+        for attempt in range(max_write_retries):
+            try:
+                data, generation = self.storage.read_with_generation(self.path)    # gcs raises GenerationMismatch if a write lands mid read
+                manifest = json.loads(data) if data is not None else self._empty()
+                for asset in self.assets:    # assets added to the config mid-run get picked up too
+                    manifest['assets'].setdefault(asset, {'status': 'pending', 'attempts': 0})
+                result = func(manifest)
+                self.storage.write_bytes(self.path, json.dumps(manifest, indent=2).encode('utf-8'), content_type='application/json', if_generation_match=generation or '0')
+                return result
+            except GenerationMismatch:
+                time.sleep(0.05 * (attempt + 1))    # another worker wrote first, reload and retry
+        raise RuntimeError('Could not update run manifest ' + self.path)
+
+    def load(self):
+        """ Returns the current manifest dict (without claiming anything). """
+
+        for attempt in range(max_write_retries):
+            try:
+                data, generation = self.storage.read_with_generation(self.path)
+                return json.loads(data) if data is not None else self._empty()
+            except GenerationMismatch:
+                time.sleep(0.05 * (attempt + 1))    # rewritten while it was read, read again
+        raise RuntimeError('Could not read run manifest ' + self.path)
+
+    def claim(self, limit=1):
+        """ Claims up to limit assets that still need work (pending, failed with attempts
+        left, or running with an expired lease) and returns them. Assets this instance already
+        failed are skipped, so a failing provider isn't retried back to back within one
+        invocation. An empty list means the run is finished or every remaining asset is being
+        worked on elsewhere (or failed here). """
+
+        def _claim(manifest):
+            now = time.time()
+            claimed = []
+            for asset in self.assets:
+                entry = manifest['assets'][asset]
+                if asset in self.failed:
+                    continue
+                claimable = (
+                    entry['status'] == 'pending'
+                    or (entry['status'] == 'failed' and entry['attempts'] < max_attempts)
+                    or (entry['status'] == 'running' and entry.get('lease_expires', 0) < now)
+                )
+                if claimable and len(claimed) < limit:
+                    entry.update({'status': 'running', 'owner': self.worker_id, 'lease_expires': now + lease_seconds, 'attempts': entry['attempts'] + 1})
+                    claimed.append(asset)
+            return claimed
+
+        return self._update(_claim)
+
+    def claimed_assets(self, batch_size=1):
+        """ Generator that keeps claiming batch_size assets at a time until none are left.
+        Yields single assets when batch_size is 1, otherwise lists. """
+
+        while True:
+            claimed = self.claim(limit=batch_size)
+            if not claimed:
+                return
+            yield claimed[0] if batch_size == 1 else claimed
+
+    def complete(self, asset, last_timestamp=None, content_hash=None, rows=None):
+        """ Marks the asset done and records what was stored for it. """
+
+        def _complete(manifest):
+            manifest['assets'][asset].update({
+                'status': 'done',
+                'last_timestamp': last_timestamp,
+                'content_hash': content_hash,
+                'rows': rows,
+                'completed': time.time(),
+                'error': None,
+            })
+        self._update(_complete)
+
+    def fail(self, asset, error):
+        """ Marks the asset failed. It is retried by later invocations (not this one) until
+        max_attempts. """
+
+        def _fail(manifest):
+            manifest['assets'][asset].update({'status': 'failed', 'error': str(error), 'lease_expires': 0})
+        self._update(_fail)
+        self.failed.add(asset)
+
+    def incomplete(self):
+        """ Returns the assets that are not done yet. """
+        manifest = self.load()
+        return [asset for asset in self.assets if manifest['assets'].get(asset, {}).get('status') != 'done']
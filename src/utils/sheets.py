@@ -0,0 +1,403 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: sheets.py
+# DESCRIPTION: Delta updates for the google sheets outputs. Instead of
+# rebuilding the whole .xlsx and having drive reconvert it on every run, the
+# cell grid of each sheet is diffed against a snapshot of the last published
+# version (stored next to the lineage records, see utils/storage.py) and only
+# the changed ranges and appended rows are sent in batched sheets api
+# values:batchUpdate calls. A full xlsx upload and conversion is still done
+# the first time, when a sheet is added or its header changes, when rows are
+# removed, when most of the cells changed, or if the api call fails. A page
+# without a drive file id gets its sheet created on the first run, and the new
+# id is kept in data/sheets/files.json for the following runs.
+#
+# Sheets are published one row block at a time (WorkbookPublisher): each block
+# is compared with the same rows of the snapshot, which is stored as one gzip
+# json lines file per sheet and read as a stream, and the full upload writes
+# the xlsx row by row (xlsxwriter constant_memory). Peak memory depends on the
+# block size and not on the length of the histories, apart from the compressed
+# bytes of the snapshot being read and of the one being saved.
+# EOC_SHEETS_ENDPOINT points the api calls somewhere else (e.g. a local fake
+# sheets server, with EOC_SHEETS_TOKEN as its bearer token).
+###############################################################################
+import io
+import os
+import gzip
+import json
+import datetime
+import tempfile
+import urllib.parse
+import numpy as np
+import pandas as pd
+import requests
+
+from utils.instrumentation import log_event
+from utils.storage import get_storage, decode_bytes
+from utils.credentials import get_access_token, upload_to_drive
+
+
+# CONFIG
+sheets_endpoint = os.environ.get('EOC_SHEETS_ENDPOINT', 'https://sheets.googleapis.com')
+snapshot_directory = 'data/sheets'    # <file id>/index.json and one <sheet>.jsonl per sheet
+file_registry_path = snapshot_directory + '/files.json'    # title -> drive file id of the sheets created here
+max_changed_fraction = 0.5    # above this share of changed cells a full conversion is cheaper
+max_cells_per_request = 50000    # batchUpdate payloads are split to stay well under the request size limit
+request_timeout = 60
+
+
+# FUNCTIONS
+def sheet_grid(df):
+    """ Returns the cell grid pandas' to_excel would write for the frame (header row with the
+    index name, then the index and values of each row) as json friendly lists: numbers as
+    floats, missing values as '', everything else as strings. """
+
+    columns = [df.index.to_series().reset_index(drop=True)] + [df.iloc[:, i].reset_index(drop=True) for i in range(df.shape[1])]
+    cells = []
+    for column in columns:
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            values = column.to_numpy(dtype=np.float64)
+            cells.append(np.where(np.isfinite(values), values, np.nan).astype(object))
+        else:
+            cells.append(column.astype(str).where(column.notna(), np.nan).to_numpy(dtype=object))
+    body = np.column_stack(cells) if len(df) > 0 else np.empty((0, len(columns)), dtype=object)
+    body = np.where(pd.isna(body), '', body)
+
+    header = ['' if df.index.name is None else str(df.index.name)] + [str(col) for col in df.columns]
+    return [header] + body.tolist()
+
+
+def _column_letter(index):
+    """ 0 -> A, 25 -> Z, 26 -> AA, ... """
+
+    letters = ''
+    index = index + 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _a1_range(sheet, first_row, last_row, first_column, last_column):
+    """ Returns the A1 notation of the (0 based, inclusive) block on the sheet. """
+
+    name = "'" + sheet.replace("'", "''") + "'"
+    return '{}!{}{}:{}{}'.format(name, _column_letter(first_column), first_row + 1, _column_letter(last_column), last_row + 1)
+
+
+def _snapshot_path(file_id, sheet=None):
+    """ Returns the path of the snapshot index of the file, or of the sheet's rows. """
+
+    if sheet is None:
+        return snapshot_directory + '/' + file_id + '/index.json'
+    return snapshot_directory + '/' + file_id + '/' + urllib.parse.quote(sheet, safe='') + '.jsonl'
+
+
+def _read_rows(data):
+    """ Yields the rows of a stored snapshot sheet one line at a time, decompressing as it goes. """
+
+    stream = gzip.GzipFile(fileobj=io.BytesIO(data)) if data[:2] == b'\x1f\x8b' else io.BytesIO(data)
+    for line in stream:
+        yield json.loads(line)
+
+
+def batch_update(file_id, ranges):
+    """ Sends the value ranges to the spreadsheet in values:batchUpdate calls of at most
+    max_cells_per_request cells each. Values are entered as if typed (USER_ENTERED) so dates
+    and numbers are parsed the same way the xlsx conversion does. """
+
+    url = sheets_endpoint.rstrip('/') + '/v4/spreadsheets/' + file_id + '/values:batchUpdate'
+    headers = {'Authorization': 'Bearer ' + get_access_token()}
+    batches = [[]]
+    batch_cells = 0
+    for value_range in ranges:
+        cells = sum(len(row) for row in value_range['values'])
+        if batches[-1] and batch_cells + cells > max_cells_per_request:
+            batches.append([])
+            batch_cells = 0
+        batches[-1].append(value_range)
+        batch_cells = batch_cells + cells
+
+    for batch in batches:
+        res = requests.post(url, json={'valueInputOption': 'USER_ENTERED', 'data': batch}, headers=headers, timeout=request_timeout)
+        res.raise_for_status()
+    return len(batches)
+
+
+def _blocks(sheet):
+    """ Returns the row blocks of a sheet given as a frame or as a function returning blocks. """
+    return [sheet] if isinstance(sheet, pd.DataFrame) else sheet()
+
+
+def _load_file_registry(storage):
+    try:
+        return json.loads(decode_bytes(storage.read_bytes(file_registry_path)))
+    except FileNotFoundError:
+        return {}
+
+
+def _register_file(storage, title, file_id):
+    """ Records the id of a sheet created by a full upload, so later runs update it in place. """
+
+    registry = _load_file_registry(storage)
+    registry[title] = file_id
+    storage.write_bytes(file_registry_path, json.dumps(registry, indent=2).encode('utf-8'), content_type='application/json')
+
+
+def _excel_rows(df):
+    """ Yields the index and values of each row of the frame as xlsx cell values: numbers as
+    floats, dates and times as they are, missing (and infinite) values as None, so the full
+    upload holds the same cells as the grid the deltas are computed from. """
+
+    columns = [df.index.to_series()] + [df.iloc[:, i] for i in range(df.shape[1])]
+    cells = []
+    for column in columns:
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            values = column.to_numpy(dtype=np.float64)
+            values = np.where(np.isfinite(values), values, np.nan).astype(object)
+        else:
+            values = column.to_numpy(dtype=object)
+        cells.append(np.where(pd.isna(values), None, values))
+    return zip(*cells)
+
+
+def _write_excel_sheet(worksheet, blocks, formats):
+    """ Writes the row blocks of a sheet to the worksheet in order, styled the way pandas'
+    to_excel styles them (bold bordered header row and index column). """
+
+    row_number = 0
+    for block in blocks:
+        if row_number == 0:
+            header = ['' if block.index.name is None else str(block.index.name)] + [str(col) for col in block.columns]
+            for column_number, value in enumerate(header):
+                if value:
+                    worksheet.write_string(0, column_number, value, formats['header'])
+            row_number = 1
+        for row in _excel_rows(block):
+            for column_number, value in enumerate(row):
+                cell_format = formats['header'] if column_number == 0 else None
+                if value is None:
+                    continue
+                elif isinstance(value, (bool, np.bool_)):
+                    worksheet.write_boolean(row_number, column_number, bool(value), cell_format)
+                elif isinstance(value, (float, int, np.number)):
+                    worksheet.write_number(row_number, column_number, float(value), cell_format)
+                elif isinstance(value, datetime.datetime):
+                    worksheet.write_datetime(row_number, column_number, value, formats['datetime'])
+                elif isinstance(value, datetime.date):
+                    worksheet.write_datetime(row_number, column_number, value, formats['date'])
+                else:
+                    worksheet.write_string(row_number, column_number, str(value), cell_format)
+            row_number = row_number + 1
+
+
+def _full_upload(sheet_dict, local_file, file_id, folder_id, title):
+    """ Writes the whole workbook to a local xlsx (streamed row by row, so only the row being
+    written is in memory) and uploads it over the drive file, converted (or as a new sheet if
+    file_id is None). Returns the drive file id. """
+
+    import xlsxwriter    # only the full upload path needs it
+
+    workbook = xlsxwriter.Workbook(local_file, {'constant_memory': True, 'remove_timezone': True})
+    formats = {
+        'header': workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}),
+        'date': workbook.add_format({'num_format': 'yyyy-mm-dd'}),
+        'datetime': workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'}),
+    }
+    for sheet, value in sheet_dict.items():
+        _write_excel_sheet(workbook.add_worksheet(sheet), _blocks(value), formats)
+    workbook.close()
+    return upload_to_drive(local_file, file_id, folder_id, title)    # drive client is only created on this path
+
+
+class WorkbookPublisher:
+    """ Publishes the sheets of a workbook to the google sheet file_id one row block at a time.
+    write() takes the next block of a sheet (blocks of different sheets can be interleaved),
+    diffs its rows against the same rows of the last published snapshot, and sends the changed
+    ranges in batches of max_cells_per_request cells as they fill up. close() takes the whole
+    workbook (sheet name -> frame, or a function returning the sheet's row blocks again) for
+    the full upload, which is done instead when there is no snapshot, a sheet was added or
+    removed, a header changed, rows were removed, most cells changed, or an update failed.
+    With file_id None the sheet created for the title on an earlier run is used, or a new one
+    is created in the folder. Typical use:
+
+        publisher = WorkbookPublisher(local_file, file_id, folder_id, title)
+        for blocks in make_blocks():
+            for sheet, block in blocks.items():
+                publisher.write(sheet, block)
+        publisher.close(sheet_dict)
+    """
+
+    def __init__(self, local_file, file_id, folder_id, title, storage=None):
+        self.local_file = local_file
+        self.folder_id = folder_id
+        self.title = title
+        self.storage = storage if storage is not None else get_storage()
+        self.file_id = file_id if file_id is not None else _load_file_registry(self.storage).get(title)
+        self.index = None
+        if self.file_id is not None:
+            try:
+                self.index = json.loads(decode_bytes(self.storage.read_bytes(_snapshot_path(self.file_id))))
+            except FileNotFoundError:
+                pass
+        self.mode = 'delta' if self.index is not None else 'full'
+        self.reason = 'new google sheet' if self.file_id is None else 'no snapshot of the published sheet'
+        self.old_cells = sum(sheet['rows'] * sheet['width'] for sheet in self.index['sheets'].values()) if self.index is not None else 0
+        self.sheets = {}    # sheet -> rows written, width, old rows still to compare, open range, snapshot being written
+        self.pending = []    # value ranges not sent yet
+        self.pending_cells = 0
+        self.changed_cells = 0    # cells of every range sent or pending
+        self.sent_ranges = 0
+        self.requests = 0
+
+    def _fall_back(self, reason):
+        """ Switches to the full upload: stops diffing and drops the ranges not sent yet. """
+
+        if self.mode == 'delta':
+            self.mode = 'full'
+            self.reason = reason
+        self.pending = []
+        self.pending_cells = 0
+        for state in self.sheets.values():
+            state['old'] = None
+            state['range'] = None
+
+    def _open(self, sheet, header):
+        buffer = tempfile.TemporaryFile()    # compressed rows of the new snapshot, kept on disk until it is saved
+        state = {'rows': 1, 'width': len(header), 'old': None, 'range': None, 'buffer': buffer, 'snapshot': gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)}
+        state['snapshot'].write((json.dumps(header, separators=(',', ':')) + '\n').encode('utf-8'))
+        self.sheets[sheet] = state
+
+        if self.mode == 'delta':
+            if sheet not in self.index['sheets']:
+                self._fall_back('new sheet')
+                return state
+            try:
+                old = _read_rows(self.storage.read_bytes(_snapshot_path(self.file_id, sheet)))
+            except FileNotFoundError:
+                self._fall_back('no snapshot of the published sheet')
+                return state
+            if next(old, None) != header:
+                self._fall_back('schema change')
+                return state
+            state['old'] = old
+        return state
+
+    def _close_range(self, sheet, state):
+        """ Queues the sheet's open range of changed rows. """
+
+        if state['range'] is None:
+            return
+        first_row, first_column, last_column, values = state['range']
+        state['range'] = None
+        self.pending.append({'range': _a1_range(sheet, first_row, first_row + len(values) - 1, first_column, last_column), 'values': values})
+        cells = len(values) * (last_column - first_column + 1)
+        self.pending_cells = self.pending_cells + cells
+        self.changed_cells = self.changed_cells + cells
+
+    def _flush(self, total_cells):
+        """ Sends the queued ranges, unless too many cells changed or the update fails, in which
+        case the workbook is uploaded in full instead. """
+
+        if self.mode != 'delta' or not self.pending:
+            return
+        if self.changed_cells > max_changed_fraction * total_cells:
+            self._fall_back('most cells changed')
+            return
+        try:
+            self.requests = self.requests + batch_update(self.file_id, self.pending)
+        except Exception as e:
+            self._fall_back('delta update failed: ' + repr(e))
+            return
+        self.sent_ranges = self.sent_ranges + len(self.pending)
+        self.pending = []
+        self.pending_cells = 0
+
+    def write(self, sheet, block):
+        """ Adds the next row block of the sheet (the header comes from its first block). """
+
+        grid = sheet_grid(block)
+        state = self.sheets.get(sheet)
+        if state is None:
+            state = self._open(sheet, grid[0])
+
+        for row in grid[1:]:
+            row_number = state['rows']
+            state['rows'] = row_number + 1
+            state['snapshot'].write((json.dumps(row, separators=(',', ':')) + '\n').encode('utf-8'))
+            if self.mode != 'delta':
+                continue
+
+            old_row = next(state['old'], None) if state['old'] is not None else None
+            if old_row is None:    # appended row
+                state['old'] = None
+                span = (0, len(row) - 1)
+            elif old_row == row:
+                self._close_range(sheet, state)
+                continue
+            else:
+                changed = [column for column in range(len(row)) if old_row[column] != row[column]]
+                span = (changed[0], changed[-1])
+
+            open_range = state['range']
+            if open_range is not None and open_range[1:3] == span and open_range[0] + len(open_range[3]) == row_number:
+                open_range[3].append(row[span[0]:span[1] + 1])    # consecutive rows with the same span share a range
+            else:
+                self._close_range(sheet, state)
+                state['range'] = (row_number, span[0], span[1], [row[span[0]:span[1] + 1]])
+            if len(state['range'][3]) * (span[1] - span[0] + 1) >= max_cells_per_request:
+                self._close_range(sheet, state)
+            if self.pending_cells >= max_cells_per_request:
+                self._flush(self.old_cells)
+
+    def close(self, sheet_dict):
+        """ Sends the remaining ranges (or does the full upload) and saves the snapshot of what
+        was published. Returns 'delta', 'full', or 'unchanged'. """
+
+        if self.mode == 'delta':
+            for sheet, state in self.sheets.items():
+                self._close_range(sheet, state)
+                if state['old'] is not None and next(state['old'], None) is not None:
+                    self._fall_back('rows removed')
+                    break
+        if self.mode == 'delta' and set(self.sheets) != set(self.index['sheets']):
+            self._fall_back('sheet removed')
+        total_cells = max(self.old_cells, sum(state['rows'] * state['width'] for state in self.sheets.values()))
+        self._flush(total_cells)
+
+        if self.mode == 'delta':
+            if not self.sent_ranges:
+                log_event('google sheet unchanged, skipped upload', file=self.title)
+                return 'unchanged'
+            log_event('updated google sheet ranges!', file=self.title, ranges=self.sent_ranges, cells=self.changed_cells, requests=self.requests, total_cells=total_cells)
+        elif self.file_id is None:
+            self.file_id = _full_upload(sheet_dict, self.local_file, None, self.folder_id, self.title)
+            _register_file(self.storage, self.title, self.file_id)
+            log_event('created google sheet!', file=self.title, file_id=self.file_id, bytes=os.path.getsize(self.local_file))
+        else:
+            _full_upload(sheet_dict, self.local_file, self.file_id, self.folder_id, self.title)
+            log_event('updated google drive file!', file=self.title, bytes=os.path.getsize(self.local_file), reason=self.reason)
+
+        index = {'sheets': {}}
+        for sheet, state in self.sheets.items():
+            state['snapshot'].close()
+            state['buffer'].seek(0)
+            self.storage.write_bytes(_snapshot_path(self.file_id, sheet), state['buffer'].read(), content_type='application/x-ndjson', content_encoding='gzip')
+            state['buffer'].close()
+            index['sheets'][sheet] = {'rows': state['rows'], 'width': state['width']}
+        self.storage.write_bytes(_snapshot_path(self.file_id), json.dumps(index).encode('utf-8'), content_type='application/json')
+        return self.mode
+
+
+def publish_workbook(sheet_dict, local_file, file_id, folder_id, title, storage=None):
+    """ Publishes the sheets (sheet name -> frame, or a function returning the sheet's row blocks
+    so a long history is never held as one frame) to the google sheet file_id, one block at a
+    time (see WorkbookPublisher). Returns 'delta', 'full', or 'unchanged'. """
+
+    publisher = WorkbookPublisher(local_file, file_id, folder_id, title, storage=storage)
+    for sheet, value in sheet_dict.items():
+        for block in _blocks(value):
+            publisher.write(sheet, block)
+    return publisher.close(sheet_dict)
@@ -0,0 +1,140 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: sliding_window.py
+# DESCRIPTION: Time based sliding window over a stream of (time, value)
+# samples, kept in fixed size ring buffers so memory is bounded however long
+# the stream runs. Every aggregate (mean, min, max, time spent outside a
+# band) is updated in O(1) per sample (amortized for min / max, which use
+# monotonic queues) instead of rescanning the window.
+###############################################################################
+import collections
+import numpy as np
+
+
+# FUNCTIONS
+class SlidingWindow:
+    """ The samples of the last window_seconds (at most capacity of them, the oldest are
+    dropped first) with running aggregates. Each sample also carries the time since the
+    previous one, during which the previous value is taken to have held, so the time spent
+    outside [band_low, band_high] is weighted by how long each value lasted. Typical use:
+
+        window = SlidingWindow(3600, 240, band_low=0.995, band_high=1.005)
+        window.push(time.time(), price)
+        window.minimum, window.maximum, window.mean, window.outside_fraction
+    """
+
+    def __init__(self, window_seconds, capacity, band_low=-np.inf, band_high=np.inf, max_step_seconds=None):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.band_low = band_low
+        self.band_high = band_high
+        self.max_step_seconds = max_step_seconds    # longer gaps (e.g. a feed outage) only count this long
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.seconds = np.zeros(capacity)    # time since the previous sample
+        self.outside_seconds = np.zeros(capacity)    # part of that time the previous value was outside the band
+        self.start = 0    # ring position of the oldest sample
+        self.size = 0
+        self.count = 0    # samples pushed so far, the sequence number of the next one
+        self.value_sum = 0.0
+        self.seconds_sum = 0.0
+        self.outside_sum = 0.0
+        self.min_queue = collections.deque()    # (sequence number, value), increasing values
+        self.max_queue = collections.deque()    # (sequence number, value), decreasing values
+
+    def outside(self, value):
+        return value < self.band_low or value > self.band_high
+
+    def _evict(self):
+        position = self.start
+        self.value_sum = self.value_sum - self.values[position]
+        self.seconds_sum = self.seconds_sum - self.seconds[position]
+        self.outside_sum = self.outside_sum - self.outside_seconds[position]
+        self.start = (self.start + 1) % self.capacity
+        self.size = self.size - 1
+
+        first = self.count - self.size    # sequence number of the oldest sample left
+        while self.min_queue and self.min_queue[0][0] < first:
+            self.min_queue.popleft()
+        while self.max_queue and self.max_queue[0][0] < first:
+            self.max_queue.popleft()
+
+    def push(self, time, value):
+        """ Adds a sample (times must not decrease) and drops the ones that left the window. """
+
+        seconds = 0.0
+        outside_seconds = 0.0
+        if self.size > 0:
+            seconds = time - self.last_time
+            if self.max_step_seconds is not None:
+                seconds = min(seconds, self.max_step_seconds)
+            outside_seconds = seconds if self.outside(self.last) else 0.0
+
+        while self.size > 0 and (self.size == self.capacity or self.times[self.start] <= time - self.window_seconds):
+            self._evict()
+
+        position = (self.start + self.size) % self.capacity
+        self.times[position] = time
+        self.values[position] = value
+        self.seconds[position] = seconds
+        self.outside_seconds[position] = outside_seconds
+        self.size = self.size + 1
+        self.value_sum = self.value_sum + value
+        self.seconds_sum = self.seconds_sum + seconds
+        self.outside_sum = self.outside_sum + outside_seconds
+
+        while self.min_queue and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((self.count, value))
+        while self.max_queue and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((self.count, value))
+        self.count = self.count + 1
+        if self.count % (16 * self.capacity) == 0:
+            self._resum()
+
+    def _resum(self):
+        """ Recomputes the running sums from the ring, so float error from the subtractions
+        never builds up over a long stream (O(capacity), amortized O(1) per sample). """
+
+        positions = (self.start + np.arange(self.size)) % self.capacity
+        self.value_sum = float(self.values[positions].sum())
+        self.seconds_sum = float(self.seconds[positions].sum())
+        self.outside_sum = float(self.outside_seconds[positions].sum())
+
+    @property
+    def last(self):
+        return self.values[(self.start + self.size - 1) % self.capacity] if self.size else np.nan
+
+    @property
+    def last_time(self):
+        return self.times[(self.start + self.size - 1) % self.capacity] if self.size else np.nan
+
+    @property
+    def mean(self):
+        return self.value_sum / self.size if self.size else np.nan
+
+    @property
+    def minimum(self):
+        return self.min_queue[0][1] if self.min_queue else np.nan
+
+    @property
+    def maximum(self):
+        return self.max_queue[0][1] if self.max_queue else np.nan
+
+    @property
+    def covered_seconds(self):
+        """ Time between the oldest and newest sample in the window. """
+        return max(self.seconds_sum - (self.seconds[self.start] if self.size else 0.0), 0.0)
+
+    @property
+    def outside_seconds_total(self):
+        """ Time spent outside the band between the oldest and newest sample in the window. """
+        return max(self.outside_sum - (self.outside_seconds[self.start] if self.size else 0.0), 0.0)
+
+    @property
+    def outside_fraction(self):
+        covered = self.covered_seconds
+        return self.outside_seconds_total / covered if covered > 0 else (1.0 if self.size and self.outside(self.last) else 0.0)
@@ -0,0 +1,44 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: snapshot.py
+# DESCRIPTION: Reads the current market snapshot (price, market cap, volume,
+# and ath of every coin, written by the coingecko_markets_snapshot collector
+# in data/coingecko from one paginated bulk /coins/markets request). Pages
+# that only need each coin's latest value use it to refresh intraday without
+# reading the full histories.
+###############################################################################
+import datetime
+import pandas as pd
+
+from utils.storage import get_storage, read_csv
+
+
+# CONFIG
+snapshot_path = 'data/coin_snapshots/coingecko_markets_snapshot.csv'
+max_age_hours = 6    # older snapshot rows are ignored, the daily histories are used instead
+
+
+# FUNCTIONS
+def read_snapshot(storage=None, now=None):
+    """ Returns the snapshot rows updated within max_age_hours, indexed by coin id, with a
+    'utc' timestamp column. Empty if there is no snapshot yet. """
+
+    try:
+        df = read_csv(snapshot_path, storage=storage if storage is not None else get_storage(), index_col='coin')
+    except FileNotFoundError:
+        return pd.DataFrame(columns=['utc', 'price(usd)', 'market_cap(usd)', 'volume(usd)', 'ath(usd)'])
+    df['utc'] = pd.to_datetime(df['utc'])
+    now = now or datetime.datetime.utcnow()
+    return df[df['utc'] >= now - datetime.timedelta(hours=max_age_hours)]
+
+
+def latest_after(snapshot_df, coin, date):
+    """ Returns the coin's snapshot row if it is newer than the input date (the last daily
+    row of its history), otherwise None. """
+
+    if coin not in snapshot_df.index:
+        return None
+    row = snapshot_df.loc[coin]
+    return row if row['utc'] > pd.Timestamp(date) else None
@@ -0,0 +1,596 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: storage.py
+# DESCRIPTION: Storage backends for reading and writing dashboard files from
+# the google cloud bucket, a local directory laid out the same way, or memory
+# (for dev, testing, and offline profiling). Any backend can be wrapped in a
+# write-through local mirror cache that keeps recently used files on local
+# disk and revalidates them by generation, so warm instances and dev machines
+# skip downloads.
+#
+# Environment variables (read by get_storage()):
+#   EOC_STORAGE_BACKEND     gcs (default), local, or memory
+#   EOC_LOCAL_STORAGE_ROOT  directory used by the local backend
+#   EOC_STORAGE_MIRROR_DIR  enables the local mirror cache in this directory
+#   EOC_OUTPUT_ENCODING     gzip (default) or identity, for csvs written with
+#                           write_csv / encode_csv
+#   EOC_OUTPUT_VARIANTS     extra copies written next to each write_csv output
+#                           for internal consumers: zstd, br, json (comma list)
+###############################################################################
+import io
+import os
+import gzip
+import json
+import time
+import uuid
+import fcntl
+import pickle
+import tempfile
+import threading
+import contextlib
+import pandas as pd
+
+
+# CONFIG
+bucket_name = 'eoc-dashboard-bucket'
+default_local_root = os.path.join(os.path.expanduser('~'), 'eoc-dashboard-bucket')
+mirror_max_bytes = 512 * 1024 * 1024    # local mirror is trimmed (least recently used first) above this size
+output_encoding = os.environ.get('EOC_OUTPUT_ENCODING', 'gzip')    # stored with Content-Encoding so browsers decompress transparently
+output_variants = [variant for variant in os.environ.get('EOC_OUTPUT_VARIANTS', '').split(',') if variant]
+compression_level = 6
+encode_buffer_bytes = 256 * 1024    # csv text is compressed in chunks of this size as it is serialized
+variant_suffixes = {'zstd': ('.zst', 'application/zstd'), 'br': ('.br', 'application/x-brotli')}
+
+_storage = None    # process wide backend, so caches survive between warm invocations
+
+
+class GenerationMismatch(Exception):
+    """ Raised when a conditional write finds the file has changed since it was read. """
+
+
+# BACKENDS
+class LocalStorage:
+    """ Reads and writes files in a local directory that mirrors the bucket layout
+    (e.g. <root>/pages/eoc-dashboard-correlation-matrix-30day.csv). """
+
+    def __init__(self, root=default_local_root):
+        self.root = root
+        self.identity = 'local:' + os.path.abspath(root)    # tells caches built from different backends apart
+
+    def _full_path(self, path):
+        return os.path.join(self.root, path)
+
+    def read_bytes(self, path):
+        """ Returns the contents of the file. Raises FileNotFoundError if missing. """
+        with open(self._full_path(path), 'rb') as f:
+            return f.read()
+
+    def read_with_generation(self, path):
+        """ Returns (contents, generation), or (None, None) if the file does not exist. """
+        with self._lock(path):
+            try:
+                return self.read_bytes(path), self.generation(path)
+            except FileNotFoundError:
+                return None, None
+
+    def write_bytes(self, path, data, content_type=None, if_generation_match=None, content_encoding=None):
+        """ Writes the input bytes to the file, creating directories as needed, and returns
+        the new generation. If if_generation_match is given the write only happens when the
+        file is still at that generation ('0' = must not exist yet), otherwise
+        GenerationMismatch is raised. The data is stored as is whatever its content_encoding
+        (readers detect compressed files, see decode_bytes()). """
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with self._lock(path):
+            if if_generation_match is not None and (self.generation(path) or '0') != str(if_generation_match):
+                raise GenerationMismatch(path)
+            temp_path = full_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            self._write_sequence(path, self._sequence(path) + 1)
+            os.replace(temp_path, full_path)    # atomic so readers never see a partial file
+            return self.generation(path)
+
+    def _sequence(self, path):
+        """ Returns how many times write_bytes has written the file (kept in <file>.gen). """
+        try:
+            with open(self._full_path(path) + '.gen') as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_sequence(self, path, sequence):
+        temp_path = self._full_path(path) + '.gen.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(sequence))
+        os.replace(temp_path, self._full_path(path) + '.gen')
+
+    @contextlib.contextmanager
+    def _lock(self, path):
+        """ Cross-process lock for read-modify-write of a single file. """
+        lock_path = self._full_path(path) + '.lock'
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def generation(self, path):
+        """ Returns a token that changes every time the file is rewritten, or None
+        if the file does not exist. Stands in for the gcs blob generation: the count of
+        writes through write_bytes (so two writes within one filesystem timestamp tick
+        still differ) plus the modification time (for files changed outside it). """
+        try:
+            mtime_ns = os.stat(self._full_path(path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return '{}-{}'.format(self._sequence(path), mtime_ns)
+
+    def list_generations(self, prefix):
+        """ Returns a dict of path -> generation for every file under the input prefix. """
+        generations = {}
+        directory = self._full_path(os.path.dirname(prefix))
+        for dir_path, dir_names, file_names in os.walk(directory):
+            for file_name in file_names:
+                if file_name.endswith(('.tmp', '.lock', '.gen')):
+                    continue
+                path = os.path.relpath(os.path.join(dir_path, file_name), self.root).replace(os.sep, '/')
+                if path.startswith(prefix):
+                    generations[path] = self.generation(path)
+        return generations
+
+
+class GCSStorage:
+    """ Reads and writes blobs in the google cloud storage bucket. """
+
+    def __init__(self, name=bucket_name):
+        from google.cloud import storage    # only needed when actually talking to gcs
+        self.bucket = storage.Client().bucket(name)
+        self.identity = 'gcs:' + name
+
+    def read_bytes(self, path):
+        """ Returns the contents of the blob. Raises FileNotFoundError if missing. """
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.bucket.blob(path).download_as_bytes()
+        except NotFound:
+            raise FileNotFoundError(path)
+
+    def read_with_generation(self, path):
+        """ Returns (contents, generation), or (None, None) if the blob does not exist. """
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        blob = self.bucket.get_blob(path)
+        if blob is None:
+            return None, None
+        try:
+            return blob.download_as_bytes(if_generation_match=blob.generation), str(blob.generation)
+        except (NotFound, PreconditionFailed):    # changed in between, caller retries
+            raise GenerationMismatch(path)
+
+    def write_bytes(self, path, data, content_type=None, if_generation_match=None, content_encoding=None):
+        """ Uploads the input bytes to the blob and returns the new generation. If
+        if_generation_match is given the upload only happens when the blob is still at that
+        generation ('0' = must not exist yet), otherwise GenerationMismatch is raised. The
+        content_encoding (e.g. 'gzip') is set as the blob's Content-Encoding. """
+        from google.api_core.exceptions import PreconditionFailed
+        kwargs = {} if if_generation_match is None else {'if_generation_match': int(if_generation_match)}
+        blob = self.bucket.blob(path)
+        blob.content_encoding = content_encoding    # gzip blobs are served decompressed to clients that don't accept gzip
+        try:
+            blob.upload_from_string(data, content_type=content_type, **kwargs)
+        except PreconditionFailed:
+            raise GenerationMismatch(path)
+        return str(blob.generation)
+
+    def generation(self, path):
+        """ Returns the blob generation (as a string), or None if the blob does not exist. """
+        blob = self.bucket.get_blob(path)
+        return None if blob is None else str(blob.generation)
+
+    def list_generations(self, prefix):
+        """ Returns a dict of path -> generation for every blob under the input prefix
+        (one list call instead of a metadata request per blob). """
+        return {blob.name: str(blob.generation) for blob in self.bucket.client.list_blobs(self.bucket, prefix=prefix)}
+
+
+class MemoryStorage:
+    """ Keeps files in a dict. Useful for tests and for profiling the pages without any
+    io (seed it with write_bytes first). """
+
+    def __init__(self):
+        self.files = {}    # path -> (contents, generation)
+        self.counter = 0
+        self.identity = 'memory:' + uuid.uuid4().hex    # generations restart at 1 in every instance
+        self.lock = threading.Lock()
+
+    def read_bytes(self, path):
+        """ Returns the contents of the file. Raises FileNotFoundError if missing. """
+        try:
+            return self.files[path][0]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+    def read_with_generation(self, path):
+        """ Returns (contents, generation), or (None, None) if the file does not exist. """
+        with self.lock:
+            return self.files.get(path, (None, None))
+
+    def write_bytes(self, path, data, content_type=None, if_generation_match=None, content_encoding=None):
+        """ Stores the input bytes and returns the new generation (see LocalStorage). """
+        with self.lock:
+            if if_generation_match is not None and (self.generation(path) or '0') != str(if_generation_match):
+                raise GenerationMismatch(path)
+            self.counter = self.counter + 1
+            self.files[path] = (bytes(data), str(self.counter))
+            return str(self.counter)
+
+    def generation(self, path):
+        """ Returns the generation of the file, or None if it does not exist. """
+        entry = self.files.get(path)
+        return None if entry is None else entry[1]
+
+    def list_generations(self, prefix):
+        """ Returns a dict of path -> generation for every file under the input prefix. """
+        return {path: entry[1] for path, entry in list(self.files.items()) if path.startswith(prefix)}
+
+
+class MirrorCache:
+    """ Write-through local disk mirror in front of another backend. Reads are served from
+    the mirror when its copy is still at the backend's current generation (one metadata
+    request instead of a download), writes go to the backend and then the mirror. """
+
+    def __init__(self, backend, directory, max_bytes=mirror_max_bytes):
+        self.backend = backend
+        self.identity = backend.identity
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)    # path -> {'generation', 'size', 'used'}
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+
+    def _mirror_path(self, path):
+        return os.path.join(self.directory, 'files', path)
+
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def _store(self, path, data, generation):
+        mirror_path = self._mirror_path(path)
+        os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+        with open(mirror_path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(mirror_path + '.tmp', mirror_path)
+        with self.lock:
+            self.index[path] = {'generation': generation, 'size': len(data), 'used': time.time()}
+            self._trim()
+            self._save_index()
+
+    def _trim(self):
+        """ Drops least recently used files until the mirror fits in max_bytes. """
+        total = sum(entry['size'] for entry in self.index.values())
+        for path in sorted(self.index, key=lambda p: self.index[p]['used']):
+            if total <= self.max_bytes:
+                break
+            total = total - self.index[path]['size']
+            del self.index[path]
+            try:
+                os.remove(self._mirror_path(path))
+            except FileNotFoundError:
+                pass
+
+    def read_bytes(self, path):
+        """ Returns the contents of the file, from the mirror if it is current. """
+        generation = self.backend.generation(path)
+        if generation is None:
+            raise FileNotFoundError(path)
+        entry = self.index.get(path)
+        if entry is not None and entry['generation'] == generation:
+            try:
+                with open(self._mirror_path(path), 'rb') as f:
+                    data = f.read()
+                entry['used'] = time.time()
+                return data
+            except FileNotFoundError:
+                pass    # evicted by another process, fall through to a download
+        data, generation = self.backend.read_with_generation(path)
+        if data is None:
+            raise FileNotFoundError(path)
+        self._store(path, data, generation)
+        return data
+
+    def read_with_generation(self, path):
+        return self.backend.read_with_generation(path)    # used for conditional updates, always fresh
+
+    def write_bytes(self, path, data, content_type=None, if_generation_match=None, content_encoding=None):
+        """ Writes through to the backend, then keeps a copy in the mirror. """
+        generation = self.backend.write_bytes(path, data, content_type=content_type, if_generation_match=if_generation_match, content_encoding=content_encoding)
+        if generation is not None:
+            self._store(path, data, generation)
+        return generation
+
+    def generation(self, path):
+        return self.backend.generation(path)
+
+    def list_generations(self, prefix):
+        return self.backend.list_generations(prefix)
+
+
+def get_storage():
+    """ Returns the process wide storage backend selected by the EOC_STORAGE_BACKEND
+    environment variable ('gcs' by default, 'local' rooted at EOC_LOCAL_STORAGE_ROOT, or
+    'memory'), wrapped in a MirrorCache when EOC_STORAGE_MIRROR_DIR is set. """
+
+    global _storage
+    if _storage is not None:
+        return _storage
+
+    backend = os.environ.get('EOC_STORAGE_BACKEND', 'gcs')
+    if backend == 'local':
+        _storage = LocalStorage(os.environ.get('EOC_LOCAL_STORAGE_ROOT', default_local_root))
+    elif backend == 'memory':
+        _storage = MemoryStorage()
+    elif backend == 'gcs':
+        _storage = GCSStorage(os.environ.get('EOC_BUCKET_NAME', bucket_name))
+    else:
+        raise ValueError('Unknown storage backend: ' + backend)
+
+    if os.environ.get('EOC_STORAGE_MIRROR_DIR'):
+        _storage = MirrorCache(_storage, os.environ['EOC_STORAGE_MIRROR_DIR'])
+    return _storage
+
+
+def set_storage(storage):
+    """ Overrides the process wide backend (e.g. with a MemoryStorage in tests). """
+    global _storage
+    _storage = storage
+
+
+# ENCODINGS
+class _BrotliWriter(io.RawIOBase):
+    """ Writable stream that brotli compresses into the raw stream as data arrives. """
+
+    def __init__(self, raw):
+        import brotli    # optional, only needed for br variants
+        self.raw = raw
+        self.compressor = brotli.Compressor(quality=compression_level)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.raw.write(self.compressor.process(bytes(data)))
+        return len(data)
+
+    def finish(self):
+        self.raw.write(self.compressor.finish())
+
+
+class _TeeWriter(io.RawIOBase):
+    """ Writable stream that hands every chunk to all of the input streams, so one pass of
+    serialization feeds every encoding. """
+
+    def __init__(self, streams):
+        self.streams = streams
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        for stream in self.streams:
+            stream.write(data)
+        return len(data)
+
+
+def _encoder(encoding, raw):
+    """ Returns (stream, finish) where stream compresses what is written to it into raw with
+    the input encoding and finish() flushes the end of the compressed stream. """
+
+    if encoding in (None, 'identity'):
+        return raw, lambda: None
+    if encoding == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compression_level, mtime=0)    # fixed mtime so equal content gives equal bytes
+        return stream, stream.close
+    if encoding == 'zstd':
+        import zstandard    # optional, only needed for zstd variants
+        stream = zstandard.ZstdCompressor(level=compression_level).stream_writer(raw, closefd=False, write_return_read=True)
+        return stream, stream.close
+    if encoding == 'br':
+        stream = _BrotliWriter(raw)
+        return stream, stream.finish
+    raise ValueError('Unknown encoding: ' + encoding)
+
+
+def encode_csv(df, encodings=None, **kwargs):
+    """ Serializes a data frame as csv (kwargs go to df.to_csv) once, compressing it with
+    every input encoding while it is written (no second pass over the csv text). Returns a
+    dict of encoding -> bytes, or just the bytes when encodings is a single string
+    (default: EOC_OUTPUT_ENCODING). """
+
+    single = encodings is None or isinstance(encodings, str)
+    encodings = [encodings or output_encoding] if single else list(encodings)
+    buffers = {encoding: io.BytesIO() for encoding in encodings}
+    encoders = [_encoder(encoding, buffers[encoding]) for encoding in encodings]
+
+    text = io.TextIOWrapper(io.BufferedWriter(_TeeWriter([stream for stream, finish in encoders]), buffer_size=encode_buffer_bytes), encoding='utf-8', newline='')
+    df.to_csv(text, **kwargs)
+    text.flush()
+    for stream, finish in encoders:
+        finish()
+
+    results = {encoding: buffers[encoding].getvalue() for encoding in encodings}
+    return results[encodings[0]] if single else results
+
+
+def content_encoding_header(encoding=None):
+    """ Returns the Content-Encoding to store with data encoded as the input encoding
+    (default: EOC_OUTPUT_ENCODING), or None for uncompressed data. """
+    encoding = encoding or output_encoding
+    return None if encoding == 'identity' else encoding
+
+
+def decode_bytes(data, path=''):
+    """ Returns the decompressed contents of a stored file (gzip and zstd are detected from
+    their magic bytes, brotli from the .br suffix). Uncompressed data is returned as is. """
+
+    if data[:2] == b'\x1f\x8b':
+        return gzip.decompress(data)
+    if data[:4] == b'\x28\xb5\x2f\xfd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    if path.endswith('.br'):
+        import brotli
+        return brotli.decompress(data)
+    return data
+
+
+# HELPERS
+def read_csv(path, storage=None, **kwargs):
+    """ Reads a csv from the storage backend into a data frame (kwargs go to pd.read_csv).
+    Compressed files are decompressed transparently. """
+    storage = storage if storage is not None else get_storage()
+    return pd.read_csv(io.BytesIO(decode_bytes(storage.read_bytes(path), path)), **kwargs)
+
+
+def write_csv(df, path, storage=None, content_encoding=None, variants=None, **kwargs):
+    """ Writes a data frame to the storage backend as csv (kwargs go to df.to_csv), encoded
+    with content_encoding (default: EOC_OUTPUT_ENCODING) and stored with a matching
+    Content-Encoding. Each of the variants (default: EOC_OUTPUT_VARIANTS) is written next to
+    it: zstd -> <path>.zst, br -> <path>.br, json -> compact split orient <path>.json. Returns
+    the number of bytes written for the main file. """
+
+    storage = storage if storage is not None else get_storage()
+    content_encoding = content_encoding or output_encoding
+    variants = output_variants if variants is None else variants
+    csv_encodings = [content_encoding] + [variant for variant in variants if variant in variant_suffixes]
+    encoded = encode_csv(df, csv_encodings, **kwargs)
+
+    data = encoded[content_encoding]
+    storage.write_bytes(path, data, content_type='text/csv', content_encoding=content_encoding_header(content_encoding))
+    for variant in variants:
+        if variant in variant_suffixes:
+            suffix, content_type = variant_suffixes[variant]
+            storage.write_bytes(path + suffix, encoded[variant], content_type=content_type)
+        elif variant == 'json':
+            json_data = df.to_json(orient='split', index=kwargs.get('index', True)).encode('utf-8')
+            if content_encoding == 'gzip':
+                json_data = gzip.compress(json_data, compresslevel=compression_level, mtime=0)
+            storage.write_bytes(path.rsplit('.', 1)[0] + '.json', json_data, content_type='application/json', content_encoding=content_encoding_header(content_encoding))
+        else:
+            raise ValueError('Unknown output variant: ' + variant)
+    return len(data)
+
+
+class ChunkedCsvWriter:
+    """ Writes a csv to the storage backend one data frame block at a time, so the full frame
+    never has to exist in memory (only its compressed bytes do). Blocks are serialized and
+    compressed as they are written, the header comes from the first block. Encodings and csv
+    variants (zstd, br) work as in write_csv. The json variant needs the whole frame and is
+    not written. Typical use:
+
+        with ChunkedCsvWriter('pages/file.csv', index=True) as writer:
+            for block in blocks:
+                writer.write(block)
+    """
+
+    def __init__(self, path, storage=None, content_encoding=None, variants=None, **kwargs):
+        self.path = path
+        self.storage = storage if storage is not None else get_storage()
+        self.content_encoding = content_encoding or output_encoding
+        variants = output_variants if variants is None else variants
+        self.encodings = [self.content_encoding] + [variant for variant in variants if variant in variant_suffixes]
+        self.kwargs = kwargs
+        self.header = kwargs.pop('header', True)
+        self.rows = 0
+        self.started = False
+        self.n_bytes = None
+        self.buffers = {encoding: io.BytesIO() for encoding in self.encodings}
+        self.encoders = [_encoder(encoding, self.buffers[encoding]) for encoding in self.encodings]
+        self.text = io.TextIOWrapper(io.BufferedWriter(_TeeWriter([stream for stream, finish in self.encoders]), buffer_size=encode_buffer_bytes), encoding='utf-8', newline='')
+
+    def write(self, df):
+        """ Appends the rows of the block (header only for the first block). """
+        df.to_csv(self.text, header=self.header if not self.started else False, **self.kwargs)
+        self.started = True
+        self.rows = self.rows + len(df)
+
+    def close(self):
+        """ Finishes the encodings and writes the file (and its variants). Returns the number of
+        bytes written for the main file. """
+
+        self.text.flush()
+        for stream, finish in self.encoders:
+            finish()
+        data = self.buffers[self.content_encoding].getvalue()
+        self.storage.write_bytes(self.path, data, content_type='text/csv', content_encoding=content_encoding_header(self.content_encoding))
+        for encoding in self.encodings[1:]:
+            suffix, content_type = variant_suffixes[encoding]
+            self.storage.write_bytes(self.path + suffix, self.buffers[encoding].getvalue(), content_type=content_type)
+        self.n_bytes = len(data)
+        return self.n_bytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()    # never publish a partial file
+        return False
+
+
+class BlockSpool:
+    """ Keeps data frame blocks in local temporary files (one per key) so a consumer that needs
+    a second pass over them (e.g. ChunkedDownsampler, a full sheet upload) can read them back
+    in order, instead of the blocks being held in memory or computed again. Typical use:
+
+        with BlockSpool() as spool:
+            for block in blocks:
+                spool.write('sheet', block)
+            for block in spool.replay('sheet'):
+                ...
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, key, df):
+        """ Appends the block to the key's file. """
+
+        if key not in self.files:
+            self.files[key] = tempfile.TemporaryFile()
+        pickle.dump(df, self.files[key], protocol=pickle.HIGHEST_PROTOCOL)
+
+    def replay(self, key):
+        """ Yields the blocks written to the key, in order, one at a time. """
+
+        spool_file = self.files.get(key)
+        if spool_file is None:
+            return
+        spool_file.seek(0)
+        while True:
+            try:
+                yield pickle.load(spool_file)
+            except EOFError:
+                return
+
+    def close(self):
+        for spool_file in self.files.values():
+            spool_file.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,133 @@
+###############################################################################
+# PROJECT: EOC-Dashboard-Engine
+# AUTHOR: Matt Hartigan
+# DATE: 19-October-2026
+# FILENAME: streaming_json.py
+# DESCRIPTION: Streaming decoder for api payloads made of [timestamp, value]
+# pair arrays, e.g. the coingecko market_chart response:
+#   {"prices": [[ts, v], ...], "market_caps": [[ts, v], ...], "total_volumes": [[ts, v], ...]}
+# Pairs are parsed chunk by chunk straight into preallocated numpy arrays, so
+# the full json tree (and the per-series data frames built from it) never has
+# to exist in memory.
+###############################################################################
+import re
+import numpy as np
+import pandas as pd
+
+
+# CONFIG
+default_capacity = 4096    # initial pairs per series, arrays double when full
+max_key_tail = 256    # bytes kept between chunks while looking for the next key
+
+KEY_RE = re.compile(rb'"([^"\\]+)"\s*:\s*\[')    # start of a "key": [ ... ] array
+END_RE = re.compile(rb'\s*,?\s*\]')    # end of the current array
+PAIR_RUN_RE = re.compile(rb'(?:\s*,?\s*\[[^\[\]]*\])+')    # run of complete [ts, value] pairs
+PAIR_RE = re.compile(rb'\[\s*([^,\s\]]+)\s*,\s*([^,\s\]]+)\s*\]')
+
+
+class _SeriesBuffer:
+    """ Growable pair of typed arrays (int64 timestamps, float64 values). """
+
+    def __init__(self, capacity):
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def extend(self, run):
+        """ Parses a run of complete pairs (bytes) and appends them. """
+
+        pairs = np.array(PAIR_RE.findall(run))    # (n, 2) array of byte strings, bounded by the chunk size
+        if len(pairs) == 0:
+            return
+        values = pairs[:, 1]
+        values[values == b'null'] = b'nan'    # coingecko uses null for missing market caps
+        n = len(pairs)
+
+        if self.size + n > len(self.ts):    # grow
+            capacity = max(2 * len(self.ts), self.size + n)
+            self.ts = np.resize(self.ts, capacity)
+            self.values = np.resize(self.values, capacity)
+
+        self.ts[self.size:self.size + n] = pairs[:, 0].astype(np.float64)    # timestamps can arrive as 1.6e12
+        self.values[self.size:self.size + n] = values.astype(np.float64)
+        self.size += n
+
+    def arrays(self):
+        return self.ts[:self.size], self.values[:self.size]
+
+
+# FUNCTIONS
+def decode_pair_arrays(chunks, keys=('prices', 'market_caps', 'total_volumes'), capacity=default_capacity):
+    """ Decodes an iterable of byte chunks (e.g. response.iter_content()) holding a json object
+    of [timestamp, value] pair arrays. Returns a dict of key -> (int64 timestamps, float64 values)
+    for the requested keys. Raises ValueError if none of the keys are in the payload (e.g. an
+    api error message). """
+
+    buffers = {key: _SeriesBuffer(capacity) for key in keys}
+    found = set()
+    current = None    # key of the array currently being parsed (None = between arrays)
+    head = b''    # start of the payload, kept for error messages
+    buf = b''
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if len(head) < 200:
+            head = (head + chunk)[:200]
+        buf = buf + chunk
+        pos = 0
+
+        while True:
+            if current is None:
+                m = KEY_RE.search(buf, pos)
+                if m is None:
+                    buf = buf[max(pos, len(buf) - max_key_tail):]    # key may be split across chunks
+                    break
+                current = m.group(1).decode('utf-8')
+                found.add(current)
+                pos = m.end()
+            else:
+                m = END_RE.match(buf, pos)
+                if m is not None:
+                    current = None
+                    pos = m.end()
+                    continue
+                m = PAIR_RUN_RE.match(buf, pos)
+                if m is None:
+                    buf = buf[pos:]    # partial pair, wait for the next chunk
+                    break
+                if current in buffers:
+                    buffers[current].extend(m.group(0))
+                pos = m.end()
+
+    if not found.intersection(keys):
+        raise ValueError('Payload has none of the expected keys {}: {}'.format(keys, head.decode('utf-8', 'replace')))
+
+    return {key: buffers[key].arrays() for key in keys}
+
+
+def join_pair_arrays(arrays, columns):
+    """ Joins the decoded series into a single frame with a 'unix' column plus one column
+    per series (named by the input columns dict of key -> column name). Series are joined
+    by position when their timestamps match (the normal case), otherwise on the timestamps
+    they all share. """
+
+    keys = list(columns.keys())
+    ts = arrays[keys[0]][0]
+
+    if all(np.array_equal(ts, arrays[key][0]) for key in keys[1:]):    # no copies needed
+        data = {'unix': ts}
+        for key in keys:
+            data[columns[key]] = arrays[key][1]
+    else:
+        common = ts
+        for key in keys[1:]:
+            common = np.intersect1d(common, arrays[key][0])
+        data = {'unix': common}
+        for key in keys:
+            key_ts, key_values = arrays[key]
+            first = np.unique(key_ts, return_index=True)[1]    # keep the first value for duplicated timestamps
+            idx = first[np.searchsorted(key_ts[first], common)]
+            data[columns[key]] = key_values[idx]
+
+    return pd.DataFrame(data, copy=False)